@@ -0,0 +1,298 @@
+"""Assignment turnaround: how long tasks wait to be started and completed.
+
+    python analytics.py refresh               # fold new transitions into the rollups
+    python analytics.py rebuild               # recompute the rollups from every transition
+    python analytics.py report --by category  # percentiles per category
+
+staff_update_assignment_status appends every status change to
+assignment_transitions (migrations 0012, 0013), with the assignment's task
+type and creation time and the staff member's role and category, so the
+history needs neither table later. refresh() folds the transitions
+past the watermark in batches, each in one short write transaction:
+
+1. The batch is extracted once into a temp table: one row per first start
+   or first completion and dimension, with the duration since the task was
+   created and its histogram bucket.
+2. Bucket counts are added to turnaround_rollups with one GROUP BY upsert.
+3. count / mean / p50 / p90 / p99 are recomputed with window functions for
+   the groups the batch touched and stored in turnaround_stats.
+
+All of it runs in SQLite over the whole batch, not row by row in Python.
+Buckets are a quarter power of two wide, so a percentile (the bucket's
+geometric midpoint) is within about 9%. The admin dashboard only reads
+turnaround_stats. The app refreshes every ANALYTICS_INTERVAL_SECONDS in
+the background. Needs SQLite's math functions (log2, pow), which builds
+have enabled by default since 3.35.
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+import cache
+import database
+import migrate
+
+APP_DIR = Path(__file__).parent
+
+DEFAULTS = {
+    "ANALYTICS_INTERVAL_SECONDS": 60.0,    # None: only `python analytics.py refresh`
+    "ANALYTICS_BATCH": 1000,               # transitions per write transaction
+}
+
+BUCKETS_PER_DOUBLING = 4
+DIMENSIONS = ("all", "role", "category", "task_type", "staff")
+MIN_STAFF_COUNT = 5    # completions before a staff member is ranked
+TOP = 10
+
+log = logging.getLogger(__name__)
+
+BATCH_TABLE = """
+    CREATE TEMP TABLE IF NOT EXISTS turnaround_batch (
+      dimension TEXT, key TEXT, metric TEXT, bucket INTEGER, seconds INTEGER
+    )
+"""
+
+# Only the first time an assignment reaches a status counts (tasks can be
+# reopened).
+EXTRACT = f"""
+    INSERT INTO temp.turnaround_batch (dimension, key, metric, bucket, seconds)
+    SELECT d.dimension,
+           CASE d.dimension WHEN 'all' THEN '' WHEN 'role' THEN x.role WHEN 'category' THEN x.category
+                            WHEN 'task_type' THEN x.task_type ELSE x.staff_id END,
+           x.metric, CAST(log2(MAX(x.seconds, 1)) * {BUCKETS_PER_DOUBLING} AS INTEGER), x.seconds
+    FROM (
+        SELECT CASE t.to_status WHEN 'Completed' THEN 'complete' ELSE 'start' END AS metric,
+               MAX(unixepoch(t.created_at) - unixepoch(t.assignment_created_at), 0) AS seconds,
+               COALESCE(t.changed_by_staff_id, '') AS staff_id, COALESCE(t.staff_role, '') AS role,
+               COALESCE(NULLIF(t.staff_category, ''), 'General') AS category, t.task_type
+        FROM assignment_transitions t
+        WHERE t.id > ? AND t.id <= ? AND t.to_status IN ('In Progress', 'Completed')
+          AND t.assignment_created_at IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM assignment_transitions e
+                          WHERE e.assignment_id = t.assignment_id AND e.to_status = t.to_status AND e.id < t.id)
+    ) x
+    CROSS JOIN ({" UNION ALL ".join(f"SELECT '{d}' AS dimension" for d in DIMENSIONS)}) d
+"""
+
+FOLD = """
+    INSERT INTO turnaround_rollups (dimension, key, metric, bucket, count, seconds)
+    SELECT dimension, key, metric, bucket, COUNT(*), SUM(seconds) FROM temp.turnaround_batch WHERE true
+    GROUP BY dimension, key, metric, bucket
+    ON CONFLICT (dimension, key, metric, bucket) DO UPDATE
+    SET count = count + excluded.count, seconds = seconds + excluded.seconds
+"""
+
+def _percentile(p):
+    return (f"pow(2, (MIN(CASE WHEN cumulative >= {p} * total THEN bucket END) + 0.5) "
+            f"/ {BUCKETS_PER_DOUBLING}.0)")
+
+STATS = f"""
+    INSERT INTO turnaround_stats (dimension, key, metric, count, mean_seconds, p50_seconds, p90_seconds, p99_seconds)
+    SELECT dimension, key, metric, MAX(total), MAX(seconds_total) * 1.0 / MAX(total),
+           {_percentile(0.5)}, {_percentile(0.9)}, {_percentile(0.99)}
+    FROM (
+        SELECT r.dimension, r.key, r.metric, r.bucket,
+               SUM(r.count) OVER (PARTITION BY r.dimension, r.key, r.metric ORDER BY r.bucket) AS cumulative,
+               SUM(r.count) OVER (PARTITION BY r.dimension, r.key, r.metric) AS total,
+               SUM(r.seconds) OVER (PARTITION BY r.dimension, r.key, r.metric) AS seconds_total
+        FROM (SELECT DISTINCT dimension, key, metric FROM temp.turnaround_batch) g
+        JOIN turnaround_rollups r ON r.dimension = g.dimension AND r.key = g.key AND r.metric = g.metric
+    ) WHERE true
+    GROUP BY dimension, key, metric
+    ON CONFLICT (dimension, key, metric) DO UPDATE
+    SET count = excluded.count, mean_seconds = excluded.mean_seconds, p50_seconds = excluded.p50_seconds,
+        p90_seconds = excluded.p90_seconds, p99_seconds = excluded.p99_seconds
+"""
+
+def record(conn, assignment_id, staff_id, from_status, to_status):
+    """Append a status change; call inside the transaction that makes it. Returns the transition id."""
+    if from_status != to_status:
+        return conn.execute("""
+            INSERT INTO assignment_transitions (assignment_id, changed_by_staff_id, from_status, to_status,
+                                                task_type, assignment_created_at, staff_role, staff_category)
+            SELECT a.id, ?, ?, ?, a.task_type, a.created_at, s.role, s.category
+            FROM assignments a LEFT JOIN staff s ON s.id = ?
+            WHERE a.id = ?
+        """, (staff_id, from_status, to_status, staff_id, assignment_id)).lastrowid
+    return None
+
+def pending(conn):
+    last = conn.execute("SELECT last_transition_id FROM turnaround_state").fetchone()[0]
+    newest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM assignment_transitions").fetchone()[0]
+    return last, newest
+
+def refresh(conn, batch=1000, stop=None, on_batch=None):
+    """Fold transitions past the watermark into the rollups; returns how many were read.
+
+    conn must be in autocommit mode (isolation_level=None).
+    """
+    conn.execute(BATCH_TABLE)
+    folded = 0
+    while stop is None or not stop.is_set():
+        last, newest = pending(conn)
+        if last >= newest:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            last, newest = pending(conn)
+            upper = min(last + batch, newest)
+            conn.execute("DELETE FROM temp.turnaround_batch")
+            conn.execute(EXTRACT, (last, upper))
+            conn.execute(FOLD)
+            conn.execute(STATS)
+            conn.execute("UPDATE turnaround_state SET last_transition_id = ?", (upper,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        folded += upper - last
+        if on_batch:
+            on_batch(upper - last)
+    return folded
+
+def rebuild(conn, batch=1000):
+    """Empty the rollups and fold every transition again."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM turnaround_rollups")
+        conn.execute("DELETE FROM turnaround_stats")
+        conn.execute("UPDATE turnaround_state SET last_transition_id = 0")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return refresh(conn, batch)
+
+def stats_by(conn, dimension):
+    """[{"key", "start", "complete"}] for one dimension, straight from turnaround_stats."""
+    groups = {}
+    for row in conn.execute("""
+        SELECT key, metric, count, mean_seconds, p50_seconds, p90_seconds, p99_seconds
+        FROM turnaround_stats WHERE dimension = ?
+        ORDER BY key, metric
+    """, (dimension,)):
+        groups.setdefault(row["key"], {"key": row["key"], "start": None, "complete": None})[row["metric"]] = row
+    return list(groups.values())
+
+def summary(conn):
+    """What the admin dashboard shows; a handful of indexed reads."""
+    overall = stats_by(conn, "all")
+    slowest = conn.execute(f"""
+        SELECT s.id, s.name, s.role, s.category, t.count, t.p50_seconds, t.p90_seconds
+        FROM turnaround_stats t JOIN staff s ON s.id = t.key
+        WHERE t.dimension = 'staff' AND t.metric = 'complete' AND t.count >= {MIN_STAFF_COUNT}
+        ORDER BY t.p90_seconds DESC
+        LIMIT {TOP}
+    """).fetchall()
+    return {
+        "overall": overall[0] if overall else None,
+        "by_role": stats_by(conn, "role"),
+        "by_category": stats_by(conn, "category"),
+        "by_task_type": stats_by(conn, "task_type"),
+        "slowest_staff": slowest,
+    }
+
+def duration(seconds):
+    """Compact human duration for the dashboard: 45s, 12m, 3.5h, 2.1d."""
+    if seconds is None:
+        return "–"
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            value = seconds / size
+            return f"{value:.1f}{unit}" if value < 10 else f"{value:.0f}{unit}"
+    return f"{seconds:.0f}s"
+
+class Refresher:
+    """Background thread folding new transitions every ANALYTICS_INTERVAL_SECONDS."""
+
+    def __init__(self, app):
+        self.app = app
+        self._stop = threading.Event()
+        self.runs = 0
+        self.transitions = 0
+        self._thread = threading.Thread(target=self._run, name="analytics", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        config = self.app.config
+        while not self._stop.is_set():
+            try:
+                conn = database.get_pool(self.app).connect()
+                conn.isolation_level = None
+                try:
+                    folded = refresh(conn, config["ANALYTICS_BATCH"], stop=self._stop)
+                finally:
+                    conn.close()
+                self.runs += 1
+                self.transitions += folded
+                if folded:
+                    cache.get_cache(self.app).invalidate("turnaround")
+            except Exception:
+                log.exception("turnaround refresh failed")
+            self._stop.wait(config["ANALYTICS_INTERVAL_SECONDS"])
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"runs": self.runs, "transitions": self.transitions}
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.add_template_filter(duration, "duration")
+
+    @app.before_request
+    def _start_refresher():
+        get_refresher(app)
+
+def get_refresher(app):
+    if app.config["ANALYTICS_INTERVAL_SECONDS"] is None:
+        return None
+    refresher = app.extensions.get("analytics")
+    if refresher is None:
+        with _lock:
+            refresher = app.extensions.get("analytics")
+            if refresher is None:
+                refresher = app.extensions["analytics"] = Refresher(app)
+    return refresher
+
+def stats(app, conn):
+    last, newest = pending(conn)
+    refresher = get_refresher(app)
+    return {"folded_through": last, "pending": newest - last, "refresher": refresher.stats() if refresher else None}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("refresh", "rebuild", "report"))
+    parser.add_argument("--db", default=str(APP_DIR / "hospital.db"))
+    parser.add_argument("--batch", type=int, default=DEFAULTS["ANALYTICS_BATCH"])
+    parser.add_argument("--by", choices=DIMENSIONS, default="role", help="report: dimension to break down by")
+    args = parser.parse_args(argv)
+
+    migrate.upgrade_path(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=5)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")
+    try:
+        if args.command == "report":
+            print(f"{args.by:<24} {'started':>8} {'p50':>6} {'p90':>6} {'completed':>10} {'p50':>6} {'p90':>6} {'p99':>6}")
+            for g in stats_by(conn, args.by):
+                s, c = g["start"], g["complete"]
+                print(f"{g['key'] or '-':<24} {s['count'] if s else 0:>8,} {duration(s and s['p50_seconds']):>6} "
+                      f"{duration(s and s['p90_seconds']):>6} {c['count'] if c else 0:>10,} "
+                      f"{duration(c and c['p50_seconds']):>6} {duration(c and c['p90_seconds']):>6} "
+                      f"{duration(c and c['p99_seconds']):>6}")
+            return 0
+        folded = (rebuild if args.command == "rebuild" else refresh)(conn, args.batch)
+        print(f"{folded:,} transitions folded")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
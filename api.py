@@ -0,0 +1,148 @@
+"""Helpers for the versioned JSON API (/api/v1/...).
+
+Resources are whitelisted field sets over the rows that queries.py returns,
+so nothing like password_hash ever leaks and `?fields[orders]=id,status`
+trims the payload without a second query. Patient resources carry the
+per-patient change version (patient_versions, kept by triggers) as ETag and
+Last-Modified, which is checked before any history query runs. Bodies are
+encoded with orjson when installed, else the standard json module.
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from flask import Response, request, url_for
+from werkzeug.http import is_resource_modified
+import thumbnails
+from pagination import FIRST_CURSOR, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+try:
+    import orjson
+except ImportError:  # optional: faster encoding
+    orjson = None
+
+def _image_url(row):
+    return url_for("uploads", filename=row["image_filename"]) if row["image_filename"] else None
+
+def _thumbnail_url(row):
+    if not (row["blob_sha256"] and row["has_thumbnail"]):
+        return None
+    return url_for("uploads", filename=thumbnails.thumb_path(row["blob_sha256"], thumbnails.THUMB_SIZES["thumb"]))
+
+# resource -> fields; a field is a column of the query's rows unless DERIVED.
+RESOURCES = {
+    "patient": ("id", "name", "username", "phone", "dob", "gender", "created_at"),
+    "orders": ("id", "patient_id", "doctor_id", "doctor_name", "doctor_specialty", "order_type", "notes",
+               "status", "created_at"),
+    "assignments": ("id", "patient_id", "doctor_id", "doctor_name", "assignee_staff_id", "assignee_name",
+                    "assignee_role", "task_type", "notes", "status", "created_at"),
+    "reports": ("id", "patient_id", "created_by_staff_id", "staff_name", "staff_role", "report_type",
+                "report_text", "image_url", "thumbnail_url", "mime_type", "file_size", "created_at"),
+    "tickets": ("id", "patient_id", "patient_name", "doctor_id", "doctor_name", "task_type", "notes",
+                "status", "created_at"),
+    "notifications": ("id", "message", "is_read", "created_at"),
+}
+DERIVED = {
+    "image_url": _image_url,
+    "thumbnail_url": _thumbnail_url,
+}
+HISTORY = ("orders", "assignments", "reports")
+
+class BadRequest(ValueError):
+    pass
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def error(status, message):
+    return Response(dumps({"error": message}), status, mimetype="application/json")
+
+def fields(resource, primary=False):
+    """Fields asked for with ?fields[<resource>]=a,b (or ?fields= for the primary resource)."""
+    raw = request.args.get(f"fields[{resource}]")
+    if raw is None and primary:
+        raw = request.args.get("fields")
+    if not raw:
+        return RESOURCES[resource]
+    wanted = tuple(f.strip() for f in raw.split(",") if f.strip())
+    unknown = [f for f in wanted if f not in RESOURCES[resource]]
+    if unknown:
+        raise BadRequest(f"unknown field(s) for {resource}: {', '.join(unknown)}")
+    return wanted
+
+def project(rows, names):
+    getters = [(name, DERIVED.get(name)) for name in names]
+    return [{name: get(row) if get else row[name] for name, get in getters} for row in rows]
+
+def page_params():
+    """(before, limit) from ?cursor=&limit=."""
+    try:
+        before = int(request.args.get("cursor") or FIRST_CURSOR)
+        limit = int(request.args.get("limit") or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise BadRequest("cursor and limit must be integers") from None
+    return before, max(1, min(limit, MAX_PAGE_SIZE))
+
+def page_body(page, resource, primary=False):
+    return {"data": project(page.rows, fields(resource, primary)), "next_cursor": page.next_cursor}
+
+class Version:
+    def __init__(self, number, updated_at):
+        self.number = number
+        self.updated_at = updated_at    # aware UTC datetime
+
+    @property
+    def etag(self):
+        return f"v{self.number}"
+
+def patient_version(conn, patient_id):
+    """The patient's change version, or None if there is no such patient."""
+    row = conn.execute("""
+        SELECT COALESCE(v.version, 0), COALESCE(v.updated_at, p.created_at)
+        FROM patients p LEFT JOIN patient_versions v ON v.patient_id = p.id
+        WHERE p.id = ?
+    """, (patient_id,)).fetchone()
+    if row is None:
+        return None
+    updated_at = datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return Version(row[0], updated_at)
+
+_seen_lock = threading.Lock()
+_seen = OrderedDict()    # patient_id -> last version this process served
+SEEN_MAX = 10000
+
+def sync_cache(query_cache, patient_id, version):
+    """Drop this process's cached history for the patient if another process
+    (or a write that skipped invalidation) moved its version on."""
+    with _seen_lock:
+        last = _seen.pop(patient_id, None)
+        _seen[patient_id] = version.number
+        while len(_seen) > SEEN_MAX:
+            _seen.popitem(last=False)
+    if last != version.number:
+        query_cache.invalidate(f"patient:{patient_id}")
+
+def not_modified(version):
+    """A 304 if the client's If-None-Match / If-Modified-Since still matches, else None."""
+    if is_resource_modified(request.environ, etag=version.etag, last_modified=version.updated_at):
+        return None
+    return _headers(Response(status=304), version)
+
+def respond(body, version=None):
+    resp = Response(dumps(body), mimetype="application/json")
+    if version is not None:
+        return _headers(resp, version)
+    # No stored version: the ETag is a hash of the body, which still saves
+    # the transfer when nothing changed.
+    resp.headers["Cache-Control"] = "private, no-cache"
+    resp.add_etag()
+    return resp.make_conditional(request)
+
+def _headers(resp, version):
+    resp.set_etag(version.etag)
+    resp.last_modified = version.updated_at
+    # Clients may keep the body but must revalidate before each use.
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
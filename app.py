@@ -1,24 +1,63 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, send_from_directory
+from flask import (Flask, render_template, request, redirect, url_for, session, flash, send_from_directory, jsonify,
+                   Response, get_flashed_messages, stream_with_context)
 import sqlite3
 from pathlib import Path
-import hashlib
-from werkzeug.utils import secure_filename
 import os
+import database
+import pagination
+from pagination import fetch_page
+import search
+import queries
+import counters
+import analytics
+import audit
+import api
+import events
+import bulk
+import blobstore
+import thumbnails
+import cache
+import fragments
+import outbox
+import archive
+import backup
+import timeline
+import workload
+import writer
+import metrics
+import peers
+import re
+import math
+from datetime import date
+import passwords
+import ratelimit
+from passwords import hash_pw
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 APP_DIR = Path(__file__).parent
-DB_PATH = APP_DIR / "hospital.db"
+DB_PATH = Path(os.environ.get("HOSPITAL_DB", APP_DIR / "hospital.db"))
 UPLOAD_DIR = APP_DIR / "uploads"
 ALLOWED_EXT = {".png", ".jpg", ".jpeg", ".webp", ".pdf"}
+# Blob-store originals and thumbnails: the name embeds the content hash.
+CONTENT_ADDRESSED = re.compile(r"^(?:thumbs/)?[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}(?:_\d+)?)\.\w+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
 
 def db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+    # Pooled connection bound to the current app context; released on teardown.
+    return database.get_db()
 
-def hash_pw(pw: str) -> str:
-    # Demo only. For real systems use bcrypt/argon2 + HTTPS + strong secrets.
-    return hashlib.sha256(pw.encode("utf-8")).hexdigest()
+def cached_query(tags, sql, params=(), one=False):
+    # Read-through QueryCache lookup; write routes invalidate by tag.
+    conn = db()
+    cur = lambda: conn.execute(sql, params)
+    loader = (lambda: cur().fetchone()) if one else (lambda: cur().fetchall())
+    return cache.get_cache(app).get_or_load((sql, params, one), tags, loader)
+
+def invalidate(*tags):
+    cache.get_cache(app).invalidate(*tags)
+
+def workload_index():
+    return workload.get_index(app, db())
 
 def require_role(role: str):
     if session.get("role") != role:
@@ -41,12 +80,60 @@ def require_any_staff():
     return None
 
 app = Flask(__name__)
-app.secret_key = "CHANGE_ME_TO_A_RANDOM_SECRET_KEY"
-UPLOAD_DIR.mkdir(exist_ok=True)
+app.secret_key = "CHANGE_ME_TO_A_RANDOM_SECRET_KEY"    # development only; serve.py refuses it
+# Deployments (serve.py): a Flask config file, then HOSPITAL_<KEY> environment
+# variables, e.g. HOSPITAL_SECRET_KEY or HOSPITAL_DB_POOL_SIZE=16.
+if os.environ.get("HOSPITAL_CONFIG"):
+    app.config.from_pyfile(os.environ["HOSPITAL_CONFIG"])
+app.config.from_prefixed_env("HOSPITAL")
+UPLOAD_DIR = Path(app.config.setdefault("UPLOAD_DIR", str(UPLOAD_DIR)))
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+database.init_app(app, DB_PATH)
+peers.init_app(app)
+events.init_app(app)
+cache.init_app(app)
+fragments.init_app(app)
+passwords.init_app(app)
+ratelimit.init_app(app)
+outbox.init_app(app)
+archive.init_app(app)
+backup.init_app(app)
+search.init_app(app)
+analytics.init_app(app)
+audit.init_app(app)
+writer.init_app(app)
+metrics.init_app(app)
+fragments.precompile(app)    # after every extension's template filters
+# Behind a reverse proxy every request comes from the proxy's address. Set
+# PROXY_FIX_X_FOR to the number of proxies in front of the app to take the
+# client address (login limits, audit, /metrics) from X-Forwarded-For; only
+# do so when clients cannot reach the app except through those proxies.
+app.config.setdefault("PROXY_FIX_X_FOR", 0)
+app.config.setdefault("PROXY_FIX_X_PROTO", 0)
+if app.config["PROXY_FIX_X_FOR"] or app.config["PROXY_FIX_X_PROTO"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"],
+                            x_proto=app.config["PROXY_FIX_X_PROTO"])
 
 @app.route("/uploads/<path:filename>")
 def uploads(filename):
-    return send_from_directory(UPLOAD_DIR, filename, as_attachment=False)
+    if filename.startswith("tmp/"):
+        return Response(status=404)  # in-flight uploads of the blob store
+    m = CONTENT_ADDRESSED.match(filename)
+    audit.record(app, resource=filename, blob=m.group(1)[:64] if m else None)
+    if not m:
+        # Legacy name-addressed files: mtime/size ETag, always revalidate.
+        resp = send_from_directory(UPLOAD_DIR, filename, as_attachment=False, max_age=0)
+        resp.cache_control.public = False
+        resp.cache_control.private = True
+        return resp
+    # Content never changes under this name: strong ETag (the hash), cached
+    # for a year without revalidation. Range requests are handled by send_file.
+    resp = send_from_directory(UPLOAD_DIR, filename, as_attachment=False,
+                               etag=m.group(1), max_age=IMMUTABLE_MAX_AGE)
+    resp.cache_control.public = False  # patient records: browser cache only
+    resp.cache_control.private = True
+    resp.cache_control.immutable = True
+    return resp
 
 # ---------------- Home / Auth ----------------
 @app.route("/")
@@ -69,20 +156,47 @@ def logout():
     session.clear()
     return redirect(url_for("home"))
 
+@app.errorhandler(passwords.HashingBusy)
+def hashing_busy(e):
+    flash("The server is busy, please try again in a moment")
+    return redirect(request.referrer or url_for("home"))
+
+def login_limited(kind, username):
+    # Counts the attempt against the client address and the account.
+    wait = ratelimit.check_login(app, request.remote_addr, f"{kind}:{username.lower()}")
+    if wait:
+        flash(f"Too many login attempts, try again in {math.ceil(wait)} seconds")
+    return wait
+
+def check_credentials(table, row, password):
+    """True if `password` matches `row`; legacy hashes are upgraded in place."""
+    # The hash runs on the worker pool; don't hold a pool connection meanwhile.
+    database.release_db()
+    ok, new_hash = passwords.verify(row["password_hash"] if row else None, password)
+    if not (row and ok):
+        return False
+    if new_hash:
+        conn = db()
+        conn.execute(f"UPDATE {table} SET password_hash=? WHERE id=? AND password_hash=?",
+                     (new_hash, row["id"], row["password_hash"]))
+        conn.commit()
+    return True
+
 @app.route("/login/staff", methods=["GET","POST"])
 def staff_login():
     if request.method == "POST":
         username = request.form.get("username","").strip()
         password = request.form.get("password","")
+        if login_limited("staff", username):
+            return render_template("login.html", title="Staff Login", role="staff"), 429
         conn = db()
         # Query generic staff table
         row = conn.execute(
             "SELECT id, username, password_hash, role FROM staff WHERE username=?",
             (username,),
         ).fetchone()
-        conn.close()
 
-        if row and row["password_hash"] == hash_pw(password):
+        if check_credentials("staff", row, password):
             session["role"] = row["role"]
             session["user_id"] = row["id"]
             session["username"] = row["username"]
@@ -96,10 +210,11 @@ def patient_login():
     if request.method == "POST":
         username = request.form.get("username","").strip()
         password = request.form.get("password","")
+        if login_limited("patient", username):
+            return render_template("login.html", title="Patient Login", role="patient"), 429
         conn = db()
         row = conn.execute("SELECT id, username, password_hash FROM patients WHERE username=?", (username,)).fetchone()
-        conn.close()
-        if row and row["password_hash"] == hash_pw(password):
+        if check_credentials("patients", row, password):
             session["role"] = "patient"
             session["user_id"] = row["id"]
             session["username"] = row["username"]
@@ -113,24 +228,32 @@ def admin_dashboard():
     r = require_role("admin")
     if r: return r
     conn = db()
-    staff = conn.execute("SELECT * FROM staff ORDER BY id DESC").fetchall()
-    patients = conn.execute("SELECT * FROM patients ORDER BY id DESC").fetchall()
-    recent_assignments = conn.execute("""
+    qc = cache.get_cache(app)
+    staff = fetch_page(conn, "staff", "SELECT * FROM staff WHERE id < ? ORDER BY id DESC LIMIT ?",
+                       cache=qc, tags=("staff",))
+    patients = fetch_page(conn, "patients", "SELECT * FROM patients WHERE id < ? ORDER BY id DESC LIMIT ?",
+                          cache=qc, tags=("patients",))
+    recent_assignments = fetch_page(conn, "assignments", """
         SELECT a.*, p.name AS patient_name, d.name AS doctor_name, s.name AS assignee_name, s.role AS assignee_role
         FROM assignments a
         JOIN patients p ON p.id = a.patient_id
         JOIN staff d ON d.id = a.doctor_id
         JOIN staff s ON s.id = a.assignee_staff_id
+        WHERE a.id < ?
         ORDER BY a.id DESC
-        LIMIT 100
-    """).fetchall()
-    conn.close()
+        LIMIT ?
+    """, cache=qc, tags=("assignments",))
+    # Counters change with every write; a short TTL bounds the lag instead of tags.
+    summary = qc.get_or_load(("counters.summary",), (), lambda: counters.summary(conn), ttl=counters.SUMMARY_TTL)
+    turnaround = qc.get_or_load(("analytics.summary",), ("turnaround",), lambda: analytics.summary(conn))
     return render_template(
         "admin_dashboard.html",
         title="Admin Dashboard",
         staff=staff,
         patients=patients,
         recent_assignments=recent_assignments,
+        summary=summary,
+        turnaround=turnaround,
     )
 
 @app.post("/admin/staff/create")
@@ -161,18 +284,21 @@ def admin_create_staff():
     if not (name and username and password):
         flash("Name, username, password are required")
         return redirect(url_for("admin_dashboard"))
+    password_hash = passwords.make_hash(password)
     conn = db()
     try:
-        conn.execute(
+        cur = conn.execute(
             "INSERT INTO staff (name, role, category, username, password_hash, phone, is_available) VALUES (?,?,?,?,?,?,?)",
-            (name, role, category, username, hash_pw(password), phone, is_available),
+            (name, role, category, username, password_hash, phone, is_available),
         )
         conn.commit()
+        invalidate("staff")
+        index = workload.loaded(app)
+        if index:
+            index.add_staff(cur.lastrowid, role, category, is_available)
         flash("Staff account created")
     except sqlite3.IntegrityError:
         flash("Username already exists")
-    finally:
-        conn.close()
     return redirect(url_for("admin_dashboard"))
 
 @app.post("/admin/patient/create")
@@ -188,18 +314,18 @@ def admin_create_patient():
     if not (name and username and password):
         flash("Name, username, password are required")
         return redirect(url_for("admin_dashboard"))
+    password_hash = passwords.make_hash(password)
     conn = db()
     try:
         conn.execute(
             "INSERT INTO patients (name, username, password_hash, phone, dob, gender) VALUES (?,?,?,?,?,?)",
-            (name, username, hash_pw(password), phone, dob, gender),
+            (name, username, password_hash, phone, dob, gender),
         )
         conn.commit()
+        invalidate("patients")
         flash("Patient account created")
     except sqlite3.IntegrityError:
         flash("Username already exists")
-    finally:
-        conn.close()
     return redirect(url_for("admin_dashboard"))
 
 @app.post("/admin/staff/toggle-availability/<int:staff_id>")
@@ -212,7 +338,10 @@ def admin_toggle_availability(staff_id):
         new_val = 0 if row["is_available"] else 1
         conn.execute("UPDATE staff SET is_available=? WHERE id=?", (new_val, staff_id))
         conn.commit()
-    conn.close()
+        invalidate("staff")
+        index = workload.loaded(app)
+        if index:
+            index.set_available(staff_id, new_val)
     return redirect(url_for("admin_dashboard"))
 
 @app.post("/admin/staff/delete/<int:staff_id>")
@@ -222,7 +351,9 @@ def admin_delete_staff(staff_id):
     conn = db()
     conn.execute("DELETE FROM staff WHERE id=?", (staff_id,))
     conn.commit()
-    conn.close()
+    archive.purge_deleted(app)    # their archived rows; foreign keys stop at the main database
+    cache.get_cache(app).clear()  # cascades into every per-user list
+    workload.reset(app)
     flash("Staff deleted")
     return redirect(url_for("admin_dashboard"))
 
@@ -233,10 +364,100 @@ def admin_delete_patient(patient_id):
     conn = db()
     conn.execute("DELETE FROM patients WHERE id=?", (patient_id,))
     conn.commit()
-    conn.close()
+    archive.purge_deleted(app)    # their archived rows; foreign keys stop at the main database
+    cache.get_cache(app).clear()  # cascades into every per-user list
+    workload.reset(app)
     flash("Patient deleted")
     return redirect(url_for("admin_dashboard"))
 
+@app.post("/admin/import/<kind>")
+def admin_bulk_import(kind):
+    r = require_role("admin")
+    if r: return r
+    upload = request.files.get("file")
+    if kind not in bulk.IMPORTS or not upload or not upload.filename:
+        flash("Choose a CSV or NDJSON file to import")
+        return redirect(url_for("admin_dashboard"))
+    # Werkzeug spools large uploads to disk; rows are read from it one at a time.
+    rows = bulk.read_rows(upload.stream, bulk.detect_format(upload.filename))
+    report = bulk.import_rows(db(), kind, rows)
+    if report.inserted:
+        invalidate(kind)
+        workload.reset(app)
+    flash(report.summary())
+    return redirect(url_for("admin_dashboard"))
+
+@app.get("/admin/export/<kind>.<fmt>")
+def admin_bulk_export(kind, fmt):
+    r = require_role("admin")
+    if r: return r
+    if kind not in bulk.EXPORTS or fmt not in ("csv", "ndjson"):
+        return Response(status=404)
+    # Long export reads go to the reporting snapshot when there is one.
+    snap = backup.snapshot(app)
+    source = snap or database.get_pool(app)
+    rows = bulk.iter_table(source.acquire, source.release, kind)
+    resp = Response(
+        bulk.export_lines(rows, kind, fmt),
+        mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={kind}.{fmt}"},
+    )
+    if snap:
+        resp.last_modified = snap.as_of
+        resp.call_on_close(snap.close)
+    return resp
+
+@app.post("/admin/backup")
+def admin_backup():
+    r = require_role("admin")
+    if r: return r
+    backup.get_worker(app).request_backup()
+    flash(f"Backup started; it will appear in {backup.backup_dir(app)}")
+    return redirect(url_for("admin_dashboard"))
+
+@app.get("/admin/db-stats")
+def admin_db_stats():
+    r = require_role("admin")
+    if r: return r
+    stats = database.get_pool(app).stats()
+    stats["outbox"] = outbox.stats(db())
+    stats["writer"] = writer.get_writer(app).stats()
+    stats["archive"] = archive.stats(app, db())
+    stats["backup"] = backup.stats(app)
+    stats["report_search"] = search.stats(app, db())
+    stats["analytics"] = analytics.stats(app, db())
+    stats["peers"] = peers.stats(app)
+    stats["audit"] = audit.stats(app)
+    stats["events"] = events.stats(app)
+    return jsonify(stats)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    if session.get("role") != "admin" and not metrics.scraper_allowed(app, request):
+        return Response(status=403)
+    return Response(metrics.render(app), mimetype="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles")
+def admin_profiles():
+    r = require_role("admin")
+    if r: return r
+    text = metrics.profiles_text() or "No profiles yet; send a request with the header X-Profile: 1.\n"
+    return Response(text, mimetype="text/plain")
+
+@app.get("/admin/workload")
+def admin_workload():
+    r = require_role("admin")
+    if r: return r
+    return jsonify(workload_index().stats())
+
+@app.get("/admin/cache-stats")
+def admin_cache_stats():
+    r = require_role("admin")
+    if r: return r
+    stats = cache.get_cache(app).stats()
+    stats["fragments"] = fragments.get_fragment_cache(app).stats()
+    return jsonify(stats)
+
 # ---------------- Doctor ----------------
 @app.route("/doctor")
 def doctor_dashboard():
@@ -244,38 +465,34 @@ def doctor_dashboard():
     if r: return r
     doctor_id = session["user_id"]
     conn = db()
-    doctor = conn.execute("SELECT * FROM staff WHERE id=? AND role='doctor'", (doctor_id,)).fetchone()
-    patients = conn.execute("SELECT * FROM patients ORDER BY id DESC").fetchall()
-    nurses = conn.execute("SELECT * FROM staff WHERE role='nurse' AND is_available=1 ORDER BY name").fetchall()
-    radiologists = conn.execute("SELECT * FROM staff WHERE role='radiologist' AND is_available=1 ORDER BY name").fetchall()
-
-    recent_orders = conn.execute("""
+    qc = cache.get_cache(app)
+    doctor = cached_query(("staff",), "SELECT * FROM staff WHERE id=? AND role='doctor'", (doctor_id,), one=True)
+    patients = fetch_page(conn, "patients", "SELECT * FROM patients WHERE id < ? ORDER BY id DESC LIMIT ?",
+                          cache=qc, tags=("patients",))
+    nurses = cached_query(("staff",), "SELECT * FROM staff WHERE role='nurse' AND is_available=1 ORDER BY name")
+    radiologists = cached_query(("staff",), "SELECT * FROM staff WHERE role='radiologist' AND is_available=1 ORDER BY name")
+
+    recent_orders = fetch_page(conn, "orders", """
         SELECT o.*, p.name AS patient_name
         FROM orders o
         JOIN patients p ON p.id=o.patient_id
-        WHERE o.doctor_id=?
+        WHERE o.doctor_id=? AND o.id < ?
         ORDER BY o.id DESC
-        LIMIT 200
-    """, (doctor_id,)).fetchall()
+        LIMIT ?
+    """, (doctor_id,), cache=qc, tags=(f"orders:doctor:{doctor_id}",))
 
-    recent_assignments = conn.execute("""
+    recent_assignments = fetch_page(conn, "assignments", """
         SELECT a.*, p.name AS patient_name, s.name AS assignee_name, s.role AS assignee_role
         FROM assignments a
         JOIN patients p ON p.id=a.patient_id
         JOIN staff s ON s.id=a.assignee_staff_id
-        WHERE a.doctor_id=?
+        WHERE a.doctor_id=? AND a.id < ?
         ORDER BY a.id DESC
-        LIMIT 200
-    """, (doctor_id,)).fetchall()
+        LIMIT ?
+    """, (doctor_id,), cache=qc, tags=(f"assignments:doctor:{doctor_id}",))
 
-    notifications = conn.execute("""
-        SELECT * FROM notifications
-        WHERE staff_id=?
-        ORDER BY id DESC
-        LIMIT 50
-    """, (doctor_id,)).fetchall()
+    notifications = queries.staff_notifications(conn, qc, doctor_id)
 
-    conn.close()
     return render_template(
         "doctor_dashboard.html",
         title="Doctor Dashboard",
@@ -286,6 +503,7 @@ def doctor_dashboard():
         recent_orders=recent_orders,
         recent_assignments=recent_assignments,
         notifications=notifications,
+        auto_groups=workload_index().groups(),
     )
 
 @app.post("/doctor/orders/create")
@@ -305,7 +523,7 @@ def doctor_create_order():
         (patient_id, doctor_id, order_type, notes),
     )
     conn.commit()
-    conn.close()
+    invalidate(f"orders:doctor:{doctor_id}", f"patient:{patient_id}")
     flash("Order created")
     return redirect(url_for("doctor_dashboard"))
 
@@ -315,35 +533,65 @@ def doctor_create_assignment():
     if r: return r
     doctor_id = session["user_id"]
     patient_id = int(request.form.get("patient_id","0") or 0)
-    assignee_staff_id = int(request.form.get("assignee_staff_id","0") or 0)
+    assignee_choice = request.form.get("assignee_staff_id","").strip()
     task_type = request.form.get("task_type","").strip()
     notes = request.form.get("notes","").strip()
 
-    if not (patient_id and assignee_staff_id and task_type):
+    if not (patient_id and assignee_choice and task_type):
         flash("Patient + assignee + task type are required")
         return redirect(url_for("doctor_dashboard"))
 
     conn = db()
+    # "auto:<role>[:<category>]" picks the least-loaded available match.
+    auto = assignee_choice.startswith("auto:")
+    if auto:
+        _, role, category = (assignee_choice.split(":", 2) + [""])[:3]
+        if role not in workload.ASSIGNABLE_ROLES:
+            flash("Assignee must be an available nurse or radiologist")
+            return redirect(url_for("doctor_dashboard"))
+        try:
+            assignee_staff_id = workload_index().pick(role, category)
+        except workload.NoAssignee as e:
+            flash(f"Auto-assign failed: {e}")
+            return redirect(url_for("doctor_dashboard"))
+    else:
+        assignee_staff_id = int(assignee_choice) if assignee_choice.isdigit() else 0
+
     assignee = conn.execute(
         "SELECT id, role, name FROM staff WHERE id=? AND is_available=1",
         (assignee_staff_id,),
     ).fetchone()
     if not assignee or assignee["role"] not in ("nurse","radiologist"):
-        conn.close()
+        if auto:
+            workload_index().release(assignee_staff_id)
         flash("Assignee must be an available nurse or radiologist")
         return redirect(url_for("doctor_dashboard"))
 
-    conn.execute(
-        "INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type, notes) VALUES (?,?,?,?,?)",
-        (patient_id, doctor_id, assignee_staff_id, task_type, notes),
-    )
-
-    msg = f"New assignment: {task_type} (Patient ID {patient_id})"
-    conn.execute("INSERT INTO notifications (staff_id, message) VALUES (?,?)", (assignee_staff_id, msg))
-
+    try:
+        cur = conn.execute(
+            "INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type, notes) VALUES (?,?,?,?,?)",
+            (patient_id, doctor_id, assignee_staff_id, task_type, notes),
+        )
+    except sqlite3.Error:
+        if auto:
+            workload_index().release(assignee_staff_id)
+        raise
+    # The assignee's notification is written by the outbox dispatcher.
+    outbox.enqueue(conn, f"assignment:{cur.lastrowid}:created", "assignment.created", {
+        "assignment_id": cur.lastrowid, "patient_id": patient_id, "doctor_id": doctor_id,
+        "assignee_staff_id": assignee_staff_id, "task_type": task_type,
+    })
     conn.commit()
-    conn.close()
-    flash("Ticket created (assignee notified)")
+    outbox.wake(app)
+    index = workload.loaded(app)
+    if not auto and index:
+        index.opened(assignee_staff_id)
+    invalidate("assignments", f"assignments:doctor:{doctor_id}", f"assignments:assignee:{assignee_staff_id}",
+               f"patient:{patient_id}")
+    if auto:
+        flash(f"Ticket created and auto-assigned to {assignee['name']} (assignee notified)")
+    else:
+        flash("Ticket created (assignee notified)")
     return redirect(url_for("doctor_dashboard"))
 
 @app.get("/doctor/patient/<int:patient_id>")
@@ -351,41 +599,17 @@ def doctor_view_patient(patient_id):
     r = require_staff_role("doctor")
     if r: return r
     conn = db()
-    patient = conn.execute("SELECT * FROM patients WHERE id=?", (patient_id,)).fetchone()
+    qc = cache.get_cache(app)
+    patient = cached_query(("patients",), "SELECT * FROM patients WHERE id=?", (patient_id,), one=True)
     if not patient:
-        conn.close()
         flash("Patient not found")
         return redirect(url_for("doctor_dashboard"))
+    audit.record(app, patient_id=patient_id)
 
-    orders = conn.execute("""
-        SELECT o.*, d.name AS doctor_name
-        FROM orders o
-        JOIN staff d ON d.id=o.doctor_id
-        WHERE o.patient_id=?
-        ORDER BY o.id DESC
-        LIMIT 300
-    """, (patient_id,)).fetchall()
+    orders = queries.patient_orders(conn, qc, patient_id)
+    assignments = queries.patient_assignments(conn, qc, patient_id)
+    reports = queries.patient_reports(conn, qc, patient_id)
 
-    assignments = conn.execute("""
-        SELECT a.*, d.name AS doctor_name, s.name AS assignee_name, s.role AS assignee_role
-        FROM assignments a
-        JOIN staff d ON d.id=a.doctor_id
-        JOIN staff s ON s.id=a.assignee_staff_id
-        WHERE a.patient_id=?
-        ORDER BY a.id DESC
-        LIMIT 300
-    """, (patient_id,)).fetchall()
-
-    reports = conn.execute("""
-        SELECT r.*, s.name AS staff_name, s.role AS staff_role
-        FROM reports r
-        JOIN staff s ON s.id=r.created_by_staff_id
-        WHERE r.patient_id=?
-        ORDER BY r.id DESC
-        LIMIT 300
-    """, (patient_id,)).fetchall()
-
-    conn.close()
     return render_template(
         "patient_history.html",
         title="Patient History",
@@ -395,32 +619,61 @@ def doctor_view_patient(patient_id):
         reports=reports,
     )
 
+@app.get("/api/patients/search")
+def patient_search():
+    r = require_any_staff()
+    if r: return r
+    q = request.args.get("q", "")
+    limit = request.args.get("limit", search.SEARCH_LIMIT, type=int)
+    rows = search.search_patients(db(), q, limit)
+    return jsonify(results=[dict(row) for row in rows])
+
+@app.get("/doctor/reports/search")
+def doctor_report_search():
+    r = require_staff_role("doctor")
+    if r: return r
+    conn = db()
+    q = request.args.get("q", "").strip()
+    since = request.args.get("since") or None
+    until = request.args.get("until") or None
+    staff_id = request.args.get("staff_id", type=int)
+    limit = request.args.get("limit", search.REPORT_SEARCH_LIMIT, type=int)
+    try:
+        for day in (since, until):
+            if day:
+                date.fromisoformat(day)
+    except ValueError:
+        flash("Dates must be YYYY-MM-DD")
+        since = until = None
+    results = search.search_reports(conn, q, since, until, staff_id, limit) if q else []
+    # Sorted here: the role index gives (role, is_available, name) order, not (role, name).
+    authors = sorted(cached_query(("staff",), "SELECT id, name, role FROM staff WHERE role IN ('nurse', 'radiologist')"),
+                     key=lambda s: (s["role"], s["name"]))
+    return render_template(
+        "doctor_report_search.html",
+        title="Report Search",
+        q=q,
+        since=since,
+        until=until,
+        staff_id=staff_id,
+        limit=max(1, min(limit, search.MAX_REPORT_SEARCH_LIMIT)),
+        results=results,
+        authors=authors,
+        index=search.backfill_status(conn),
+    )
+
 # ---------------- Nurse & Radiologist ----------------
 def _staff_dashboard(role: str, title: str, template_name: str):
     r = require_staff_role(role)
     if r: return r
     staff_id = session["user_id"]
     conn = db()
-    me = conn.execute("SELECT * FROM staff WHERE id=? AND role=?", (staff_id, role)).fetchone()
+    qc = cache.get_cache(app)
+    me = cached_query(("staff",), "SELECT * FROM staff WHERE id=? AND role=?", (staff_id, role), one=True)
 
-    notifications = conn.execute("""
-        SELECT * FROM notifications
-        WHERE staff_id=?
-        ORDER BY id DESC
-        LIMIT 200
-    """, (staff_id,)).fetchall()
+    notifications = queries.staff_notifications(conn, qc, staff_id)
+    assignments = queries.assignee_tickets(conn, qc, staff_id)
 
-    assignments = conn.execute("""
-        SELECT a.*, p.name AS patient_name, d.name AS doctor_name
-        FROM assignments a
-        JOIN patients p ON p.id=a.patient_id
-        JOIN staff d ON d.id=a.doctor_id
-        WHERE a.assignee_staff_id=?
-        ORDER BY a.id DESC
-        LIMIT 300
-    """, (staff_id,)).fetchall()
-
-    conn.close()
     return render_template(
         template_name,
         title=title,
@@ -443,10 +696,23 @@ def staff_mark_notification_read(notif_id):
     if role not in ("nurse","radiologist","doctor"):
         return redirect(url_for("home"))
     staff_id = session.get("user_id")
-    conn = db()
-    conn.execute("UPDATE notifications SET is_read=1 WHERE id=? AND staff_id=?", (notif_id, staff_id))
-    conn.commit()
-    conn.close()
+    n = writer.execute(app, "UPDATE notifications SET is_read=1 WHERE id=? AND staff_id=? AND is_read=0",
+                       (notif_id, staff_id))
+    if n:
+        invalidate(f"notifications:staff:{staff_id}")
+        events.mark_read(app, events.staff_channel(staff_id), n)
+    return redirect(url_for(f"{role}_dashboard"))
+
+@app.post("/staff/notifications/mark-all-read")
+def staff_mark_all_notifications_read():
+    role = session.get("role")
+    if role not in ("nurse","radiologist","doctor"):
+        return redirect(url_for("home"))
+    staff_id = session.get("user_id")
+    n = writer.execute(app, "UPDATE notifications SET is_read=1 WHERE staff_id=? AND is_read=0", (staff_id,))
+    if n:
+        invalidate(f"notifications:staff:{staff_id}")
+        events.mark_read(app, events.staff_channel(staff_id), n)
     return redirect(url_for(f"{role}_dashboard"))
 
 @app.post("/staff/assignments/update-status/<int:assignment_id>")
@@ -458,53 +724,58 @@ def staff_update_assignment_status(assignment_id):
     status = request.form.get("status","Assigned").strip()
     if status not in ("Assigned","In Progress","Completed"):
         status = "Assigned"
-    conn = db()
-    # Fetch assignment details first if we need to notify
-    assignment = conn.execute(
-        "SELECT * FROM assignments WHERE id=? AND assignee_staff_id=?",
-        (assignment_id, staff_id)
-    ).fetchone()
 
+    def update(conn):
+        # Read inside the write transaction so the previous status is exact.
+        assignment = conn.execute(
+            "SELECT * FROM assignments WHERE id=? AND assignee_staff_id=?",
+            (assignment_id, staff_id)
+        ).fetchone()
+        if assignment:
+            conn.execute(
+                "UPDATE assignments SET status=? WHERE id=? AND assignee_staff_id=?",
+                (status, assignment_id, staff_id),
+            )
+            transition_id = analytics.record(conn, assignment_id, staff_id, assignment["status"], status)
+            if status == "Completed" and assignment["status"] != "Completed":
+                # Doctor and patient are notified by the outbox dispatcher, once
+                # per completion: a ticket reopened and completed again notifies again.
+                outbox.enqueue(conn, f"assignment:{assignment_id}:completed:{transition_id}", "assignment.completed", {
+                    "assignment_id": assignment_id, "patient_id": assignment["patient_id"],
+                    "doctor_id": assignment["doctor_id"], "task_type": assignment["task_type"],
+                })
+        return assignment
+
+    assignment = writer.write(app, update)
     if assignment:
-        conn.execute(
-            "UPDATE assignments SET status=? WHERE id=? AND assignee_staff_id=?",
-            (status, assignment_id, staff_id),
-        )
-
-        if status == "Completed":
-            # Notify Doctor
-            doc_msg = f"Task '{assignment['task_type']}' for patient #{assignment['patient_id']} was completed."
-            conn.execute("INSERT INTO notifications (staff_id, message) VALUES (?,?)", (assignment['doctor_id'], doc_msg))
-
-            # Notify Patient
-            pat_msg = f"Your task '{assignment['task_type']}' has been completed."
-            conn.execute("INSERT INTO patient_notifications (patient_id, message) VALUES (?,?)", (assignment['patient_id'], pat_msg))
-
-        conn.commit()
+        outbox.wake(app)
+        index = workload.loaded(app)
+        if index:
+            index.status_changed(staff_id, assignment["status"], status)
+        invalidate("assignments", f"assignments:doctor:{assignment['doctor_id']}",
+                   f"assignments:assignee:{staff_id}", f"patient:{assignment['patient_id']}")
         flash("Ticket status updated")
     else:
         flash("Assignment not found or access denied")
 
-    conn.close()
     return redirect(url_for(f"{role}_dashboard"))
 
-def _save_upload(file_storage):
-    if not file_storage or not getattr(file_storage, "filename", ""):
-        return None
-    filename = secure_filename(file_storage.filename)
-    if not filename:
-        return None
-    ext = os.path.splitext(filename)[1].lower()
-    if ext not in ALLOWED_EXT:
+def _thumbnail_ready(sha256, patient_id):
+    # Runs on the thumbnail worker thread, outside any request.
+    pool = database.get_pool(app)
+    conn = pool.acquire()
+    try:
+        conn.execute("UPDATE blobs SET has_thumbnail=1 WHERE sha256=?", (sha256,))
+        conn.commit()
+    finally:
+        pool.release(conn)
+    invalidate(f"patient:{patient_id}")
+
+@app.template_global()
+def thumbnail_url(report, size=thumbnails.THUMB_SIZES["thumb"]):
+    if not report["has_thumbnail"]:
         return None
-    base = os.path.splitext(filename)[0]
-    i = 0
-    out_name = filename
-    while (UPLOAD_DIR / out_name).exists():
-        i += 1
-        out_name = f"{base}_{i}{ext}"
-    file_storage.save(UPLOAD_DIR / out_name)
-    return out_name
+    return url_for("uploads", filename=thumbnails.thumb_path(report["blob_sha256"], size))
 
 @app.post("/staff/reports/create")
 def staff_create_report():
@@ -515,19 +786,24 @@ def staff_create_report():
     patient_id = int(request.form.get("patient_id","0") or 0)
     report_type = request.form.get("report_type","").strip() or ("Scan Result" if role=="radiologist" else "Report")
     report_text = request.form.get("report_text","").strip()
-    image_filename = _save_upload(request.files.get("image_file"))
 
     if not patient_id:
         flash("Patient is required")
         return redirect(url_for(f"{role}_dashboard"))
 
     conn = db()
+    image_filename, blob_sha256, mime_type = blobstore.save_upload(
+        request.files.get("image_file"), UPLOAD_DIR, conn, ALLOWED_EXT
+    ) or (None, None, None)
     conn.execute(
-        "INSERT INTO reports (patient_id, created_by_staff_id, report_type, report_text, image_filename) VALUES (?,?,?,?,?)",
-        (patient_id, staff_id, report_type, report_text, image_filename),
+        "INSERT INTO reports (patient_id, created_by_staff_id, report_type, report_text, image_filename, blob_sha256) VALUES (?,?,?,?,?,?)",
+        (patient_id, staff_id, report_type, report_text, image_filename, blob_sha256),
     )
     conn.commit()
-    conn.close()
+    invalidate(f"patient:{patient_id}")
+    if blob_sha256:
+        thumbnails.submit(UPLOAD_DIR, blob_sha256, image_filename, mime_type,
+                          lambda sha: _thumbnail_ready(sha, patient_id))
     flash("Report added to patient record")
     return redirect(url_for(f"{role}_dashboard"))
 
@@ -537,45 +813,16 @@ def patient_dashboard():
     r = require_role("patient")
     if r: return r
     patient_id = session["user_id"]
+    audit.record(app, patient_id=patient_id)
     conn = db()
-    patient = conn.execute("SELECT * FROM patients WHERE id=?", (patient_id,)).fetchone()
+    qc = cache.get_cache(app)
+    patient = cached_query(("patients",), "SELECT * FROM patients WHERE id=?", (patient_id,), one=True)
 
-    my_orders = conn.execute("""
-        SELECT o.*, d.name AS doctor_name, d.category AS doctor_specialty
-        FROM orders o
-        JOIN staff d ON d.id = o.doctor_id
-        WHERE o.patient_id = ?
-        ORDER BY o.id DESC
-        LIMIT 300
-    """, (patient_id,)).fetchall()
+    my_orders = queries.patient_orders(conn, qc, patient_id)
+    my_assignments = queries.patient_assignments(conn, qc, patient_id)
+    my_reports = queries.patient_reports(conn, qc, patient_id)
+    notifications = queries.patient_notifications(conn, qc, patient_id)
 
-    my_assignments = conn.execute("""
-        SELECT a.*, d.name AS doctor_name, s.name AS assignee_name, s.role AS assignee_role
-        FROM assignments a
-        JOIN staff d ON d.id=a.doctor_id
-        JOIN staff s ON s.id=a.assignee_staff_id
-        WHERE a.patient_id=?
-        ORDER BY a.id DESC
-        LIMIT 300
-    """, (patient_id,)).fetchall()
-
-    my_reports = conn.execute("""
-        SELECT r.*, s.name AS staff_name, s.role AS staff_role
-        FROM reports r
-        JOIN staff s ON s.id=r.created_by_staff_id
-        WHERE r.patient_id=?
-        ORDER BY r.id DESC
-        LIMIT 300
-    """, (patient_id,)).fetchall()
-
-    notifications = conn.execute("""
-        SELECT * FROM patient_notifications
-        WHERE patient_id=?
-        ORDER BY id DESC
-        LIMIT 50
-    """, (patient_id,)).fetchall()
-
-    conn.close()
     return render_template(
         "patient_dashboard.html",
         title="Patient Dashboard",
@@ -591,11 +838,189 @@ def patient_mark_notification_read(notif_id):
     r = require_role("patient")
     if r: return r
     patient_id = session["user_id"]
-    conn = db()
-    conn.execute("UPDATE patient_notifications SET is_read=1 WHERE id=? AND patient_id=?", (notif_id, patient_id))
-    conn.commit()
-    conn.close()
+    n = writer.execute(app, "UPDATE patient_notifications SET is_read=1 WHERE id=? AND patient_id=? AND is_read=0",
+                       (notif_id, patient_id))
+    if n:
+        invalidate(f"notifications:patient:{patient_id}")
+        events.mark_read(app, events.patient_channel(patient_id), n)
     return redirect(url_for("patient_dashboard"))
 
+@app.post("/patient/notifications/mark-all-read")
+def patient_mark_all_notifications_read():
+    r = require_role("patient")
+    if r: return r
+    patient_id = session["user_id"]
+    n = writer.execute(app, "UPDATE patient_notifications SET is_read=1 WHERE patient_id=? AND is_read=0",
+                       (patient_id,))
+    if n:
+        invalidate(f"notifications:patient:{patient_id}")
+        events.mark_read(app, events.patient_channel(patient_id), n)
+    return redirect(url_for("patient_dashboard"))
+
+# ---------------- Patient timeline ----------------
+STREAM_BUFFER = 40    # template pieces per write of a streamed page
+
+def stream_page(template_name, **context):
+    """Like flask.stream_template, but sends STREAM_BUFFER pieces per write."""
+    # The session cookie goes out with the headers, before base.html would
+    # pop the flashed messages; pop them now so they are not shown twice.
+    get_flashed_messages()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+def timeline_page(patient, back_url):
+    pool = database.get_pool(app)
+    entries = timeline.iter_timeline(pool.acquire, pool.release, patient["id"], archive.archive_dir(app))
+    database.release_db()  # the stream checks out a connection per chunk
+    return stream_page("patient_timeline.html", title="Timeline", patient=patient, entries=entries,
+                       back_url=back_url)
+
+@app.get("/doctor/patient/<int:patient_id>/timeline")
+def doctor_patient_timeline(patient_id):
+    r = require_staff_role("doctor")
+    if r: return r
+    patient = cached_query(("patients",), "SELECT * FROM patients WHERE id=?", (patient_id,), one=True)
+    if not patient:
+        flash("Patient not found")
+        return redirect(url_for("doctor_dashboard"))
+    audit.record(app, patient_id=patient_id)
+    return timeline_page(patient, url_for("doctor_view_patient", patient_id=patient_id))
+
+@app.get("/patient/timeline")
+def patient_timeline():
+    r = require_role("patient")
+    if r: return r
+    patient = cached_query(("patients",), "SELECT * FROM patients WHERE id=?", (session["user_id"],), one=True)
+    if not patient:
+        # The account was deleted while this session was still signed in.
+        session.clear()
+        flash("Patient not found")
+        return redirect(url_for("patient_login"))
+    audit.record(app, patient_id=session["user_id"])
+    return timeline_page(patient, url_for("patient_dashboard"))
+
+# ---------------- JSON API (v1) ----------------
+@app.errorhandler(api.BadRequest)
+def api_bad_request(e):
+    return api.error(400, str(e))
+
+def api_patient_access(patient_id):
+    # Any staff member, or the patient themselves.
+    role = session.get("role")
+    if not role:
+        return api.error(401, "login required")
+    if role == "patient" and session.get("user_id") != patient_id:
+        return api.error(403, "access denied")
+    return None
+
+def api_patient_version(patient_id):
+    """(version, None), or (None, response) for a 404 or a 304."""
+    version = api.patient_version(db(), patient_id)
+    if version is None:
+        return None, api.error(404, "patient not found")
+    not_modified = api.not_modified(version)
+    if not_modified is not None:
+        return None, not_modified
+    api.sync_cache(cache.get_cache(app), patient_id, version)
+    return version, None
+
+@app.get("/api/v1/patients/<int:patient_id>")
+def api_patient(patient_id):
+    r = api_patient_access(patient_id)
+    if r: return r
+    audit.record(app, patient_id=patient_id)
+    version, r = api_patient_version(patient_id)
+    if r: return r
+    row = db().execute("SELECT * FROM patients WHERE id=?", (patient_id,)).fetchone()
+    return api.respond(api.project([row], api.fields("patient", primary=True))[0], version)
+
+@app.get("/api/v1/patients/<int:patient_id>/history")
+def api_patient_history(patient_id):
+    r = api_patient_access(patient_id)
+    if r: return r
+    audit.record(app, patient_id=patient_id)
+    include = [k.strip() for k in request.args.get("include", ",".join(api.HISTORY)).split(",") if k.strip()]
+    if any(k not in api.HISTORY for k in include):
+        raise api.BadRequest(f"include must be among: {', '.join(api.HISTORY)}")
+    _, limit = api.page_params()
+    version, r = api_patient_version(patient_id)
+    if r: return r
+    conn = db()
+    qc = cache.get_cache(app)
+    row = conn.execute("SELECT * FROM patients WHERE id=?", (patient_id,)).fetchone()
+    body = {"patient": api.project([row], api.fields("patient"))[0]}
+    for kind in include:
+        page = queries.PATIENT_HISTORY[kind](conn, qc, patient_id, pagination.FIRST_CURSOR, limit)
+        body[kind] = api.page_body(page, kind)
+    return api.respond(body, version)
+
+@app.get("/api/v1/patients/<int:patient_id>/<any(orders, assignments, reports):kind>")
+def api_patient_list(patient_id, kind):
+    r = api_patient_access(patient_id)
+    if r: return r
+    audit.record(app, patient_id=patient_id)
+    before, limit = api.page_params()
+    version, r = api_patient_version(patient_id)
+    if r: return r
+    page = queries.PATIENT_HISTORY[kind](db(), cache.get_cache(app), patient_id, before, limit)
+    return api.respond(api.page_body(page, kind, primary=True), version)
+
+@app.get("/api/v1/me/tickets")
+def api_my_tickets():
+    if session.get("role") not in ("nurse", "radiologist"):
+        return api.error(403 if session.get("role") else 401, "nurses and radiologists only")
+    before, limit = api.page_params()
+    page = queries.assignee_tickets(db(), cache.get_cache(app), session["user_id"], before, limit)
+    return api.respond(api.page_body(page, "tickets", primary=True))
+
+@app.get("/api/v1/me/notifications")
+def api_my_notifications():
+    role = session.get("role")
+    if not role:
+        return api.error(401, "login required")
+    before, limit = api.page_params()
+    lookup = queries.patient_notifications if role == "patient" else queries.staff_notifications
+    page = lookup(db(), cache.get_cache(app), session["user_id"], before, limit)
+    return api.respond(api.page_body(page, "notifications", primary=True))
+
+# ---------------- Live events ----------------
+@app.get("/events")
+def event_stream():
+    role = session.get("role")
+    user_id = session.get("user_id")
+    if not role or not user_id:
+        return Response(status=401)
+    if role == "patient":
+        channel = events.patient_channel(user_id)
+        count_sql = """SELECT COALESCE((SELECT unread_notifications FROM patient_counters WHERE patient_id=?1), 0),
+                              (SELECT MAX(id) FROM patient_notifications WHERE patient_id=?1)"""
+    else:
+        channel = events.staff_channel(user_id)
+        count_sql = """SELECT COALESCE((SELECT unread_notifications FROM staff_counters WHERE staff_id=?1), 0),
+                              (SELECT MAX(id) FROM notifications WHERE staff_id=?1)"""
+
+    # Only the first stream per user (per process, per UNREAD_TTL_SECONDS) touches the database.
+    unread = app.extensions["unread_counts"].get(
+        channel, lambda: tuple(db().execute(count_sql, (user_id,)).fetchone())
+    )
+    subscription = app.extensions["broker"].subscribe(channel)
+    first_event = {"type": "unread", "unread": unread}
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # serve.py offers to hand the connection to its StreamHub once this
+    # response is written, so the stream holds neither a thread nor a slot.
+    detach = request.environ.get("hospital.detach_stream")
+    if detach is not None:
+        if not detach(subscription):
+            subscription.close()
+            return Response("Too many open event streams", status=503, headers={"Retry-After": "30"})
+        # An iterable, not a string: no Content-Length, the body goes on.
+        return Response([events.opening(first_event)], mimetype="text/event-stream", headers=headers)
+    # Not wrapped in stream_with_context: the pooled connection goes back at
+    # teardown instead of being held for the life of the stream.
+    return Response(events.stream(subscription, first_event), mimetype="text/event-stream", headers=headers)
+
 if __name__ == "__main__":
+    # Development server; production runs `python serve.py`.
     app.run(debug=True)
@@ -0,0 +1,418 @@
+"""Retention tiering: old, settled rows move to monthly archive databases.
+
+    python archive.py run --days 180          # one pass, then exit
+    python archive.py purge                   # drop archived rows of deleted patients / staff
+    python archive.py status                  # what is archived where
+
+Read notifications and completed assignments older than ARCHIVE_AFTER_DAYS
+are moved to archive/<YYYY-MM>.db (by created_at), one table per source
+table. A batch is first copied into the month's file, which takes no lock
+on the main database, and then deleted from main in a short transaction
+that also updates the catalog (migration 0009). A crash between the two
+steps leaves the rows in both places; the next pass finishes the move.
+
+History queries (queries.py) read through: when a page can contain
+archived rows, the month files are ATTACHed to the request's connection
+and their rows merged into the keyset page, so "load more" walks from the
+hot table into the archive without the user noticing. Archived rows are
+read-only; dashboards that list open work never see them.
+
+Deleting a patient or staff member cannot cascade into the month files, so
+triggers queue the deletion in archive_purge (migration 0014) and purge()
+removes their archived rows from every month. The admin delete routes
+purge right away; every archiving pass, and `python archive.py purge`,
+finishes anything left in the queue.
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from flask import current_app
+import cache
+import database
+import migrate
+
+APP_DIR = Path(__file__).parent
+
+DEFAULTS = {
+    "ARCHIVE_AFTER_DAYS": None,      # None: no background archiving
+    "ARCHIVE_DIR": None,             # default: archive/ next to the database
+    "ARCHIVE_BATCH": 500,            # rows per delete transaction
+    "ARCHIVE_PAUSE_SECONDS": 0.05,   # between batches, so request writes get the lock
+    "ARCHIVE_INTERVAL_SECONDS": 3600.0,
+}
+
+# table -> (owner column, which rows may move, cache tags of a moved row)
+TABLES = {
+    "assignments": ("patient_id", "status = 'Completed'",
+                    lambda r: (f"patient:{r['patient_id']}", "assignments",
+                               f"assignments:doctor:{r['doctor_id']}",
+                               f"assignments:assignee:{r['assignee_staff_id']}")),
+    "notifications": ("staff_id", "is_read = 1",
+                      lambda r: (f"notifications:staff:{r['staff_id']}",)),
+    "patient_notifications": ("patient_id", "is_read = 1",
+                              lambda r: (f"notifications:patient:{r['patient_id']}",)),
+}
+
+# who was deleted -> {archived table: columns that reference them}
+REFERENCES = {
+    "patient": {"assignments": ("patient_id",), "patient_notifications": ("patient_id",)},
+    "staff": {"assignments": ("doctor_id", "assignee_staff_id"), "notifications": ("staff_id",)},
+}
+MONTH_FILES = "[0-9][0-9][0-9][0-9]-[0-9][0-9].db"
+
+log = logging.getLogger(__name__)
+
+def archive_dir(app):
+    return Path(app.config["ARCHIVE_DIR"] or Path(app.config["DATABASE"]).parent / "archive")
+
+def _schema(month):
+    return "archive_" + month.replace("-", "_")
+
+def attach(conn, directory, month, create=False):
+    """ATTACH archive/<month>.db to conn; returns its schema name, or None if missing."""
+    schema = _schema(month)
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if schema in attached:
+        return schema
+    path = Path(directory) / f"{month}.db"
+    if not create and not path.exists():
+        return None
+    archives = [name for name in attached if name.startswith("archive_")]
+    if len(archives) >= conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - 1:
+        # Out of ATTACH slots: start over with the month being asked for.
+        for name in archives:
+            conn.execute(f"DETACH DATABASE {name}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+    if create:
+        conn.execute(f"PRAGMA {schema}.journal_mode = WAL")
+    return schema
+
+def _ensure_table(conn, schema, table, owner):
+    # Same columns as main, without constraints (parents live in main).
+    columns = [(r[1], r[2]) for r in conn.execute(f"PRAGMA main.table_info({table})")]
+    have = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+    if not have:
+        defs = ", ".join(f"{name} {type_}" + (" PRIMARY KEY" if name == "id" else "")
+                         for name, type_ in columns)
+        conn.execute(f"CREATE TABLE {schema}.{table} ({defs})")
+        conn.execute(f"CREATE INDEX {schema}.idx_{table}_{owner} ON {table}({owner}, id)")
+    for name, type_ in columns:
+        if have and name not in have:
+            conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {name} {type_}")
+    return [name for name, _ in columns]
+
+def _candidates(conn, table, eligible, cutoff, after, batch):
+    # Walk the rowid upwards; ids follow created_at, so the first eligible
+    # row newer than the cutoff ends the pass.
+    rows = conn.execute(
+        f"SELECT id, created_at FROM main.{table} NOT INDEXED WHERE id > ? AND {eligible} ORDER BY id LIMIT ?",
+        (after, batch)).fetchall()
+    picked = [(r[0], r[1][:7]) for r in rows if r[1] < cutoff]
+    done = len(rows) < batch or len(picked) < len(rows)
+    return picked, (rows[-1][0] if rows else after), done
+
+def _move(conn, directory, table, month, ids):
+    """Copy ids into the month's archive, then delete them from main."""
+    owner, eligible, _ = TABLES[table]
+    schema = attach(conn, directory, month, create=True)
+    columns = ", ".join(_ensure_table(conn, schema, table, owner))
+    marks = ",".join("?" * len(ids))
+    conn.execute("BEGIN")
+    try:
+        # REPLACE: a copy left by an interrupted move may be out of date.
+        conn.execute(f"INSERT OR REPLACE INTO {schema}.{table} ({columns}) "
+                     f"SELECT {columns} FROM main.{table} WHERE id IN ({marks}) AND {eligible}", ids)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Only rows that are still eligible and safely in the archive go.
+        moved = conn.execute(
+            f"DELETE FROM main.{table} WHERE id IN ({marks}) AND {eligible} "
+            f"AND id IN (SELECT id FROM {schema}.{table} WHERE id IN ({marks})) RETURNING *",
+            (*ids, *ids)).fetchall()
+        if moved:
+            got = [r["id"] for r in moved]
+            conn.execute("""
+                INSERT INTO archive_months (tbl, month, min_id, max_id, rows) VALUES (?,?,?,?,?)
+                ON CONFLICT(tbl, month) DO UPDATE SET min_id = MIN(min_id, excluded.min_id),
+                    max_id = MAX(max_id, excluded.max_id), rows = rows + excluded.rows
+            """, (table, month, min(got), max(got), len(got)))
+            owners = defaultdict(list)
+            for r in moved:
+                owners[r[owner]].append(r["id"])
+            conn.executemany("""
+                INSERT INTO archive_index (tbl, owner_id, min_id, max_id, rows) VALUES (?,?,?,?,?)
+                ON CONFLICT(tbl, owner_id) DO UPDATE SET min_id = MIN(min_id, excluded.min_id),
+                    max_id = MAX(max_id, excluded.max_id), rows = rows + excluded.rows
+            """, [(table, o, min(v), max(v), len(v)) for o, v in owners.items()])
+        # Copies of rows deleted from main since the first step (their patient
+        # or staff member was deleted) must not outlive them in the archive.
+        conn.execute(
+            f"DELETE FROM {schema}.{table} WHERE id IN ({marks}) "
+            f"AND id NOT IN (SELECT id FROM main.{table} WHERE id IN ({marks})) "
+            f"AND id NOT IN ({','.join('?' * len(moved))})",
+            (*ids, *ids, *(r["id"] for r in moved)))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return moved, time.perf_counter() - started
+
+def run(conn, directory, days, batch=500, pause=0.05, on_batch=None, stop=None):
+    """One archiving pass over every table; returns {table: rows moved}.
+
+    conn must be in autocommit mode (isolation_level=None). on_batch(table,
+    rows, lock_seconds) is called after every delete transaction.
+    """
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - days * 86400))
+    totals = {}
+    for table, (owner, eligible, _) in TABLES.items():
+        totals[table] = 0
+        after, done = 0, False
+        while not done and not (stop and stop.is_set()):
+            picked, after, done = _candidates(conn, table, eligible, cutoff, after, batch)
+            by_month = defaultdict(list)
+            for row_id, month in picked:
+                by_month[month].append(row_id)
+            for month, ids in sorted(by_month.items()):
+                moved, held = _move(conn, directory, table, month, ids)
+                totals[table] += len(moved)
+                if on_batch:
+                    on_batch(table, moved, held)
+            if picked and not done:
+                time.sleep(pause)
+    return totals
+
+def purge(conn, directory):
+    """Delete archived rows of everyone queued in archive_purge; returns rows removed.
+
+    conn must be in autocommit mode. Queue entries are dropped only after
+    every month file is clean, so an interrupted purge is finished by the
+    next one.
+    """
+    queued = conn.execute("SELECT kind, owner_id FROM archive_purge").fetchall()
+    if not queued:
+        return 0
+    removed = 0
+    for path in sorted(Path(directory).glob(MONTH_FILES)):
+        month = path.stem
+        schema = attach(conn, directory, month)
+        tables = {r[0] for r in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'")}
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, owner_id in queued:
+                for table, columns in REFERENCES[kind].items():
+                    if table not in tables:
+                        continue
+                    n = conn.execute(f"DELETE FROM {schema}.{table} WHERE "
+                                     + " OR ".join(f"{c} = ?" for c in columns),
+                                     (owner_id,) * len(columns)).rowcount
+                    if n:
+                        conn.execute("UPDATE archive_months SET rows = MAX(rows - ?, 0) WHERE tbl = ? AND month = ?",
+                                     (n, table, month))
+                        removed += n
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for kind, owner_id in queued:
+            for table, columns in REFERENCES[kind].items():
+                if TABLES[table][0] in columns:
+                    conn.execute("DELETE FROM archive_index WHERE tbl = ? AND owner_id = ?", (table, owner_id))
+        conn.executemany("DELETE FROM archive_purge WHERE kind = ? AND owner_id = ?", queued)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return removed
+
+def purge_deleted(app):
+    """purge() on a connection of its own; the admin delete routes call it."""
+    conn = database.get_pool(app).connect()
+    conn.isolation_level = None
+    try:
+        return purge(conn, archive_dir(app))
+    except Exception:
+        log.exception("archive purge failed; the next archiving pass retries it")
+        return 0
+    finally:
+        conn.close()
+
+def read_through(conn, query_cache, page, table, owner_id, sql, params, tags):
+    """Merge archived rows of `table` into a keyset page read from main.
+
+    `sql` is the page's statement with `{table}` in place of the table
+    name. Returns `page` itself unless the catalog says archived rows of
+    this owner can fall inside it.
+    """
+    floor = page.rows[-1]["id"] if page.next_cursor is not None else 0
+    months = sorted(conn.execute("""
+        SELECT m.month, m.max_id FROM archive_index i
+        JOIN archive_months m ON m.tbl = i.tbl
+        WHERE i.tbl = ? AND i.owner_id = ? AND i.min_id < ? AND i.max_id > ?
+          AND m.min_id < ? AND m.max_id > ? AND m.min_id <= i.max_id AND m.max_id >= i.min_id
+    """, (table, owner_id, page.before, floor, page.before, floor)), key=lambda m: m[1], reverse=True)
+    if not months or conn.in_transaction:    # ATTACH is not allowed inside a transaction
+        return page
+    directory = archive_dir(current_app)
+    limit = page.limit
+
+    def load():
+        rows = {r["id"]: r for r in page.rows}
+        for month, max_id in months:
+            ordered = sorted(rows, reverse=True)
+            if len(ordered) > limit and ordered[limit] > max_id:
+                break    # nothing in this or any older month can make the page
+            schema = attach(conn, directory, month)
+            if schema is None:
+                log.warning("archive %s is missing from %s", month, directory)
+                continue
+            for r in conn.execute(sql.format(table=f"{schema}.{table}"), (*params, page.before, limit + 1)):
+                rows.setdefault(r["id"], r)    # a row mid-move: main's copy wins
+        return [rows[i] for i in sorted(rows, reverse=True)[:limit + 1]]
+
+    if query_cache is None:
+        rows = load()
+    else:
+        rows = query_cache.get_or_load(("archive", sql, params, page.before, limit, floor), tags, load)
+    more = page.next_cursor is not None or len(rows) > limit
+    rows = rows[:limit]
+    page.rows = rows
+    page.next_cursor = rows[-1]["id"] if more else None
+    return page
+
+class Archiver:
+    """Background thread running a pass every ARCHIVE_INTERVAL_SECONDS."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {"passes": 0, "batches": 0, "rows": defaultdict(int),
+                       "max_lock_ms": 0.0, "last_lock_ms": 0.0, "last_pass": None}
+        self._thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+        self._thread.start()
+
+    def _on_batch(self, table, moved, held):
+        tag_of = TABLES[table][2]
+        cache.get_cache(self.app).invalidate(*{t for r in moved for t in tag_of(r)})
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["rows"][table] += len(moved)
+            self._stats["last_lock_ms"] = round(held * 1000, 3)
+            self._stats["max_lock_ms"] = max(self._stats["max_lock_ms"], self._stats["last_lock_ms"])
+
+    def _run(self):
+        config = self.app.config
+        while not self._stop.is_set():
+            try:
+                conn = database.get_pool(self.app).connect()
+                conn.isolation_level = None
+                try:
+                    if purge(conn, archive_dir(self.app)):
+                        cache.get_cache(self.app).clear()
+                    run(conn, archive_dir(self.app), config["ARCHIVE_AFTER_DAYS"],
+                        batch=config["ARCHIVE_BATCH"], pause=config["ARCHIVE_PAUSE_SECONDS"],
+                        on_batch=self._on_batch, stop=self._stop)
+                finally:
+                    conn.close()
+                with self._lock:
+                    self._stats["passes"] += 1
+                    self._stats["last_pass"] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+            except Exception:
+                log.exception("archive pass failed")
+            self._stop.wait(config["ARCHIVE_INTERVAL_SECONDS"])
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "rows": dict(self._stats["rows"])}
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    @app.before_request
+    def _start_archiver():
+        get_archiver(app)
+
+def get_archiver(app):
+    if app.config["ARCHIVE_AFTER_DAYS"] is None:
+        return None
+    archiver = app.extensions.get("archiver")
+    if archiver is None:
+        with _lock:
+            archiver = app.extensions.get("archiver")
+            if archiver is None:
+                archiver = app.extensions["archiver"] = Archiver(app)
+    return archiver
+
+def stats(app, conn):
+    archiver = get_archiver(app)
+    return {
+        "after_days": app.config["ARCHIVE_AFTER_DAYS"],
+        "archived": dict(conn.execute("SELECT tbl, SUM(rows) FROM archive_months GROUP BY tbl").fetchall()),
+        "archiver": archiver.stats() if archiver else None,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("run", "purge", "status"))
+    parser.add_argument("--db", default=str(APP_DIR / "hospital.db"))
+    parser.add_argument("--dir", help="archive directory (default: archive/ next to --db)")
+    parser.add_argument("--days", type=float, default=180, help="archive rows older than this")
+    parser.add_argument("--batch", type=int, default=DEFAULTS["ARCHIVE_BATCH"])
+    parser.add_argument("--pause", type=float, default=DEFAULTS["ARCHIVE_PAUSE_SECONDS"])
+    args = parser.parse_args(argv)
+    directory = Path(args.dir or Path(args.db).parent / "archive")
+
+    migrate.upgrade_path(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=5)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    try:
+        if args.command in ("run", "purge"):
+            print(f"{purge(conn, directory):,} archived rows of deleted patients and staff removed")
+        if args.command == "run":
+            locks = []
+            totals = run(conn, directory, args.days, args.batch, args.pause,
+                         on_batch=lambda table, moved, held: locks.append(held))
+            for table, rows in totals.items():
+                print(f"{table:<22} {rows:>10,} rows archived")
+            if locks:
+                print(f"{len(locks)} batches, write lock held max {max(locks) * 1000:.1f} ms, "
+                      f"mean {sum(locks) / len(locks) * 1000:.1f} ms")
+            return 0
+        if args.command == "purge":
+            return 0
+        for table in TABLES:
+            hot = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            print(f"{table}: {hot:,} rows in main")
+            for r in conn.execute("SELECT month, rows, min_id, max_id FROM archive_months WHERE tbl = ? "
+                                  "ORDER BY month", (table,)):
+                exists = "" if (directory / f"{r['month']}.db").exists() else "  (file missing)"
+                print(f"  {r['month']}  {r['rows']:>10,} rows  ids {r['min_id']}..{r['max_id']}{exists}")
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
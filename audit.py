@@ -0,0 +1,322 @@
+"""Access log for patient records, kept in a separate audit database.
+
+    python audit.py patient 42                     # who opened patient 42's record and files
+    python audit.py staff 7 --since 2026-01-01     # what staff member 7 opened
+    python audit.py stats
+
+Routes that show a patient's record call record(). That puts a tuple on a
+bounded in-memory queue and returns. A background thread writes whatever
+has queued to audit.db every AUDIT_FLUSH_SECONDS, one transaction per
+batch, so the clinical database's write lock is never involved. When
+the queue is full, the request that finds it full writes the batch itself.
+Under a burst, requests slow down rather than lose records. While audit.db
+cannot be written, the queue stays at AUDIT_QUEUE records: newer ones are
+dropped, counted in stats() and logged, rather than held until memory runs
+out. The queue is
+flushed when the process exits (serve.py workers flush before stopping).
+A hard crash loses at most the last AUDIT_FLUSH_SECONDS of records, never
+part of a batch.
+
+Uploaded files are logged by name and content hash. Lookups by patient
+match them against that patient's reports when querying, not on the request path.
+"""
+import argparse
+import atexit
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from flask.globals import request_ctx
+
+APP_DIR = Path(__file__).parent
+
+DEFAULTS = {
+    "AUDIT_ENABLED": True,
+    "AUDIT_DB": None,                 # default: audit.db next to the database
+    "AUDIT_QUEUE": 10_000,            # records held in memory before requests write them themselves
+    "AUDIT_BATCH": 1000,              # rows per transaction
+    "AUDIT_FLUSH_SECONDS": 1.0,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS access_log (
+  id INTEGER PRIMARY KEY,
+  at TEXT NOT NULL,           -- UTC, like datetime('now')
+  actor TEXT,                 -- staff / patient; NULL when not signed in
+  actor_id INTEGER,
+  actor_role TEXT,
+  action TEXT NOT NULL,       -- the route's endpoint
+  patient_id INTEGER,
+  resource TEXT,              -- uploads: the file name
+  blob TEXT,                  -- uploads: the file's content hash (blobs.sha256)
+  ip TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_access_patient ON access_log(patient_id, at) WHERE patient_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_access_actor ON access_log(actor, actor_id, at);
+CREATE INDEX IF NOT EXISTS idx_access_blob ON access_log(blob, at) WHERE blob IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_access_resource ON access_log(resource, at) WHERE resource IS NOT NULL;
+"""
+INSERT = """
+    INSERT INTO access_log (at, actor, actor_id, actor_role, action, patient_id, resource, blob, ip)
+    VALUES (strftime('%Y-%m-%d %H:%M:%S', ?, 'unixepoch'), ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+QUERY_LIMIT = 100
+DROP_LOG_SECONDS = 60    # at most one warning per minute while records are dropped
+
+log = logging.getLogger(__name__)
+
+def connect(path):
+    conn = sqlite3.connect(str(path), isolation_level=None, timeout=5, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")    # serve.py workers share the file
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = FULL")     # one fsync per batch
+    conn.executescript(SCHEMA)
+    return conn
+
+class AuditLog:
+    """Bounded queue of access records and the thread that writes them out."""
+
+    def __init__(self, path, queue_size=10_000, batch=1000, interval=1.0):
+        self.path = str(path)
+        self.queue_size = queue_size
+        self.batch = batch
+        self.interval = interval
+        self.pid = os.getpid()
+        # append() and popleft() are atomic; the bound is checked by record().
+        self._queue = deque()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._conn = None
+        self.written = 0
+        self.batches = 0
+        self.backpressure = 0          # records whose request had to flush first
+        self.failures = 0
+        self.dropped = 0               # records lost because audit.db failed with the queue full
+        self._drop_logged_at = float("-inf")
+        self.failed_at = float("-inf")    # while the database fails, only the thread retries
+        self.max_flush_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="audit", daemon=True)
+        self._thread.start()
+
+    def record(self, row):
+        if len(self._queue) >= self.queue_size:
+            if time.monotonic() - self.failed_at > self.interval:
+                self.backpressure += 1
+                try:
+                    self.flush()
+                except Exception:
+                    pass    # logged by _write; the rows went back on the queue
+            if len(self._queue) >= self.queue_size:
+                # audit.db is failing: drop this one rather than fail the request.
+                self._drop(1)
+                return
+        self._queue.append(row)
+
+    def _drop(self, count):
+        self.dropped += count
+        now = time.monotonic()
+        if now - self._drop_logged_at > DROP_LOG_SECONDS:
+            self._drop_logged_at = now
+            log.error("audit queue full and %s not writable: %d records dropped so far", self.path, self.dropped)
+
+    def flush(self):
+        """Write everything queued so far; returns the number of rows."""
+        with self._flush_lock:
+            total, pending = 0, len(self._queue)    # not what arrives meanwhile
+            while total < pending:
+                rows = []
+                try:
+                    while len(rows) < min(self.batch, pending - total):
+                        rows.append(self._queue.popleft())
+                except IndexError:
+                    pass
+                if not rows:
+                    break
+                self._write(rows)
+                total += len(rows)
+            return total
+
+    def _write(self, rows):
+        started = time.perf_counter()
+        try:
+            if self._conn is None:
+                self._conn = connect(self.path)
+            with self._conn:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(INSERT, rows)
+        except Exception:
+            # Back at the front of the queue for the next flush.
+            self.failures += 1
+            self.failed_at = time.monotonic()
+            log.exception("audit flush of %d records failed", len(rows))
+            self._queue.extendleft(reversed(rows))
+            # Records that arrived meanwhile may have taken the room; keep the oldest.
+            excess = len(self._queue) - self.queue_size
+            if excess > 0:
+                for _ in range(excess):
+                    self._queue.pop()
+                self._drop(excess)
+            raise
+        self.written += len(rows)
+        self.batches += 1
+        self.max_flush_ms = max(self.max_flush_ms, round((time.perf_counter() - started) * 1000, 3))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                pass    # logged by _write; retried next interval
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.flush()
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "queued": len(self._queue),
+            "written": self.written,
+            "batches": self.batches,
+            "backpressure": self.backpressure,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+def audit_path(app):
+    return Path(app.config["AUDIT_DB"] or Path(app.config["DATABASE"]).parent / "audit.db")
+
+def get_log(app):
+    # Built per process on first use; one inherited across fork belongs to the parent.
+    audit_log = app.extensions.get("audit_log")
+    if audit_log is None or audit_log.pid != os.getpid():
+        with _lock:
+            audit_log = app.extensions.get("audit_log")
+            if audit_log is None or audit_log.pid != os.getpid():
+                config = app.config
+                audit_log = AuditLog(audit_path(app), config["AUDIT_QUEUE"], config["AUDIT_BATCH"],
+                                     config["AUDIT_FLUSH_SECONDS"])
+                app.extensions["audit_log"] = audit_log
+                atexit.register(audit_log.close)
+    return audit_log
+
+def record(app, patient_id=None, resource=None, blob=None):
+    """Log that the signed-in user (if any) is opening this request's endpoint. Call inside a request."""
+    if not app.config["AUDIT_ENABLED"]:
+        return
+    # Through the request context once: every session / request proxy lookup costs.
+    ctx = request_ctx._get_current_object()
+    sess, req = ctx.session, ctx.request
+    role = sess.get("role")
+    actor = None if role is None else "patient" if role == "patient" else "staff"
+    get_log(app).record((time.time(), actor, sess.get("user_id"), role, req.endpoint, patient_id,
+                         resource, blob, req.remote_addr))
+
+def close(app):
+    audit_log = app.extensions.get("audit_log")
+    if audit_log is not None and audit_log.pid == os.getpid():
+        audit_log.close()
+
+def stats(app):
+    audit_log = app.extensions.get("audit_log")
+    return audit_log.stats() if audit_log is not None and audit_log.pid == os.getpid() else None
+
+def _range(since, until):
+    where, params = "", []
+    if since is not None:
+        where += " AND at >= ?"
+        params.append(since)
+    if until is not None:
+        where += " AND at < ?"
+        params.append(until)
+    return where, params
+
+def by_staff(conn, staff_id, since=None, until=None, limit=QUERY_LIMIT):
+    where, params = _range(since, until)
+    return conn.execute(f"""
+        SELECT * FROM access_log WHERE actor = 'staff' AND actor_id = ?{where}
+        ORDER BY at DESC LIMIT ?
+    """, (staff_id, *params, limit)).fetchall()
+
+def by_patient(conn, clinical, patient_id, since=None, until=None, limit=QUERY_LIMIT):
+    """Accesses to the patient's record pages and to the files in their reports, newest first."""
+    files = clinical.execute(
+        "SELECT blob_sha256, image_filename FROM reports WHERE patient_id = ? AND image_filename IS NOT NULL",
+        (patient_id,)).fetchall()
+    blobs = sorted({f[0] for f in files if f[0]})
+    names = sorted({f[1] for f in files if not f[0]})    # uploaded before the blob store
+    where, params = _range(since, until)
+    rows = []
+    for column, values in (("patient_id", [patient_id]), ("blob", blobs), ("resource", names)):
+        # One indexed range per value, each already newest first.
+        for value in values:
+            rows += conn.execute(f"""
+                SELECT * FROM access_log WHERE {column} = ?{where} ORDER BY at DESC LIMIT ?
+            """, (value, *params, limit)).fetchall()
+    rows.sort(key=lambda r: (r["at"], r["id"]), reverse=True)
+    return rows[:limit]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("patient", "staff", "stats"))
+    parser.add_argument("id", type=int, nargs="?")
+    parser.add_argument("--db", default=str(APP_DIR / "hospital.db"))
+    parser.add_argument("--audit-db", help="default: audit.db next to --db")
+    parser.add_argument("--since", help="YYYY-MM-DD[ HH:MM:SS], UTC")
+    parser.add_argument("--until", help="YYYY-MM-DD[ HH:MM:SS], UTC, exclusive")
+    parser.add_argument("--limit", type=int, default=QUERY_LIMIT)
+    args = parser.parse_args(argv)
+    if args.command != "stats" and args.id is None:
+        parser.error(f"{args.command} needs an id")
+
+    path = Path(args.audit_db or Path(args.db).parent / "audit.db")
+    if not path.exists():
+        parser.error(f"no audit database at {path}")
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        if args.command == "stats":
+            count, first, last = conn.execute("SELECT COUNT(*), MIN(at), MAX(at) FROM access_log").fetchone()
+            print(f"{path}: {count:,} accesses" + (f", {first} .. {last} UTC" if count else ""))
+            for row in conn.execute("SELECT action, COUNT(*) FROM access_log GROUP BY action ORDER BY 2 DESC"):
+                print(f"  {row[0]:<28} {row[1]:>10,}")
+            return 0
+        if args.command == "staff":
+            rows = by_staff(conn, args.id, args.since, args.until, args.limit)
+        else:
+            clinical = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+            try:
+                rows = by_patient(conn, clinical, args.id, args.since, args.until, args.limit)
+            finally:
+                clinical.close()
+        for row in rows:
+            who = f"{row['actor_role']} {row['actor_id']}" if row["actor"] else "anonymous"
+            what = row["resource"] or f"patient {row['patient_id']}"
+            print(f"{row['at']}  {who:<18} {row['action']:<24} {what:<40} {row['ip'] or ''}")
+        print(f"{len(rows)} accesses" + (" (--limit reached)" if len(rows) == args.limit else ""))
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""Online backups and the read-only reporting snapshot.
+
+    python backup.py backup                   # backups/<timestamp>/ next to the db
+    python backup.py snapshot                 # refresh snapshot.db now
+
+Both copy the live database with the sqlite3 backup API, BACKUP_STEP_PAGES
+pages per step with a short pause between steps, inside one read
+transaction on the source. The read transaction pins a single WAL
+snapshot, so the copy is consistent and never restarts because of
+concurrent writes, and writers are not blocked (checkpoints only wait for
+it to finish). Copies are written to a temporary file and renamed into
+place when complete.
+
+Exports read from the snapshot, which a background worker refreshes every
+SNAPSHOT_INTERVAL_SECONDS once reporting has been used, so long reads stay
+off the clinical database. Backup progress and snapshot lag are exported
+at /metrics.
+"""
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+import archive
+
+APP_DIR = Path(__file__).parent
+
+DEFAULTS = {
+    "BACKUP_DIR": None,                  # default: backups/ next to the database
+    "BACKUP_KEEP": 7,                    # newest backups kept
+    "BACKUP_INTERVAL_SECONDS": None,     # None: only on demand (admin dashboard, CLI)
+    "BACKUP_STEP_PAGES": 64,
+    "BACKUP_STEP_PAUSE_SECONDS": 0.01,   # between steps, so request threads get the CPU and disk
+    "SNAPSHOT_PATH": None,               # default: snapshot.db next to the database
+    "SNAPSHOT_INTERVAL_SECONDS": 300.0,  # None: reporting reads the live database
+}
+
+log = logging.getLogger(__name__)
+
+class Progress:
+    """State of the copy in flight and of the last finished one."""
+
+    def __init__(self):
+        self.running = False
+        self.pages_total = 0
+        self.pages_remaining = 0
+        self.started_at = None
+        self.finished_at = None
+        self.seconds = None
+        self.bytes = None
+        self.failures = 0
+
+    def __call__(self, status, remaining, total):
+        self.pages_remaining = remaining
+        self.pages_total = total
+
+    def stats(self):
+        done = self.pages_total - self.pages_remaining
+        return {
+            "running": int(self.running),
+            "pages_total": self.pages_total,
+            "pages_remaining": self.pages_remaining,
+            "progress": round(done / self.pages_total, 4) if self.pages_total else None,
+            "last_finished_at": self.finished_at,
+            "last_seconds": self.seconds,
+            "last_bytes": self.bytes,
+            "failures": self.failures,
+        }
+
+def copy(src_path, dest_path, pages=64, pause=0.01, progress=None):
+    """Copy a live database to dest_path step by step; returns the as-of time.
+
+    dest_path is replaced atomically and gets the as-of time (when the
+    source snapshot was taken) as its mtime.
+    """
+    dest_path = Path(dest_path)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest_path.with_name(f"{dest_path.name}.{os.getpid()}.tmp")    # workers may refresh at once
+    tmp.unlink(missing_ok=True)
+
+    def step(status, remaining, total):
+        if progress:
+            progress(status, remaining, total)
+        if remaining and pause:
+            time.sleep(pause)
+
+    src = sqlite3.connect(str(src_path), isolation_level=None, timeout=30)
+    dest = sqlite3.connect(str(tmp), isolation_level=None)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()    # pins the snapshot
+        as_of = time.time()
+        src.backup(dest, pages=pages, progress=step)
+        src.execute("COMMIT")
+        # A rollback-journal file opens read-only without -wal / -shm files.
+        dest.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dest.close()
+        src.close()
+    os.utime(tmp, (as_of, as_of))
+    os.replace(tmp, dest_path)
+    return as_of
+
+def backup_dir(app):
+    return Path(app.config["BACKUP_DIR"] or Path(app.config["DATABASE"]).parent / "backups")
+
+def snapshot_path(app):
+    return Path(app.config["SNAPSHOT_PATH"] or Path(app.config["DATABASE"]).parent / "snapshot.db")
+
+def backup(db_path, directory, archive_directory=None, keep=7, pages=64, pause=0.01, progress=None):
+    """Back up the database and its archive months to directory/<timestamp>/."""
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    target = Path(directory) / stamp
+    copy(db_path, target / Path(db_path).name, pages, pause, progress)
+    if archive_directory and Path(archive_directory).is_dir():
+        for month in sorted(Path(archive_directory).glob("*.db")):
+            copy(month, target / "archive" / month.name, pages, pause)
+    backups = sorted(p for p in Path(directory).iterdir() if p.is_dir() and not p.name.startswith("."))
+    for old in backups[:-keep] if keep else ():
+        shutil.rmtree(old, ignore_errors=True)
+    return target
+
+class Snapshot:
+    """One export's read-only connection to the snapshot file.
+
+    acquire/release fit bulk.iter_table; every chunk of the export reads
+    the same file even if the worker renames a fresh snapshot into place.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.as_of = self.path.stat().st_mtime
+        self._conn = None
+
+    def acquire(self):
+        if self._conn is None:
+            # immutable: nothing writes this file, so no locking at all.
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True,
+                                         check_same_thread=False)
+        return self._conn
+
+    def release(self, conn):
+        pass
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+class Worker:
+    """Background thread for scheduled / requested backups and snapshot refreshes."""
+
+    def __init__(self, app):
+        self.app = app
+        self.backup = Progress()
+        self.snapshot = Progress()
+        self.last_backup = None
+        self._backup_requested = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="backup", daemon=True)
+        self._thread.start()
+
+    def request_backup(self):
+        self._backup_requested = True
+        self._wake.set()
+
+    def _copy(self, progress, fn):
+        progress.running = True
+        progress.started_at = time.time()
+        try:
+            result = fn()
+            progress.finished_at = time.time()
+            progress.seconds = round(progress.finished_at - progress.started_at, 3)
+            return result
+        except Exception:
+            progress.failures += 1
+            log.exception("copy failed")
+        finally:
+            progress.running = False
+
+    def _snapshot_due(self):
+        interval = self.app.config["SNAPSHOT_INTERVAL_SECONDS"]
+        if interval is None:
+            return False
+        path = snapshot_path(self.app)
+        return not path.exists() or time.time() - path.stat().st_mtime >= interval
+
+    def _backup_due(self):
+        interval = self.app.config["BACKUP_INTERVAL_SECONDS"]
+        if self._backup_requested:
+            return True
+        return interval is not None and (self.backup.finished_at is None
+                                         or time.time() - self.backup.finished_at >= interval)
+
+    def _run(self):
+        config = self.app.config
+        while True:
+            if self._backup_due():
+                self._backup_requested = False
+                target = self._copy(self.backup, lambda: backup(
+                    config["DATABASE"], backup_dir(self.app), archive.archive_dir(self.app),
+                    config["BACKUP_KEEP"], config["BACKUP_STEP_PAGES"], config["BACKUP_STEP_PAUSE_SECONDS"],
+                    self.backup))
+                if target is not None:
+                    self.last_backup = str(target)
+                    self.backup.bytes = sum(p.stat().st_size for p in target.rglob("*.db"))
+            if self._snapshot_due():
+                path = snapshot_path(self.app)
+                if self._copy(self.snapshot, lambda: copy(config["DATABASE"], path, config["BACKUP_STEP_PAGES"],
+                                                          config["BACKUP_STEP_PAUSE_SECONDS"], self.snapshot)):
+                    self.snapshot.bytes = path.stat().st_size
+            self._wake.wait(5.0)
+            self._wake.clear()
+
+    def stats(self):
+        path = snapshot_path(self.app)
+        snapshot = self.snapshot.stats()
+        snapshot["lag_seconds"] = round(time.time() - path.stat().st_mtime, 1) if path.exists() else None
+        return {"backup": self.backup.stats(), "snapshot": snapshot, "last_backup": self.last_backup}
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    @app.before_request
+    def _start_worker():
+        # Scheduled backups need the worker from the start; snapshots only
+        # once reporting asks for one.
+        if app.config["BACKUP_INTERVAL_SECONDS"] is not None:
+            get_worker(app)
+
+def get_worker(app):
+    worker = app.extensions.get("backup_worker")
+    if worker is None:
+        with _lock:
+            worker = app.extensions.get("backup_worker")
+            if worker is None:
+                worker = app.extensions["backup_worker"] = Worker(app)
+    return worker
+
+def snapshot(app):
+    """A Snapshot to run reporting reads against, or None to use the live database."""
+    if app.config["SNAPSHOT_INTERVAL_SECONDS"] is None:
+        return None
+    get_worker(app)
+    path = snapshot_path(app)
+    try:
+        return Snapshot(path)
+    except FileNotFoundError:    # the first snapshot is still being taken
+        return None
+
+def stats(app):
+    worker = app.extensions.get("backup_worker")
+    return worker.stats() if worker else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("backup", "snapshot"))
+    parser.add_argument("--db", default=str(APP_DIR / "hospital.db"))
+    parser.add_argument("--dest", help="backup directory or snapshot file (default: next to --db)")
+    parser.add_argument("--keep", type=int, default=DEFAULTS["BACKUP_KEEP"])
+    parser.add_argument("--pages", type=int, default=DEFAULTS["BACKUP_STEP_PAGES"])
+    parser.add_argument("--pause", type=float, default=DEFAULTS["BACKUP_STEP_PAUSE_SECONDS"])
+    args = parser.parse_args(argv)
+    db = Path(args.db)
+
+    progress = Progress()
+    started = time.perf_counter()
+    if args.command == "backup":
+        target = backup(db, args.dest or db.parent / "backups", db.parent / "archive",
+                        args.keep, args.pages, args.pause, progress)
+    else:
+        target = Path(args.dest or db.parent / "snapshot.db")
+        copy(db, target, args.pages, args.pause, progress)
+    print(f"{args.command}: {progress.pages_total:,} pages to {target} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Turnaround analytics: folding transitions into rollups, and reading them.
+
+Seeds a database with seed.py, gives every assignment a start and (for
+completed ones) a completion transition with random delays, then times:
+
+- a full fold of that history with analytics.refresh (throughput and the
+  longest write transaction per batch),
+- an incremental refresh after 1,000 more status changes,
+- the admin dashboard's analytics.summary, against computing the same
+  percentiles from the transitions on every page load.
+
+    python benchmarks/bench_analytics.py --size medium
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "analytics.db")
+
+import analytics  # noqa: E402
+import seed  # noqa: E402
+
+# Per-row percentiles by role straight from the history, as a report query would.
+NAIVE = """
+    WITH d AS (
+        SELECT s.role, unixepoch(t.created_at) - unixepoch(a.created_at) AS seconds
+        FROM assignment_transitions t
+        JOIN assignments a ON a.id = t.assignment_id
+        JOIN staff s ON s.id = t.changed_by_staff_id
+        WHERE t.to_status = 'Completed'
+    ), r AS (
+        SELECT role, seconds, PERCENT_RANK() OVER (PARTITION BY role ORDER BY seconds) AS pr FROM d
+    )
+    SELECT role, MIN(CASE WHEN pr >= 0.5 THEN seconds END), MIN(CASE WHEN pr >= 0.9 THEN seconds END)
+    FROM r GROUP BY role
+"""
+
+def history(conn, where="", limit=None):
+    # Start within ~2h of creation, completion within ~8h of the start.
+    conn.execute("BEGIN")
+    conn.execute(f"""
+        INSERT INTO assignment_transitions (assignment_id, changed_by_staff_id, from_status, to_status, created_at,
+                                            task_type, assignment_created_at, staff_role, staff_category)
+        SELECT a.id, a.assignee_staff_id, 'Assigned', 'In Progress',
+               datetime(a.created_at, '+' || (60 + abs(random()) % 7200) || ' seconds'),
+               a.task_type, a.created_at, s.role, s.category
+        FROM assignments a JOIN staff s ON s.id = a.assignee_staff_id
+        WHERE a.status != 'Assigned' {where.replace("id", "a.id")} {f"LIMIT {limit}" if limit else ""}
+    """)
+    conn.execute(f"""
+        INSERT INTO assignment_transitions (assignment_id, changed_by_staff_id, from_status, to_status, created_at,
+                                            task_type, assignment_created_at, staff_role, staff_category)
+        SELECT t.assignment_id, t.changed_by_staff_id, 'In Progress', 'Completed',
+               datetime(t.created_at, '+' || (300 + abs(random()) % 28800) || ' seconds'),
+               t.task_type, t.assignment_created_at, t.staff_role, t.staff_category
+        FROM assignment_transitions t JOIN assignments a ON a.id = t.assignment_id
+        WHERE t.to_status = 'In Progress' AND a.status = 'Completed' {where.replace("id", "t.assignment_id")}
+    """)
+    conn.execute("COMMIT")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=seed.PRESETS, default="small")
+    parser.add_argument("--batch", type=int, default=analytics.DEFAULTS["ANALYTICS_BATCH"])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    seed.seed(path, *seed.PRESETS[args.size])
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    newest = conn.execute("SELECT MAX(id) FROM assignments").fetchone()[0]
+    held_back = f"AND id <= {newest - 1000}"
+    history(conn, held_back)
+    total = conn.execute("SELECT COUNT(*) FROM assignment_transitions").fetchone()[0]
+
+    locks = []
+    started = time.perf_counter()
+
+    def on_batch(count):
+        locks.append(time.perf_counter() - on_batch.last)
+        on_batch.last = time.perf_counter()
+    on_batch.last = started
+    analytics.refresh(conn, args.batch, on_batch=on_batch)
+    elapsed = time.perf_counter() - started
+    print(f"\nfull fold: {total:,} transitions in {elapsed:.1f}s ({total / elapsed:,.0f}/s), {len(locks)} batches, "
+          f"longest batch {max(locks) * 1000:.0f} ms")
+
+    history(conn, f"AND id > {newest - 1000}", limit=1000)
+    started = time.perf_counter()
+    folded = analytics.refresh(conn, args.batch)
+    print(f"incremental: {folded:,} new transitions in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    times = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        analytics.summary(conn)
+        times.append((time.perf_counter() - started) * 1000)
+    print(f"dashboard summary from rollups: p50 {statistics.median(times):.2f} ms, max {max(times):.2f} ms")
+    started = time.perf_counter()
+    conn.execute(NAIVE).fetchall()
+    print(f"same percentiles by role from the transitions: {(time.perf_counter() - started) * 1000:.0f} ms")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Patient history over HTML vs the JSON API: bytes and latency.
+
+Seeds a database with seed.py, then fetches one busy patient's history as
+a tablet would: the doctor_view_patient page, the full API history, a sparse
+fieldset, and a revalidation that comes back 304. Also times encoding the
+history with orjson vs json.
+
+    python benchmarks/bench_api.py --size small --repeat 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "api.db")
+
+import seed  # noqa: E402
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=seed.PRESETS, default="small")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=50, help="rows per history section")
+    args = parser.parse_args()
+
+    seed.seed(os.environ["HOSPITAL_DB"], *seed.PRESETS[args.size])
+    import app as hospital
+    import api
+    app = hospital.app
+    app.config["LOGIN_RATE_LIMIT_ENABLED"] = False
+    client = app.test_client()
+    client.post("/login/staff", data={"username": "doctor1", "password": "password"})
+
+    limit = args.limit
+    sparse = ("fields[orders]=id,status&fields[assignments]=id,status,assignee_name"
+              "&fields[reports]=id,report_type,created_at")
+    urls = {
+        "HTML doctor_view_patient": f"/doctor/patient/1?orders_limit={limit}&assignments_limit={limit}"
+                                    f"&reports_limit={limit}",
+        "API history": f"/api/v1/patients/1/history?limit={limit}",
+        "API history, sparse fields": f"/api/v1/patients/1/history?limit={limit}&{sparse}",
+    }
+    etag = client.get(urls["API history"]).headers["ETag"]
+
+    print(f"patient 1, {limit} rows per section, median of {args.repeat}")
+    print(f"{'':<30} {'bytes':>9} {'ms':>8}")
+    for label, url in urls.items():
+        size = len(client.get(url).data)
+        ms = timed(lambda: client.get(url), args.repeat)
+        print(f"{label:<30} {size:>9,} {ms:>8.2f}")
+    resp = client.get(urls["API history"], headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    ms = timed(lambda: client.get(urls["API history"], headers={"If-None-Match": etag}), args.repeat)
+    print(f"{'API history, 304':<30} {len(resp.data):>9,} {ms:>8.2f}")
+
+    body = client.get(urls["API history"]).get_json()
+    print(f"\nencode the history body (median of {args.repeat * 5})")
+    print(f"  json   {timed(lambda: json.dumps(body, separators=(',', ':')).encode(), args.repeat * 5) * 1000:8.1f} us")
+    if api.orjson is not None:
+        print(f"  orjson {timed(lambda: api.orjson.dumps(body), args.repeat * 5) * 1000:8.1f} us")
+    else:
+        print("  orjson not installed")
+
+if __name__ == "__main__":
+    main()
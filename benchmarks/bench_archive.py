@@ -0,0 +1,116 @@
+"""Archiving under write load: lock hold times and what writers notice.
+
+Seeds a database with seed.py, then keeps a writer thread inserting and
+marking notifications read (the app's commonest writes) while archive.run()
+moves everything older than --days. Prints writer latency before and during
+the pass, the archiver's lock hold per batch, the main file's live pages
+before and after, and the cost of paging a patient's history back into
+the archive.
+
+    python benchmarks/bench_archive.py --size small --days 90
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "archive.db")
+
+import archive  # noqa: E402
+import seed  # noqa: E402
+
+def pct(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))] if samples else 0.0
+
+def writer(path, stop, samples):
+    conn = sqlite3.connect(path, isolation_level=None, timeout=10)
+    conn.execute("PRAGMA busy_timeout = 10000")
+    n = 0
+    while not stop.is_set():
+        n += 1
+        started = time.perf_counter()
+        with conn:
+            cur = conn.execute("INSERT INTO notifications (staff_id, message) VALUES (?, ?)", (2 + n % 50, "bench"))
+            conn.execute("UPDATE notifications SET is_read = 1 WHERE id = ?", (cur.lastrowid,))
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.002)
+    conn.close()
+
+def live_pages(path):
+    conn = sqlite3.connect(path)
+    count, free = conn.execute("PRAGMA page_count").fetchone()[0], conn.execute("PRAGMA freelist_count").fetchone()[0]
+    conn.close()
+    return count - free
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=seed.PRESETS, default="small")
+    parser.add_argument("--days", type=float, default=90)
+    parser.add_argument("--batch", type=int, default=archive.DEFAULTS["ARCHIVE_BATCH"])
+    parser.add_argument("--pause", type=float, default=archive.DEFAULTS["ARCHIVE_PAUSE_SECONDS"])
+    parser.add_argument("--idle", type=float, default=3.0, help="seconds of writes measured before archiving")
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    seed.seed(path, *seed.PRESETS[args.size])
+    pages_before = live_pages(path)
+
+    stop, idle, during = threading.Event(), [], []
+    thread = threading.Thread(target=writer, args=(path, stop, idle))
+    thread.start()
+    time.sleep(args.idle)
+    stop.set()
+    thread.join()
+
+    stop = threading.Event()
+    thread = threading.Thread(target=writer, args=(path, stop, during))
+    thread.start()
+    conn = sqlite3.connect(path, isolation_level=None, timeout=10)
+    conn.row_factory = sqlite3.Row
+    locks = []
+    started = time.perf_counter()
+    totals = archive.run(conn, Path(_tmp.name) / "archive", args.days, args.batch, args.pause,
+                         on_batch=lambda table, moved, held: locks.append(held * 1000))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    thread.join()
+    conn.close()
+
+    print(f"archived {sum(totals.values()):,} rows in {elapsed:.1f}s ({len(locks)} batches of <= {args.batch})")
+    for table, rows in totals.items():
+        print(f"  {table:<22} {rows:>10,}")
+    print(f"archiver write lock ms: p50 {pct(locks, .5):.1f}  p99 {pct(locks, .99):.1f}  max {max(locks, default=0):.1f}")
+    print(f"{'writer latency ms':<22} {'n':>6} {'p50':>7} {'p99':>7} {'max':>7}")
+    for label, samples in (("idle", idle), ("during archiving", during)):
+        print(f"{label:<22} {len(samples):>6} {pct(samples, .5):>7.2f} {pct(samples, .99):>7.2f} {max(samples):>7.2f}")
+    print(f"main db live pages: {pages_before:,} -> {live_pages(path):,} (freed pages are reused, not returned to the OS)")
+
+    import app as hospital
+    import database
+    import queries
+    from pagination import FIRST_CURSOR
+    app = hospital.app
+    with app.test_request_context():
+        conn = database.get_db()
+        patient = conn.execute(
+            "SELECT owner_id FROM archive_index WHERE tbl = 'assignments' ORDER BY rows DESC LIMIT 1").fetchone()[0]
+        before, pages, samples = FIRST_CURSOR, 0, []
+        while before is not None:
+            started = time.perf_counter()
+            page = queries.patient_assignments(conn, None, patient, before=before, limit=20)
+            samples.append((time.perf_counter() - started) * 1000)
+            before, pages = page.next_cursor, pages + 1
+        print(f"patient {patient}: {pages} history pages of 20, uncached ms p50 {pct(samples, .5):.2f} "
+              f"max {max(samples):.2f}")
+
+if __name__ == "__main__":
+    main()
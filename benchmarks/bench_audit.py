@@ -0,0 +1,143 @@
+"""Audit logging overhead on the audited routes.
+
+Seeds a database with seed.py, then --threads clients (Flask test client,
+one per thread) hit doctor_view_patient, patient_dashboard and a file
+under /uploads with the access log
+- off,
+- on, as shipped (queued, written in batches by a background thread),
+- on, with a synchronous INSERT and commit per request.
+The modes take turns for --rounds short runs each, so drift in the
+machine's speed hits them alike. Exits non-zero when queued logging adds
+more than --tolerance to any route's mean latency.
+
+    python benchmarks/bench_audit.py --size small --threads 8
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "hospital.db")
+os.environ["HOSPITAL_UPLOAD_DIR"] = os.path.join(_tmp.name, "uploads")
+
+import audit  # noqa: E402
+import seed  # noqa: E402
+from app import app  # noqa: E402
+
+MODES = ("off", "queued", "sync")
+SCAN = "legacy-scan.png"
+
+class SyncLog:
+    """An INSERT and commit per access, on the request thread."""
+
+    def __init__(self, path):
+        self.pid = os.getpid()
+        self.conn = audit.connect(path)
+        self._lock = threading.Lock()
+
+    def record(self, row):
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(audit.INSERT, row)
+
+def routes(max_patient):
+    return {
+        "doctor_view_patient": ("doctor", lambda rng: f"/doctor/patient/{rng.randint(1, max_patient)}"),
+        "patient_dashboard": ("patient", lambda rng: "/patient"),
+        "uploads": ("nurse", lambda rng: f"/uploads/{SCAN}"),
+    }
+
+def run(mode, duration, threads, max_patient, users):
+    app.config["AUDIT_ENABLED"] = mode != "off"
+    queued = app.extensions.get("audit_log")
+    if mode == "sync":
+        app.extensions["audit_log"] = SyncLog(audit.audit_path(app))
+    samples = {name: [] for name in routes(max_patient)}
+    deadline = time.monotonic() + duration
+
+    def client(i):
+        rng = random.Random(i)
+        c = app.test_client()
+        name, (role, path) = list(routes(max_patient).items())[i % 3]
+        with c.session_transaction() as sess:
+            sess.update(role=role, user_id=rng.choice(users[role]), username="bench")
+        while time.monotonic() < deadline:
+            url = path(rng)
+            started = time.perf_counter()
+            resp = c.get(url)
+            resp.close()
+            samples[name].append((time.perf_counter() - started) * 1000)
+            assert resp.status_code == 200, (url, resp.status_code)
+
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    if mode == "sync":
+        app.extensions["audit_log"].conn.close()
+        app.extensions["audit_log"] = queued
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=seed.PRESETS, default="small")
+    parser.add_argument("--threads", type=int, default=6, help="concurrent clients, spread over the routes")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per mode per round")
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    seed.seed(path, *seed.PRESETS[args.size])
+    upload_dir = Path(app.config["UPLOAD_DIR"])
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    (upload_dir / SCAN).write_bytes(os.urandom(64 * 1024))
+    conn = sqlite3.connect(path)
+    users = {role: [r[0] for r in conn.execute("SELECT id FROM staff WHERE role = ? LIMIT 50", (role,))]
+             for role in ("doctor", "nurse")}
+    users["patient"] = [r[0] for r in conn.execute("SELECT id FROM patients LIMIT 50")]
+    max_patient = conn.execute("SELECT MAX(id) FROM patients").fetchone()[0]
+    conn.close()
+
+    run("queued", 1.0, args.threads, max_patient, users)    # warm caches and the audit database
+    results = {mode: {} for mode in MODES}
+    for _ in range(args.rounds):
+        for mode in MODES:
+            for name, times in run(mode, args.duration, args.threads, max_patient, users).items():
+                results[mode].setdefault(name, []).extend(times)
+    stats = audit.stats(app)
+    audit.close(app)
+
+    print(f"\n{args.threads} clients, {args.rounds} rounds of {args.duration:.0f}s per mode")
+    print(f"{'route':<22} {'mode':<7} {'requests':>9} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'added':>7}")
+    failed = False
+    for name in results["off"]:
+        base = statistics.fmean(results["off"][name])
+        for mode in MODES:
+            times = results[mode][name]
+            mean = statistics.fmean(times)
+            added = mean / base - 1
+            failed |= mode == "queued" and added > args.tolerance
+            print(f"{name:<22} {mode:<7} {len(times):>9,} {mean:>8.2f} {statistics.median(times):>7.2f} "
+                  f"{statistics.quantiles(times, n=20)[-1]:>7.2f} {'' if mode == 'off' else f'{added:+.1%}':>7}")
+    print(f"\nqueued log: {stats['written']:,} records in {stats['batches']:,} batches, "
+          f"longest flush {stats['max_flush_ms']:.1f} ms, {stats['backpressure']} backpressure waits, "
+          f"{stats['dropped']} dropped")
+    if failed:
+        print(f"FAIL: queued audit logging added more than {args.tolerance:.0%} to a route")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
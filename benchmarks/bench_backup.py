@@ -0,0 +1,123 @@
+"""Clinical write latency while an online backup runs.
+
+Seeds a database with seed.py, then a doctor creates tickets and orders
+through the real routes while backups run back to back in another thread:
+with nothing else running, during stepped backups (BACKUP_STEP_PAGES pages
+per step with a pause, as backup.py runs them) and during one-step backups
+for comparison. The three phases alternate over --rounds so latency drift
+as the tables grow hits each equally. Exits 1 when the p95 during
+stepped backups exceeds the idle p95 by more than --tolerance (and
+--floor-ms), so it can gate changes to backup.py. Latency depends on the
+machine, so this is run by hand; tests/test_backup.py checks in the test
+suite that a write commits without waiting while a copy is in progress.
+
+    python benchmarks/bench_backup.py --size small --writes 300
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "backup.db")
+
+import backup  # noqa: E402
+import seed  # noqa: E402
+
+def pct(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def clinical_writes(client, n, patients):
+    samples = []
+    for i in range(n):
+        patient_id = 1 + (i * 7919) % patients
+        if i % 2:
+            form = {"patient_id": patient_id, "assignee_staff_id": "auto:nurse", "task_type": "Vitals check"}
+            url = "/doctor/assignments/create"
+        else:
+            form = {"patient_id": patient_id, "order_type": "ECG"}
+            url = "/doctor/orders/create"
+        started = time.perf_counter()
+        client.post(url, data=form)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def with_backups(path, pages, pause, fn):
+    # Back to back until fn() returns; returns (its result, backups completed).
+    stop, done = threading.Event(), []
+
+    def loop():
+        while not stop.is_set():
+            backup.copy(path, Path(_tmp.name) / "copy.db", pages, pause)
+            done.append(1)
+
+    thread = threading.Thread(target=loop)
+    thread.start()
+    try:
+        return fn(), len(done)
+    finally:
+        stop.set()
+        thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=seed.PRESETS, default="small")
+    parser.add_argument("--writes", type=int, default=300, help="writes per phase")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=backup.DEFAULTS["BACKUP_STEP_PAGES"])
+    parser.add_argument("--pause", type=float, default=backup.DEFAULTS["BACKUP_STEP_PAUSE_SECONDS"])
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed p95 ratio during stepped backups")
+    parser.add_argument("--floor-ms", type=float, default=2.0, help="ignore p95 differences below this")
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    counts = seed.PRESETS[args.size]
+    seed.seed(path, *counts)
+    import app as hospital
+    app = hospital.app
+    app.config.update(LOGIN_RATE_LIMIT_ENABLED=False, SNAPSHOT_INTERVAL_SECONDS=None)
+    client = app.test_client()
+    client.post("/login/staff", data={"username": "doctor1", "password": "password"})
+    clinical_writes(client, 20, counts[0])    # warm caches and the workload index
+
+    size = os.path.getsize(path) / 2**20
+    print(f"{size:.0f} MiB database, {args.writes} ticket/order writes per phase, {args.rounds} rounds")
+    phases = (
+        ("idle", None),
+        (f"stepped backup ({args.pages} pages, {args.pause * 1000:g} ms)", (args.pages, args.pause)),
+        ("one-step backup", (-1, 0)),
+    )
+    results = {label: [] for label, _ in phases}
+    copies = {label: 0 for label, _ in phases}
+    per_round = max(1, args.writes // args.rounds)
+    for _ in range(args.rounds):
+        for label, copy_args in phases:
+            if copy_args is None:
+                results[label] += clinical_writes(client, per_round, counts[0])
+            else:
+                samples, n = with_backups(path, *copy_args, lambda: clinical_writes(client, per_round, counts[0]))
+                results[label] += samples
+                copies[label] += n
+
+    print(f"{'':<34} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'backups':>8}")
+    for label, samples in results.items():
+        print(f"{label:<34} {pct(samples, .5):>7.2f} {pct(samples, .95):>7.2f} {pct(samples, .99):>7.2f} "
+              f"{max(samples):>7.2f} {copies[label]:>8}")
+
+    idle = pct(results["idle"], .95)
+    stepped = pct(results[phases[1][0]], .95)
+    if stepped > max(idle * args.tolerance, idle + args.floor_ms):
+        print(f"FAIL: p95 {stepped:.2f} ms during backups vs {idle:.2f} ms idle")
+        return 1
+    print(f"ok: p95 {stepped:.2f} ms during backups vs {idle:.2f} ms idle")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
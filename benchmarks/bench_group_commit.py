@@ -0,0 +1,127 @@
+"""Mark-read writes/sec: one commit per write vs the group-commit writer.
+
+Each of N threads marks its own notifications read one at a time, either
+committing on a pool connection per write (the old route) or through
+writer.execute(). Run with synchronous=NORMAL (the pool default) and FULL
+(an fsync per commit). Also times "mark all read" against N single writes.
+
+    python benchmarks/bench_group_commit.py --threads 1 8 32 --writes 200
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "writes.db")
+
+import app as hospital  # noqa: E402
+import database  # noqa: E402
+import migrate  # noqa: E402
+import writer  # noqa: E402
+
+MARK_READ = "UPDATE notifications SET is_read=1 WHERE id=? AND staff_id=? AND is_read=0"
+
+def build(path, staff, per_staff):
+    conn = sqlite3.connect(path)
+    migrate.upgrade(conn)
+    conn.executemany("INSERT INTO staff (name, role, username, password_hash) VALUES (?, 'nurse', ?, 'x')",
+                     ((f"Nurse {i}", f"nurse{i}") for i in range(staff)))
+    conn.executemany("INSERT INTO notifications (staff_id, message) VALUES (?, 'n')",
+                     ((s, ) for s in range(1, staff + 1) for _ in range(per_staff)))
+    conn.commit()
+    conn.close()
+
+def reset(path):
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE notifications SET is_read=0")
+    conn.commit()
+    conn.close()
+
+def notification_ids(path, staff_id):
+    conn = sqlite3.connect(path)
+    ids = [r[0] for r in conn.execute("SELECT id FROM notifications WHERE staff_id=? ORDER BY id", (staff_id,))]
+    conn.close()
+    return ids
+
+def run(threads, writes, path, write_one):
+    work = {s: notification_ids(path, s)[:writes] for s in range(1, threads + 1)}
+
+    def worker(staff_id):
+        for notif_id in work[staff_id]:
+            write_one(notif_id, staff_id)
+
+    ts = [threading.Thread(target=worker, args=(s,)) for s in work]
+    started = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return threads * writes / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--writes", type=int, default=200, help="writes per thread")
+    parser.add_argument("--delay-ms", type=float, default=writer.DEFAULTS["WRITER_MAX_DELAY_MS"])
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    build(path, max(args.threads), args.writes)
+    app = hospital.app
+    database.get_pool(app)    # migrates
+
+    print(f"{'sync':>6} {'threads':>8} {'per-write commit/s':>19} {'group commit/s':>15} {'avg batch':>10}")
+    for sync in ("NORMAL", "FULL"):
+        pool = database.ConnectionPool(path, size=max(args.threads), busy_timeout_ms=30000)
+        pool.connect_hooks.append(lambda conn, sync=sync: conn.execute(f"PRAGMA synchronous = {sync};"))
+
+        def direct(notif_id, staff_id, pool=pool):
+            conn = pool.acquire()
+            try:
+                conn.execute(MARK_READ, (notif_id, staff_id))
+                conn.commit()
+            finally:
+                pool.release(conn)
+
+        app.extensions.pop("writer", None)
+        app.config["WRITER_SYNCHRONOUS"] = sync
+        app.config["WRITER_MAX_DELAY_MS"] = args.delay_ms
+        group = writer.get_writer(app)
+
+        def grouped(notif_id, staff_id):
+            group.submit(lambda conn: conn.execute(MARK_READ, (notif_id, staff_id)).rowcount)
+
+        for threads in args.threads:
+            reset(path)
+            before = run(threads, args.writes, path, direct)
+            reset(path)
+            batches = group.batches
+            written = group.writes
+            after = run(threads, args.writes, path, grouped)
+            avg = (group.writes - written) / max(1, group.batches - batches)
+            print(f"{sync:>6} {threads:8d} {before:19.0f} {after:15.0f} {avg:10.1f}")
+        pool.close()
+
+    reset(path)
+    ids = notification_ids(path, 1)
+    started = time.perf_counter()
+    for notif_id in ids:
+        writer.get_writer(app).submit(lambda conn, i=notif_id: conn.execute(MARK_READ, (i, 1)).rowcount)
+    one_by_one = time.perf_counter() - started
+    reset(path)
+    started = time.perf_counter()
+    writer.get_writer(app).submit(
+        lambda conn: conn.execute("UPDATE notifications SET is_read=1 WHERE staff_id=? AND is_read=0", (1,)).rowcount)
+    all_at_once = time.perf_counter() - started
+    print(f"\nmark {len(ids)} read: one at a time {one_by_one * 1000:.1f} ms, mark-all-read {all_at_once * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
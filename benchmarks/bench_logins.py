@@ -0,0 +1,104 @@
+"""Login throughput with scrypt hashing on the worker pool.
+
+Runs N concurrent clients logging in (rate limiting off) and reports
+logins/sec plus the latency of a cheap page fetched during the storm, then
+replays a single-address brute force with rate limiting on to show how few
+hashes it gets to run.
+
+    python benchmarks/bench_logins.py --concurrency 1 4 16 --logins 40
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "logins.db")
+
+import app as hospital  # noqa: E402
+import migrate  # noqa: E402
+import passwords  # noqa: E402
+import ratelimit  # noqa: E402
+
+def build(path, users):
+    conn = sqlite3.connect(path)
+    migrate.upgrade(conn)
+    conn.executemany(
+        "INSERT INTO staff (name, role, username, password_hash) VALUES (?, 'nurse', ?, ?)",
+        ((f"Nurse {i}", f"nurse{i}", h) for i, h in enumerate(passwords.hash_many(["pw"] * users))),
+    )
+    conn.commit()
+    conn.close()
+
+def storm(app, concurrency, logins):
+    stop = threading.Event()
+    errors = []
+
+    def worker(i):
+        client = app.test_client()
+        for _ in range(logins):
+            r = client.post("/login/staff", data={"username": f"nurse{i}", "password": "pw"})
+            if r.status_code != 302:
+                errors.append(r.status_code)
+            client.get("/logout")
+
+    def probe(samples):
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.get("/login/staff")
+            samples.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.01)
+
+    samples = []
+    prober = threading.Thread(target=probe, args=(samples,))
+    prober.start()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    prober.join()
+    p95 = statistics.quantiles(samples, n=20)[-1] if len(samples) > 1 else float("nan")
+    return concurrency * logins / elapsed, p95, errors
+
+def brute_force(app, attempts):
+    app.config["LOGIN_RATE_LIMIT_ENABLED"] = True
+    app.extensions.pop("login_limiters", None)
+    client = app.test_client()
+    codes = [client.post("/login/staff", data={"username": "nurse0", "password": f"guess{i}"}).status_code
+             for i in range(attempts)]
+    return codes.count(200), codes.count(429)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--logins", type=int, default=20, help="logins per client")
+    args = parser.parse_args()
+
+    build(os.environ["HOSPITAL_DB"], max(args.concurrency))
+    app = hospital.app
+    app.config["LOGIN_RATE_LIMIT_ENABLED"] = False
+    print(f"scrypt N={passwords.SCRYPT_N}, {passwords.HASH_WORKERS} hash workers, "
+          f"queue limit {passwords.HASH_QUEUE_LIMIT}")
+    print(f"{'clients':>8} {'logins/s':>9} {'page p95 ms':>12} {'failed':>7}")
+    for concurrency in args.concurrency:
+        rate, p95, errors = storm(app, concurrency, args.logins)
+        print(f"{concurrency:8d} {rate:9.1f} {p95:12.1f} {len(errors):7d}")
+    hashed, limited = brute_force(app, 200)
+    print(f"\nbrute force, 200 guesses from one address: {hashed} hashed, {limited} rejected with 429")
+    passwords.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Write-lock hold time for ticket creation: inline notifications vs outbox.
+
+The inline variant replays what doctor_create_assignment used to do (insert
+the assignment and the notification, plus any side effects, in the request
+transaction). The outbox variant goes through the real route. Lock hold
+time is measured from BEGIN to COMMIT with a trace callback; the
+dispatcher's batched transactions are reported per event.
+
+    python benchmarks/bench_outbox.py --tickets 500 --sink-ms 5
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "outbox.db")
+
+import app as hospital  # noqa: E402
+import database  # noqa: E402
+import migrate  # noqa: E402
+import outbox  # noqa: E402
+
+_local = threading.local()
+holds = []
+
+def trace(statement):
+    if statement.startswith("BEGIN"):
+        _local.started = time.perf_counter()
+    elif statement == "COMMIT" and getattr(_local, "started", None) is not None:
+        holds.append((time.perf_counter() - _local.started) * 1000)
+        _local.started = None
+
+def build(path):
+    conn = sqlite3.connect(path)
+    migrate.upgrade(conn)
+    pw = hospital.hash_pw("pw")
+    conn.execute("INSERT INTO staff (name, role, username, password_hash) VALUES ('Doc', 'doctor', 'doc', ?)", (pw,))
+    conn.execute("INSERT INTO staff (name, role, username, password_hash) VALUES ('Rad', 'radiologist', 'rad', ?)", (pw,))
+    conn.execute("INSERT INTO patients (name, username, password_hash) VALUES ('Pat', 'pat', 'x')")
+    conn.commit()
+    ids = dict(conn.execute("SELECT username, id FROM staff"))
+    conn.close()
+    return ids["doc"], ids["rad"]
+
+def summary(label, samples):
+    p95 = statistics.quantiles(samples, n=20)[-1]
+    print(f"  {label:<34} p50 {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms")
+
+def inline(pool, doctor_id, rad_id, n, sink_ms):
+    holds.clear()
+    for i in range(n):
+        conn = pool.acquire()
+        try:
+            conn.execute("INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type) VALUES (1,?,?,?)",
+                         (doctor_id, rad_id, f"Scan {i}"))
+            conn.execute("INSERT INTO notifications (staff_id, message) VALUES (?,?)", (rad_id, f"New assignment: Scan {i}"))
+            if sink_ms:
+                time.sleep(sink_ms / 1000)    # e.g. an SMS/email call made in the handler
+            conn.commit()
+        finally:
+            pool.release(conn)
+    return list(holds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--sink-ms", type=float, default=5.0, help="cost of one inline side effect")
+    args = parser.parse_args()
+
+    doctor_id, rad_id = build(os.environ["HOSPITAL_DB"])
+    app = hospital.app
+    app.config["OUTBOX_DISPATCHER"] = False
+    pool = database.get_pool(app)
+    pool.connect_hooks.append(lambda conn: conn.set_trace_callback(trace))
+
+    print(f"write-lock hold time per ticket, {args.tickets} tickets")
+    summary("inline notification", inline(pool, doctor_id, rad_id, args.tickets, 0))
+    summary(f"inline + {args.sink_ms:g} ms side effect", inline(pool, doctor_id, rad_id, args.tickets, args.sink_ms))
+
+    client = app.test_client()
+    client.post("/login/staff", data={"username": "doc", "password": "pw"})
+    holds.clear()
+    for i in range(args.tickets):
+        client.post("/doctor/assignments/create",
+                    data={"patient_id": 1, "assignee_staff_id": rad_id, "task_type": f"Scan {i}"})
+    summary("outbox (request path)", list(holds))
+
+    holds.clear()
+    with app.app_context():
+        while outbox.dispatch_pending(app):
+            pass
+    batch = app.config["OUTBOX_BATCH"]
+    per_event = [h / batch for h in holds]
+    summary(f"dispatcher, per event (batch {batch})", per_event)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Dashboard page latency as the patients table grows.
+
+Builds a database per size, then times the admin dashboard (first page and
+a page deep in the keyset) through the Flask test client, next to the old
+unbounded `SELECT * FROM patients` for comparison.
+
+    python benchmarks/bench_pagination.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "bench.db")
+
+import app as hospital  # noqa: E402
+import database  # noqa: E402
+import migrate  # noqa: E402
+
+def build(path, n_patients):
+    conn = sqlite3.connect(path)
+    migrate.upgrade(conn)
+    conn.execute(
+        "INSERT INTO staff (name, role, username, password_hash) VALUES ('Admin', 'admin', 'admin', ?)",
+        (hospital.hash_pw("pw"),),
+    )
+    rows = ((f"Patient {i}", f"patient{i}", "x", f"555-{i:07d}") for i in range(n_patients))
+    conn.executemany("INSERT INTO patients (name, username, password_hash, phone) VALUES (?,?,?,?)", rows)
+    conn.commit()
+    conn.close()
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def run(size, repeat):
+    path = os.path.join(_tmp.name, f"bench_{size}.db")
+    build(path, size)
+    app = hospital.app
+    pool = app.extensions.pop("db_pool", None)
+    if pool:
+        pool.close()
+    app.config["DATABASE"] = path
+    app.config["QUERY_CACHE_ENABLED"] = False  # measure the queries, not the cache
+    client = app.test_client()
+    client.post("/login/staff", data={"username": "admin", "password": "pw"})
+    deep = max(size // 2, 1)
+
+    def first_page():
+        assert client.get("/admin").status_code == 200
+
+    def deep_page():
+        assert client.get(f"/admin?patients_before={deep}").status_code == 200
+
+    def unbounded():
+        conn = sqlite3.connect(path)
+        conn.execute("SELECT * FROM patients ORDER BY id DESC").fetchall()
+        conn.close()
+
+    first_page()  # warm the pool and template cache
+    return (
+        timed(first_page, repeat),
+        timed(deep_page, repeat),
+        timed(unbounded, max(1, repeat // 5)),
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'patients':>10} {'first page ms':>14} {'deep page ms':>13} {'unbounded SELECT ms':>20}")
+    for size in args.sizes:
+        first, deep, unbounded = run(size, args.repeat)
+        print(f"{size:>10} {first:>14.2f} {deep:>13.2f} {unbounded:>20.2f}")
+
+if __name__ == "__main__":
+    main()
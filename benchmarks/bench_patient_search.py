@@ -0,0 +1,73 @@
+"""Latency of /api/patients/search at large patient counts.
+
+    python benchmarks/bench_patient_search.py --patients 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "search.db")
+
+import app as hospital  # noqa: E402
+import migrate  # noqa: E402
+
+FIRST = ["Amal", "Nimal", "Kamala", "Saman", "Dilani", "Ruwan", "Chathura", "Nadeesha",
+         "Ishara", "Tharindu", "Maria", "John", "Priya", "Arjun", "Fatima", "Chen"]
+LAST = ["Perera", "Fernando", "Silva", "Jayasinghe", "Bandara", "Wickramasinghe",
+        "Dissanayake", "Rathnayake", "Smith", "Khan", "Wang", "Gunawardena"]
+
+def build(path, n):
+    conn = sqlite3.connect(path)
+    migrate.upgrade(conn)
+    conn.execute(
+        "INSERT INTO staff (name, role, username, password_hash) VALUES ('Doc', 'doctor', 'doc', ?)",
+        (hospital.hash_pw("pw"),),
+    )
+    rnd = random.Random(42)
+    rows = (
+        (f"{rnd.choice(FIRST)} {rnd.choice(LAST)}", f"user{i}", "x", f"07{rnd.randrange(10**8):08d}")
+        for i in range(n)
+    )
+    started = time.perf_counter()
+    conn.executemany("INSERT INTO patients (name, username, password_hash, phone) VALUES (?,?,?,?)", rows)
+    conn.commit()
+    print(f"built {n} patients (+ trigram index via triggers) in {time.perf_counter() - started:.1f}s")
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    build(os.environ["HOSPITAL_DB"], args.patients)
+
+    client = hospital.app.test_client()
+    client.post("/login/staff", data={"username": "doc", "password": "pw"})
+    queries = ["Perera", "nadeesha", "user123456", "0712", "Silva", "wang", "Jayasinghe", "zzzz", "42"]
+    client.get("/api/patients/search?q=warmup")
+    print(f"{'query':>12} {'p50 ms':>8} {'p95 ms':>8} {'hits':>5}")
+    worst = 0.0
+    for q in queries:
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            resp = client.get(f"/api/patients/search?q={q}")
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        worst = max(worst, p95)
+        print(f"{q:>12} {statistics.median(samples):>8.2f} {p95:>8.2f} {len(resp.json['results']):>5}")
+    print(f"worst p95: {worst:.2f} ms ({'OK' if worst < 10 else 'over'} the 10 ms budget)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Per-template compile and render time for the dashboards.
+
+Times compiling each template from source (what the first request in a fresh
+worker used to pay), then each dashboard request with the query cache warm,
+with and without fragment caching, so what remains is mostly rendering.
+
+    python benchmarks/bench_render.py --rows 200 --repeat 50
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "render.db")
+
+import app as hospital  # noqa: E402
+import fragments  # noqa: E402
+import migrate  # noqa: E402
+
+def build(path, n):
+    conn = sqlite3.connect(path)
+    migrate.upgrade(conn)
+    pw = hospital.hash_pw("pw")
+    conn.executemany(
+        "INSERT INTO staff (name, role, category, username, password_hash) VALUES (?,?,?,?,?)",
+        [("Admin", "admin", None, "admin", pw), ("Doctor", "doctor", "General", "doctor", pw)]
+        + [(f"Staff {i}", ("nurse", "radiologist")[i % 2], "General", f"staff{i}", pw) for i in range(n)],
+    )
+    conn.executemany(
+        "INSERT INTO patients (name, username, password_hash, phone, dob) VALUES (?,?,?,?,?)",
+        [(f"Patient {i}", f"patient{i}", pw, f"555-{i:07d}", "1980-01-01") for i in range(n)],
+    )
+    doctor_id = conn.execute("SELECT id FROM staff WHERE username='doctor'").fetchone()[0]
+    staff_ids = [r[0] for r in conn.execute("SELECT id FROM staff WHERE role IN ('nurse', 'radiologist')")]
+    conn.executemany(
+        "INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type, notes) VALUES (1,?,?,?,?)",
+        [(doctor_id, staff_ids[i % len(staff_ids)], "Scan", f"note {i}") for i in range(n)],
+    )
+    conn.executemany(
+        "INSERT INTO orders (patient_id, doctor_id, order_type, notes) VALUES (1,?,?,?)",
+        [(doctor_id, "ECG", f"order {i}") for i in range(n)],
+    )
+    conn.executemany(
+        "INSERT INTO reports (patient_id, created_by_staff_id, report_type, report_text) VALUES (1,?,?,?)",
+        [(staff_ids[i % len(staff_ids)], "Scan", f"finding {i}") for i in range(n)],
+    )
+    conn.commit()
+    conn.close()
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def compile_times(app, repeat):
+    env = app.jinja_env
+    bytecode_cache, env.bytecode_cache = env.bytecode_cache, None
+    results = {}
+    for name in sorted(env.list_templates(extensions=("html",))):
+        def compile_once():
+            env.cache.clear()
+            env.get_template(name)
+        results[name] = median_ms(compile_once, repeat)
+    env.bytecode_cache = bytecode_cache
+    fragments.precompile(app)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200, help="rows per dashboard list")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(_tmp.name, "render.db")
+    build(path, args.rows)
+    app = hospital.app
+    limit = min(args.rows, 200)
+
+    print("compile from source (ms, median)")
+    for name, ms in compile_times(app, 10).items():
+        print(f"  {name:<28} {ms:7.2f}")
+
+    client = app.test_client()
+    pages = {
+        "admin_dashboard.html": ("admin", f"/admin?staff_limit={limit}&patients_limit={limit}&assignments_limit={limit}"),
+        "doctor_dashboard.html": ("doctor", f"/doctor?assignments_limit={limit}&patients_limit={limit}"),
+        "patient_history.html": ("doctor", f"/doctor/patient/1?reports_limit={limit}&assignments_limit={limit}&orders_limit={limit}"),
+    }
+    print(f"\nrequest time with warm query cache, {limit} rows per list (ms, median)")
+    print(f"  {'template':<28} {'no fragments':>13} {'fragments':>10}")
+    for name, (user, url) in pages.items():
+        client.get("/logout")
+        client.post("/login/staff", data={"username": user, "password": "pw"})
+        results = []
+        for enabled in (False, True):
+            fragments.get_fragment_cache(app).enabled = enabled
+            assert client.get(url).status_code == 200
+            results.append(median_ms(lambda: client.get(url), args.repeat))
+        print(f"  {name:<28} {results[0]:13.2f} {results[1]:10.2f}")
+    print("\nfragment cache:", fragments.get_fragment_cache(app).stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Report search: FTS5 ranked search vs a LIKE scan, and incremental reindexing.
+
+Seeds a database with --reports reports (seed.py adds findings of
+different rarity, from "wound" in ~8% of reports to "pneumothorax" in
+~0.4%), then times search.search_reports for rare, common and two-word
+queries, alone and filtered to the last month or one author (at most
+search.RANK_WINDOW matches are scored per search), against the
+LIKE '%term%' scan doctors had before. Finally empties the index and
+rebuilds it with search.backfill, reporting throughput and the longest
+write-lock hold of a batch.
+
+    python benchmarks/bench_report_search.py --reports 10000000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "search.db")
+
+import search  # noqa: E402
+import seed  # noqa: E402
+
+QUERIES = ["pneumothorax", "troponin cardiology", '"pleural effusion"', "wound", "stable"]
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return result, times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=search.DEFAULTS["REPORT_SEARCH_BATCH"])
+    parser.add_argument("--no-like", action="store_true", help="skip the LIKE scans")
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    patients, staff, orders, assignments, _ = seed.PRESETS["tiny"]
+    seed.seed(path, patients, staff, orders, assignments, args.reports)
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA cache_size = -262144")
+    newest = conn.execute("SELECT created_at FROM reports ORDER BY id DESC LIMIT 1").fetchone()[0]
+    since = conn.execute("SELECT date(?, '-1 month')", (newest,)).fetchone()[0]
+    author = conn.execute("SELECT created_by_staff_id FROM reports WHERE id = 1").fetchone()[0]
+    filters = {"": {}, "last month": {"since": since}, "one author": {"staff_id": author}}
+
+    print(f"\n{args.reports:,} reports, {args.repeat} runs each, top {search.REPORT_SEARCH_LIMIT} results")
+    print(f"{'query':<22} {'filter':<11} {'matches':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for q in QUERIES:
+        matches = conn.execute("SELECT COUNT(*) FROM reports_fts WHERE reports_fts MATCH ?",
+                               (search.report_match(q),)).fetchone()[0]
+        for label, kwargs in filters.items():
+            _, times = timed(lambda: search.search_reports(conn, q, **kwargs), args.repeat)
+            p95 = statistics.quantiles(times, n=20)[-1] if len(times) > 1 else times[0]
+            print(f"{q:<22} {label:<11} {matches:>9,} {statistics.median(times):>8.1f} {p95:>8.1f}")
+
+    if not args.no_like:
+        print(f"\n{'LIKE scan (before)':<22} {'':<11} {'rows':>9} {'ms':>8}")
+        for q in ("pneumothorax", "wound"):
+            rows, times = timed(lambda: conn.execute(
+                "SELECT id FROM reports WHERE report_text LIKE ? ORDER BY id DESC LIMIT ?",
+                (f"%{q}%", search.REPORT_SEARCH_LIMIT)).fetchall(), 1)
+            print(f"{q:<22} {'newest':<11} {len(rows):>9,} {times[0]:>8.1f}")
+            rows, times = timed(lambda: conn.execute(
+                "SELECT COUNT(*) FROM reports WHERE report_text LIKE ?", (f"%{q}%",)).fetchall(), 1)
+            print(f"{q:<22} {'all':<11} {rows[0][0]:>9,} {times[0]:>8.1f}")
+
+    search.reindex(conn)
+    locks = []
+    started = time.perf_counter()
+    rows = search.backfill(conn, args.batch, pause=0, on_batch=lambda count, done, end, held: locks.append(held))
+    elapsed = time.perf_counter() - started
+    print(f"\nreindex: {rows:,} reports in {elapsed:.1f}s ({rows / elapsed:,.0f}/s), {len(locks):,} batches of "
+          f"{args.batch}, write lock held max {max(locks) * 1000:.1f} ms, p50 {statistics.median(locks) * 1000:.1f} ms")
+    conn.execute("INSERT INTO reports_fts (reports_fts, rank) VALUES ('integrity-check', 1)")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Bytes transferred and time to first render for a patient with 300 scans.
+
+Compares loading every original inline (the old pages) with thumbnails,
+and shows what a revisit costs once the browser holds the ETags.
+Requires Pillow.
+
+    python benchmarks/bench_scan_delivery.py --reports 300
+"""
+import argparse
+import io
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "scans.db")
+
+import app as hospital  # noqa: E402
+import blobstore  # noqa: E402
+import migrate  # noqa: E402
+import thumbnails  # noqa: E402
+
+_noise = None
+
+def make_scan(i):
+    # Distinct content per report (so nothing dedupes), realistic JPEG weight.
+    global _noise
+    from PIL import Image, ImageDraw
+    if _noise is None:
+        _noise = Image.effect_noise((1600, 1200), 24).convert("RGB")
+    img = Image.linear_gradient("L").resize((1600, 1200)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((200 + i % 400, 150, 1300, 1050 - i % 300), outline=(255, 255, 255), width=6)
+    img = Image.blend(img, _noise, 0.25)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+def build(path, upload_dir, n):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    migrate.upgrade(conn)
+    pw = hospital.hash_pw("pw")
+    conn.execute("INSERT INTO staff (name, role, username, password_hash) VALUES ('Doc', 'doctor', 'doc', ?)", (pw,))
+    conn.execute("INSERT INTO staff (name, role, username, password_hash) VALUES ('Rad', 'radiologist', 'rad', ?)", (pw,))
+    conn.execute("INSERT INTO patients (name, username, password_hash) VALUES ('Long Stay', 'pat', ?)", (pw,))
+
+    class Upload:
+        def __init__(self, data, name):
+            self.stream = io.BytesIO(data)
+            self.filename = name
+
+    for i in range(n):
+        rel, sha, _ = blobstore.save_upload(Upload(make_scan(i), f"ct_{i}.jpg"), upload_dir, conn, hospital.ALLOWED_EXT)
+        conn.execute(
+            "INSERT INTO reports (patient_id, created_by_staff_id, report_type, report_text, image_filename, blob_sha256)"
+            " VALUES (1, 2, 'Scan Result', 'CT chest', ?, ?)",
+            (rel, sha),
+        )
+    conn.commit()
+    thumbnails.backfill(conn, upload_dir)
+    conn.close()
+
+def fetch(client, urls, etags=None):
+    total = 0
+    for url in urls:
+        headers = {"If-None-Match": etags[url]} if etags and url in etags else {}
+        resp = client.get(url, headers=headers)
+        total += len(resp.data)
+        if etags is not None and resp.headers.get("ETag"):
+            etags[url] = resp.headers["ETag"]
+    return total
+
+def page_urls(html, pattern):
+    return list(dict.fromkeys(u.replace("&amp;", "&") for u in re.findall(pattern, html)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=300)
+    args = parser.parse_args()
+    if not thumbnails.enabled():
+        print("Pillow is required: pip install Pillow")
+        return 1
+    upload_dir = Path(_tmp.name) / "uploads"
+    hospital.UPLOAD_DIR = upload_dir
+    started = time.perf_counter()
+    build(os.environ["HOSPITAL_DB"], upload_dir, args.reports)
+    print(f"built {args.reports} scans + thumbnails in {time.perf_counter() - started:.1f}s\n")
+
+    client = hospital.app.test_client()
+    client.post("/login/staff", data={"username": "doc", "password": "pw"})
+
+    def scenario(name, img_pattern, etags=None, all_pages=True):
+        # Follows the reports "Load more" links until every report is shown.
+        started = time.perf_counter()
+        url, total, count = "/doctor/patient/1?reports_limit=200", 0, 0
+        if not all_pages:
+            url = "/doctor/patient/1"
+        while url:
+            html = client.get(url).data.decode()
+            images = page_urls(html, img_pattern)
+            total += len(html) + fetch(client, images, etags)
+            count += len(images)
+            more = page_urls(html, r'href="(/doctor/patient/1\?[^"]*reports_before=[^"]+)"')
+            url = more[0] if more and all_pages else None
+        ms = (time.perf_counter() - started) * 1000
+        print(f"{name:<44} {count:>5} {total / 1e6:>10.2f} {ms:>10.1f}")
+
+    print(f"{'scenario':<44} {'imgs':>5} {'MB':>10} {'ms':>10}")
+    originals = r'href="(/uploads/[0-9a-f]{2}/[^"]+)"'
+    thumbs = r'<img src="([^"]+)"'
+    scenario("before: all originals inline", originals)
+    scenario("after: first screen (default page + thumbs)", thumbs, all_pages=False)
+    etags = {}
+    scenario("after: all reports as thumbnails", thumbs, etags)
+    scenario("after: revisit, conditional GET (304s)", thumbs, etags)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""serve.py throughput at 1, 4 and 16 worker processes.
+
+Seeds a database with seed.py, then for each worker count starts
+`python serve.py` on it, waits until every worker has warmed up and
+drives it for --duration seconds. The load comes from --clients
+keep-alive HTTP connections, spread over --client-procs processes so the
+client isn't the bottleneck. Each one is signed in as a seeded doctor,
+nurse or patient and fetches that role's dashboards and patient pages.
+Reports requests/s and latency per worker count. Throughput only scales
+as far as there are cores for the workers, and the clients use cores too.
+
+    python benchmarks/bench_serve.py --size small --workers 1,4,16
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import re
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "serve.db")
+os.environ["HOSPITAL_SECRET_KEY"] = "bench-serve"
+os.environ["HOSPITAL_UPLOAD_DIR"] = os.path.join(_tmp.name, "uploads")
+
+import seed  # noqa: E402
+from app import app  # noqa: E402
+
+# (role, weight, pages); {patient} is a random seeded patient.
+MIX = [
+    ("doctor", 3, ["/doctor", "/doctor/patient/{patient}"]),
+    ("nurse", 4, ["/nurse"]),
+    ("patient", 5, ["/patient"]),
+]
+
+def cookies(path, per_role=20):
+    conn = sqlite3.connect(path)
+    sign = app.session_interface.get_signing_serializer(app).dumps
+    users = {role: [r[0] for r in conn.execute(
+        "SELECT id FROM staff WHERE role = ? ORDER BY id LIMIT ?", (role, per_role))]
+        for role in ("doctor", "nurse")}
+    users["patient"] = [r[0] for r in conn.execute("SELECT id FROM patients ORDER BY id LIMIT ?", (per_role,))]
+    max_patient = conn.execute("SELECT MAX(id) FROM patients").fetchone()[0]
+    conn.close()
+    signed = {role: [sign({"role": role, "user_id": uid, "username": f"{role}{uid}"}) for uid in ids]
+              for role, ids in users.items()}
+    return signed, max_patient
+
+def client(port, signed, max_patient, deadline, rng):
+    """One keep-alive connection: (latencies ms, errors) until deadline."""
+    roles = [role for role, weight, _ in MIX for _ in range(weight)]
+    pages = {role: paths for role, _, paths in MIX}
+    role = rng.choice(roles)
+    headers = {"Cookie": f"session={rng.choice(signed[role])}"}
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    times, errors = [], 0
+    while time.monotonic() < deadline:
+        path = rng.choice(pages[role]).format(patient=rng.randint(1, max_patient))
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            ok = resp.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+        times.append((time.perf_counter() - started) * 1000)
+        errors += not ok
+    conn.close()
+    return times, errors
+
+def client_proc(args):
+    port, threads, signed, max_patient, deadline, seed_value = args
+    results = []
+    def run(i):
+        results.append(client(port, signed, max_patient, deadline, random.Random(seed_value * 1000 + i)))
+    pool = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return [ms for times, _ in results for ms in times], sum(errors for _, errors in results)
+
+def start_server(port, workers, threads):
+    log = open(os.path.join(_tmp.name, f"serve-{workers}.log"), "w")
+    proc = subprocess.Popen(
+        [sys.executable, str(ROOT / "serve.py"), "--bind", f"127.0.0.1:{port}",
+         "--workers", str(workers), "--threads", str(threads)],
+        env=dict(os.environ, HOSPITAL_SERVE_ACCESS_LOG="false"), stdout=log, stderr=subprocess.STDOUT)
+    logfile = Path(log.name)
+    deadline = time.monotonic() + 120
+    while len(re.findall(r"worker \d+ warm", logfile.read_text())) < workers:
+        if proc.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError(f"serve.py did not start:\n{logfile.read_text()}")
+        time.sleep(0.1)
+    return proc, log
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=seed.PRESETS, default="small")
+    parser.add_argument("--workers", default="1,4,16")
+    parser.add_argument("--threads", type=int, default=16, help="connections per worker")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--client-procs", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    seed.seed(path, *seed.PRESETS[args.size])
+    signed, max_patient = cookies(path)
+    per_proc = [args.clients // args.client_procs + (i < args.clients % args.client_procs)
+                for i in range(args.client_procs)]
+
+    print(f"\n{args.clients} keep-alive clients in {args.client_procs} processes, {args.duration:.0f}s per run, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for workers in (int(n) for n in args.workers.split(",")):
+        proc, log = start_server(args.port, workers, args.threads)
+        try:
+            deadline = time.monotonic() + args.duration
+            with multiprocessing.get_context("fork").Pool(args.client_procs) as pool:
+                results = pool.map(client_proc, [(args.port, n, signed, max_patient, deadline, i)
+                                                 for i, n in enumerate(per_proc) if n])
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait()
+            log.close()
+        times = [ms for proc_times, _ in results for ms in proc_times]
+        errors = sum(e for _, e in results)
+        q = statistics.quantiles(times, n=100)
+        print(f"{workers:>7} {len(times) / args.duration:>9,.0f} {statistics.median(times):>8.1f} "
+              f"{q[94]:>8.1f} {q[98]:>8.1f} {errors:>7}")
+
+if __name__ == "__main__":
+    main()
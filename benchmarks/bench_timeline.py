@@ -0,0 +1,99 @@
+"""Patient timeline vs the sectioned history page: first byte, total, memory.
+
+Seeds a tiny database with seed.py, adds long-stay patients with growing
+histories, and fetches for each the sectioned page (doctor_view_patient,
+200 rows per section) and the streamed timeline (the whole history). The
+body is consumed chunk by chunk without keeping it, so tracemalloc's peak
+is what the server side held.
+
+    python benchmarks/bench_timeline.py --entries 300 3000 30000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "timeline.db")
+
+import seed  # noqa: E402
+
+def add_patient(path, entries, rng):
+    """A patient with `entries` orders, assignments and reports over ten years."""
+    conn = sqlite3.connect(path)
+    cur = conn.execute("INSERT INTO patients (name, username, password_hash) VALUES (?, ?, 'x')",
+                       (f"Long Stay {entries}", f"longstay{entries}"))
+    patient_id = cur.lastrowid
+    doctor, nurse = (conn.execute("SELECT id FROM staff WHERE role = ? LIMIT 1", (role,)).fetchone()[0]
+                     for role in ("doctor", "nurse"))
+    start = time.time() - 10 * 365 * 86400
+    stamps = sorted(time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + rng.random() * 10 * 365 * 86400))
+                    for _ in range(entries))
+    for i, stamp in enumerate(stamps):
+        if i % 3 == 0:
+            conn.execute("INSERT INTO orders (patient_id, doctor_id, order_type, notes, created_at) VALUES (?,?,?,?,?)",
+                         (patient_id, doctor, "ECG", "routine", stamp))
+        elif i % 3 == 1:
+            conn.execute("INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type, status, created_at) "
+                         "VALUES (?,?,?,?,'Completed',?)", (patient_id, doctor, nurse, "Vitals check", stamp))
+        else:
+            conn.execute("INSERT INTO reports (patient_id, created_by_staff_id, report_type, report_text, created_at) "
+                         "VALUES (?,?,?,?,?)", (patient_id, nurse, "Report", rng.choice(seed.REPORT_TEXT), stamp))
+    conn.commit()
+    conn.close()
+    return patient_id
+
+def fetch(client, url):
+    tracemalloc.start()
+    started = time.perf_counter()
+    resp = client.get(url, buffered=False)
+    first = None
+    size = 0
+    for chunk in resp.response:
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    resp.close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first * 1000, total * 1000, size, peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, nargs="+", default=[300, 3000, 30000])
+    args = parser.parse_args()
+
+    path = os.environ["HOSPITAL_DB"]
+    seed.seed(path, *seed.PRESETS["tiny"])
+    rng = random.Random(1)
+    patients = {n: add_patient(path, n, rng) for n in args.entries}
+
+    import app as hospital
+    app = hospital.app
+    app.config.update(LOGIN_RATE_LIMIT_ENABLED=False, QUERY_CACHE_ENABLED=False, FRAGMENT_CACHE_ENABLED=False)
+    client = app.test_client()
+    client.post("/login/staff", data={"username": "doctor1", "password": "password"})
+
+    print(f"{'entries':>8} {'page':<26} {'first byte ms':>14} {'total ms':>9} {'KiB sent':>9} {'peak KiB':>9}")
+    for entries, patient_id in patients.items():
+        urls = {
+            "history, 200 per section": f"/doctor/patient/{patient_id}?orders_limit=200&assignments_limit=200"
+                                        f"&reports_limit=200",
+            "timeline, everything": f"/doctor/patient/{patient_id}/timeline",
+        }
+        for label, url in urls.items():
+            fetch(client, url)    # warm up
+            first, total, size, peak = fetch(client, url)
+            print(f"{entries:>8} {label:<26} {first:>14.2f} {total:>9.1f} {size / 1024:>9.0f} {peak:>9.0f}")
+
+if __name__ == "__main__":
+    main()
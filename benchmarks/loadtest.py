@@ -0,0 +1,343 @@
+"""Load test: virtual users drive the app through its real routes.
+
+Each virtual user logs in as a seeded account (see seed.py) and loops over
+the actions of its role: doctors search patients, open histories and create
+tickets, nurses and radiologists poll their dashboards, work tickets and
+mark notifications read, patients read their history. Latency is reported
+per endpoint as p50/p95/p99.
+
+    python seed.py /tmp/seed.db --size small
+    python benchmarks/loadtest.py /tmp/seed.db --users 16 --duration 30
+    python benchmarks/loadtest.py /tmp/seed.db --save base.json
+    python benchmarks/loadtest.py /tmp/seed.db --compare base.json    # exit 1 on a p95 regression
+
+By default the app runs in-process (Flask test client, one per user, login
+rate limiting off). With --url the same users hit a running server
+instead; its login limiter must allow --users logins from this address.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import seed  # noqa: E402
+
+DEFAULT_MIX = "doctor=3,nurse=5,radiologist=2,patient=6,admin=0"
+
+class InProcess:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        resp = self.client.open(path, method=method, data=data)
+        return resp.status_code, resp.get_data(as_text=True)
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args):
+        return None
+
+class OverHTTP:
+    def __init__(self, base):
+        self.base = base.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base + path, data=body, method=method)) as resp:
+                return resp.status, resp.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode(errors="replace")
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}    # endpoint -> [ms]
+        self.errors = {}     # endpoint -> count
+        self.recording = False
+
+    def add(self, endpoint, ms, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(ms)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+class User:
+    """One logged-in virtual user; subclasses define the weighted actions."""
+
+    role = None
+    actions = ()    # (weight, method name)
+
+    def __init__(self, transport, recorder, rng, account, patients):
+        self.http = transport
+        self.rec = recorder
+        self.rng = rng
+        self.account = account
+        self.patients = patients    # seeded patient count
+
+    def call(self, endpoint, method, path, data=None):
+        started = time.perf_counter()
+        status, body = self.http.request(method, path, data)
+        self.rec.add(endpoint, (time.perf_counter() - started) * 1000, status < 400)
+        return status, body
+
+    def login(self, password):
+        kind = "patient" if self.role == "patient" else "staff"
+        for _ in range(20):
+            status, _ = self.http.request("POST", f"/login/{kind}",
+                                          {"username": self.account, "password": password})
+            if status == 302:
+                return
+            if status != 429:
+                break
+            time.sleep(2)
+        raise RuntimeError(f"login failed for {self.account} ({status})")
+
+    def step(self):
+        weights, names = zip(*self.actions)
+        getattr(self, self.rng.choices(names, weights)[0])()
+
+class Doctor(User):
+    role = "doctor"
+    actions = ((4, "dashboard"), (3, "open_patient"), (2, "create_ticket"), (1, "create_order"))
+
+    def dashboard(self):
+        self.call("GET /doctor", "GET", "/doctor")
+
+    def _find_patient(self):
+        q = self.rng.choice(seed.LAST_NAMES)[:4]
+        _, body = self.call("GET /api/patients/search", "GET", f"/api/patients/search?q={q}")
+        try:
+            results = json.loads(body)["results"]
+        except (ValueError, KeyError):
+            return None
+        return self.rng.choice(results)["id"] if results else None
+
+    def open_patient(self):
+        patient_id = self._find_patient()
+        if patient_id:
+            self.call("GET /doctor/patient/<id>", "GET", f"/doctor/patient/{patient_id}")
+
+    def create_ticket(self):
+        patient_id = self._find_patient()
+        if patient_id:
+            role = "nurse" if self.rng.random() < 0.7 else "radiologist"
+            self.call("POST /doctor/assignments/create", "POST", "/doctor/assignments/create", {
+                "patient_id": patient_id, "assignee_staff_id": f"auto:{role}",
+                "task_type": self.rng.choice(seed.TASKS[role]), "notes": "load test",
+            })
+
+    def create_order(self):
+        patient_id = self._find_patient()
+        if patient_id:
+            self.call("POST /doctor/orders/create", "POST", "/doctor/orders/create", {
+                "patient_id": patient_id, "order_type": self.rng.choice(seed.ORDER_TYPES),
+            })
+
+class Nurse(User):
+    role = "nurse"
+    actions = ((6, "dashboard"), (2, "work_ticket"), (1, "mark_read"), (1, "add_report"))
+    TICKET = re.compile(r"/staff/assignments/update-status/(\d+)")
+    NOTIFICATION = re.compile(r"/staff/notifications/mark-read/(\d+)")
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.page = ""
+
+    def dashboard(self):
+        _, self.page = self.call(f"GET /{self.role}", "GET", f"/{self.role}")
+
+    def work_ticket(self):
+        tickets = self.TICKET.findall(self.page)
+        if tickets:
+            self.call("POST /staff/assignments/update-status/<id>", "POST",
+                      f"/staff/assignments/update-status/{self.rng.choice(tickets)}",
+                      {"status": self.rng.choice(("In Progress", "Completed"))})
+
+    def mark_read(self):
+        notifications = self.NOTIFICATION.findall(self.page)
+        if notifications:
+            self.call("POST /staff/notifications/mark-read/<id>", "POST",
+                      f"/staff/notifications/mark-read/{self.rng.choice(notifications)}")
+
+    def add_report(self):
+        self.call("POST /staff/reports/create", "POST", "/staff/reports/create", {
+            "patient_id": self.rng.randint(1, self.patients), "report_text": self.rng.choice(seed.REPORT_TEXT),
+        })
+
+class Radiologist(Nurse):
+    role = "radiologist"
+
+class Patient(User):
+    role = "patient"
+    actions = ((1, "dashboard"),)
+
+    def dashboard(self):
+        self.call("GET /patient", "GET", "/patient")
+
+class Admin(User):
+    role = "admin"
+    actions = ((1, "dashboard"),)
+
+    def dashboard(self):
+        self.call("GET /admin", "GET", "/admin")
+
+USERS = {cls.role: cls for cls in (Doctor, Nurse, Radiologist, Patient, Admin)}
+
+def accounts(db_path):
+    """Seeded accounts per role, read from the database."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        found = {role: n for role, n in conn.execute(
+            "SELECT role, COUNT(*) FROM staff WHERE role != 'admin' GROUP BY role")}
+        found["patient"] = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+    finally:
+        conn.close()
+    return found
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        role, _, weight = part.partition("=")
+        if role.strip() not in USERS:
+            raise SystemExit(f"unknown role in --mix: {role}")
+        mix[role.strip()] = float(weight or 1)
+    return mix
+
+def make_users(args, transport_for, recorder):
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    found = accounts(args.db)
+    roles = rng.choices(list(mix), list(mix.values()), k=args.users)
+    users = []
+    for i, role in enumerate(roles):
+        if role == "admin":
+            account = "admin"
+        else:
+            available = found.get(role, 0)
+            if not available:
+                raise SystemExit(f"no seeded {role} accounts in {args.db}")
+            account = f"{role}{rng.randint(1, available)}"
+        users.append(USERS[role](transport_for(), recorder, random.Random(args.seed * 1000 + i), account,
+                                 found["patient"]))
+    return users
+
+def percentile_table(recorder, elapsed):
+    rows = []
+    for endpoint, samples in sorted(recorder.samples.items()):
+        cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+        rows.append({
+            "endpoint": endpoint, "count": len(samples), "errors": recorder.errors.get(endpoint, 0),
+            "rps": len(samples) / elapsed, "p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(samples),
+        })
+    return rows
+
+def print_table(rows, elapsed):
+    print(f"{'endpoint':<44} {'count':>7} {'err':>5} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for r in rows:
+        print(f"{r['endpoint']:<44} {r['count']:>7} {r['errors']:>5} {r['rps']:>7.1f} "
+              f"{r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} {r['max']:>8.2f}")
+    total = sum(r["count"] for r in rows)
+    print(f"{total} requests in {elapsed:.1f} s ({total / elapsed:.1f} req/s)")
+
+def compare(rows, baseline_path, tolerance, floor_ms):
+    """Print p95 deltas against a saved run; returns the endpoints that regressed."""
+    with open(baseline_path) as f:
+        baseline = {r["endpoint"]: r for r in json.load(f)["endpoints"]}
+    regressed = []
+    print(f"\np95 vs {baseline_path} (tolerance {tolerance:.0%}, ignoring changes under {floor_ms:g} ms)")
+    for r in rows:
+        base = baseline.get(r["endpoint"])
+        if base is None:
+            continue
+        delta = r["p95"] - base["p95"]
+        bad = delta > floor_ms and r["p95"] > base["p95"] * (1 + tolerance)
+        print(f"  {r['endpoint']:<44} {base['p95']:>8.2f} -> {r['p95']:>8.2f} ms {'REGRESSED' if bad else ''}")
+        if bad:
+            regressed.append(r["endpoint"])
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", help="seeded database (see seed.py)")
+    parser.add_argument("--url", help="drive a running server instead of the app in-process")
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds run before measuring")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a user's actions")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"role weights (default {DEFAULT_MIX})")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier --save; exit 1 if a p95 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--floor-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    if args.url:
+        users = make_users(args, lambda: OverHTTP(args.url), recorder)
+    else:
+        os.environ["HOSPITAL_DB"] = str(Path(args.db).resolve())
+        import app as hospital
+        hospital.app.config["LOGIN_RATE_LIMIT_ENABLED"] = False
+        users = make_users(args, lambda: InProcess(hospital.app), recorder)
+    for user in users:
+        # seed.py gives the admin the init_db.py default password.
+        user.login("admin123" if user.role == "admin" else args.password)
+    roles = {}
+    for user in users:
+        roles[user.role] = roles.get(user.role, 0) + 1
+    print(f"{len(users)} users: " + ", ".join(f"{n} {role}" for role, n in sorted(roles.items())))
+
+    stop = threading.Event()
+
+    def run(user):
+        while not stop.is_set():
+            try:
+                user.step()
+            except Exception as e:
+                recorder.add(f"{user.role} error: {type(e).__name__}", 0.0, False)
+            if args.think_ms:
+                time.sleep(args.think_ms / 1000)
+
+    threads = [threading.Thread(target=run, args=(u,), daemon=True) for u in users]
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+
+    rows = percentile_table(recorder, elapsed)
+    print_table(rows, elapsed)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"users": args.users, "mix": args.mix, "duration": elapsed, "endpoints": rows}, f, indent=2)
+    if args.compare and compare(rows, args.compare, args.tolerance, args.floor_ms):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Report the query plan of every dashboard query.
+
+Drives every dashboard and history route through the Flask test client
+against a throwaway database, captures the SQL actually executed via the
+connection trace callback, and runs EXPLAIN QUERY PLAN on each SELECT.
+tests/test_query_plans.py runs the same check as part of the test suite;
+this prints each plan.
+
+    python benchmarks/query_plans.py
+"""
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "plans.db")
+
+import app as hospital  # noqa: E402
+
+def seed(path):
+    """One of each role with a ticket, report and notification; returns ids for VISITS."""
+    conn = sqlite3.connect(path)
+    pw = hospital.hash_pw("pw")
+    conn.executemany(
+        "INSERT INTO staff (name, role, category, username, password_hash) VALUES (?,?,?,?,?)",
+        [(f"{r} 1", r, "General", r, pw) for r in ("admin", "doctor", "nurse", "radiologist")],
+    )
+    conn.execute("INSERT INTO patients (name, username, password_hash) VALUES ('Pat', 'patient', ?)", (pw,))
+    ids = dict(conn.execute(
+        "SELECT role, id FROM staff WHERE username IN ('admin', 'doctor', 'nurse', 'radiologist')"))
+    ids["patient"] = patient = conn.execute("SELECT id FROM patients WHERE username = 'patient'").fetchone()[0]
+    conn.execute("INSERT INTO orders (patient_id, doctor_id, order_type) VALUES (?, ?, 'ECG')",
+                 (patient, ids["doctor"]))
+    for role in ("nurse", "radiologist"):
+        conn.execute(
+            "INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type) VALUES (?, ?, ?, 'Scan')",
+            (patient, ids["doctor"], ids[role]),
+        )
+        conn.execute("INSERT INTO notifications (staff_id, message) VALUES (?, 'hi')", (ids[role],))
+        conn.execute(
+            "INSERT INTO reports (patient_id, created_by_staff_id, report_type) VALUES (?, ?, 'Report')",
+            (patient, ids[role]),
+        )
+    conn.execute("INSERT INTO patient_notifications (patient_id, message) VALUES (?, 'hi')", (patient,))
+    conn.commit()
+    conn.close()
+    return ids
+
+# (login kind, username, pages to visit); {role} is the seeded id
+VISITS = [
+    ("staff", "admin", ["/admin"]),
+    ("staff", "doctor", ["/doctor", "/doctor/patient/{patient}", "/doctor/patient/{patient}/timeline",
+                        "/api/v1/patients/{patient}/history",
+                        "/doctor/reports/search?q=scan&since=2020-01-01&until=2099-12-31&staff_id={radiologist}"]),
+    ("staff", "nurse", ["/nurse", "/api/v1/me/tickets", "/api/v1/me/notifications"]),
+    ("staff", "radiologist", ["/radiologist"]),
+    ("patient", "patient", ["/patient", "/patient/timeline", "/api/v1/patients/{patient}",
+                            "/api/v1/patients/{patient}/reports"]),
+]
+
+def capture_queries():
+    """Yield (page, sql) for every SELECT the VISITS run, against a database without those users yet."""
+    statements = []
+    app = hospital.app
+    app.config["TESTING"] = True
+    # Every query must reach SQLite: no cache built before this point either.
+    app.config["QUERY_CACHE_ENABLED"] = app.config["FRAGMENT_CACHE_ENABLED"] = False
+    app.extensions.pop("query_cache", None)
+    app.extensions.pop("fragment_cache", None)
+    old = app.extensions.pop("db_pool", None)
+    if old is not None:
+        old.close()    # its connections would not be traced
+    pool = hospital.database.get_pool(app)  # runs migrations
+    pool.connect_hooks.append(lambda conn: conn.set_trace_callback(statements.append))
+    ids = seed(app.config["DATABASE"])
+    client = app.test_client()
+    for kind, username, pages in VISITS:
+        client.get("/logout")
+        client.post(f"/login/{kind}", data={"username": username, "password": "pw"})
+        for page in pages:
+            page = page.format(**ids)
+            del statements[:]
+            resp = client.get(page)
+            assert resp.status_code == 200, (page, resp.status_code)
+            for sql in statements:
+                if sql.lstrip().upper().startswith("SELECT"):
+                    yield page, sql
+
+def problems(conn, sql):
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    where = re.search(r"\bWHERE\b(.*)", sql, re.IGNORECASE | re.DOTALL)
+    # An equality filter (doctor_id = ?) beside the keyset (id < ?).
+    equality = where and re.search(r"(?<![<>!])=", where.group(1))
+    bad = []
+    for step in plan:
+        # Unfiltered listings walk the table by design; a filtered lookup
+        # must be a SEARCH, and ORDER BY must come from an index.
+        if where and step.startswith("SCAN ") and "INDEX" not in step:
+            bad.append(step)
+        # Walking a rowid range and filtering each row is a scan too.
+        if equality and re.search(r"INTEGER PRIMARY KEY \(rowid[<>]", step):
+            bad.append(step)
+        if "TEMP B-TREE" in step:
+            bad.append(step)
+    return plan, bad
+
+def main():
+    # A report; tests/test_query_plans.py is the check that fails.
+    failures = 0
+    seen = set()
+    queries = list(capture_queries())
+    conn = sqlite3.connect(hospital.app.config["DATABASE"])
+    for page, sql in queries:
+        key = " ".join(sql.split())
+        if key in seen:
+            continue
+        seen.add(key)
+        plan, bad = problems(conn, sql)
+        status = "FAIL" if bad else "ok"
+        failures += bool(bad)
+        print(f"[{status}] {page}: {key[:110]}")
+        for step in plan:
+            print(f"        {step}")
+    conn.close()
+    print(f"\n{len(seen)} distinct queries, {failures} with full scans")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
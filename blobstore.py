@@ -0,0 +1,81 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+from pathlib import Path
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the formats we accept; the client's Content-Type is not trusted.
+MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"%PDF-", "application/pdf"),
+)
+
+def sniff_mime(head: bytes, ext: str) -> str:
+    for magic, mime in MAGIC:
+        if head.startswith(magic):
+            return mime
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type("x" + ext)[0] or "application/octet-stream"
+
+def shard_path(sha256: str, ext: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+def save_upload(file_storage, upload_dir, conn, allowed_ext):
+    """Stream an upload into the blob store; returns (relative path, sha256, mime) or None.
+
+    The file is hashed while it is copied to a temp file in chunks, so it is
+    never held in memory; identical content is stored once.
+    """
+    if not file_storage or not getattr(file_storage, "filename", ""):
+        return None
+    filename = secure_filename(file_storage.filename)
+    if not filename:
+        return None
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in allowed_ext:
+        return None
+
+    upload_dir = Path(upload_dir)
+    tmp_dir = upload_dir / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+
+        row = conn.execute("SELECT path FROM blobs WHERE sha256=?", (sha256,)).fetchone()
+        rel_path = row["path"] if row else shard_path(sha256, ext)
+        target = upload_dir / rel_path
+        if target.exists():
+            os.remove(tmp_path)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    mime_type = sniff_mime(head, ext)
+    conn.execute(
+        "INSERT OR IGNORE INTO blobs (sha256, size, mime_type, path) VALUES (?,?,?,?)",
+        (sha256, size, mime_type, rel_path),
+    )
+    return rel_path, sha256, mime_type
@@ -0,0 +1,217 @@
+"""Streaming bulk import/export of patients, staff and clinical records.
+
+    python bulk.py import patients ward7.csv
+    python bulk.py import staff new_staff.ndjson --batch-size 1000
+    python bulk.py export orders --format ndjson > orders.ndjson
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import sqlite3
+import sys
+from pathlib import Path
+from passwords import hash_many
+
+APP_DIR = Path(__file__).parent
+BATCH_SIZE = 500
+EXPORT_CHUNK = 1000
+STAFF_ROLES = ("admin", "doctor", "nurse", "radiologist")
+
+IMPORTS = {
+    "patients": {
+        "required": ("name", "username", "password"),
+        "columns": ("name", "username", "password_hash", "phone", "dob", "gender"),
+    },
+    "staff": {
+        "required": ("name", "role", "username", "password"),
+        "columns": ("name", "role", "category", "username", "password_hash", "phone", "is_available"),
+    },
+}
+
+# Password hashes are never exported.
+EXPORTS = {
+    "patients": ("patients", ("id", "name", "username", "phone", "dob", "gender", "created_at")),
+    "orders": ("orders", ("id", "patient_id", "doctor_id", "order_type", "notes", "status", "created_at")),
+    "assignments": ("assignments", ("id", "patient_id", "doctor_id", "assignee_staff_id", "task_type",
+                                    "notes", "status", "created_at")),
+    "reports": ("reports", ("id", "patient_id", "created_by_staff_id", "report_type", "report_text",
+                            "image_filename", "blob_sha256", "created_at")),
+}
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.inserted = 0
+        self.errors = []    # (line number, username, message)
+
+    def error(self, line, username, message):
+        self.errors.append((line, username, message))
+
+    def summary(self, max_errors=10):
+        text = f"Imported {self.inserted} {self.kind}, {len(self.errors)} rejected"
+        if self.errors:
+            self.errors.sort(key=lambda e: e[0])
+            shown = "; ".join(f"line {line} ({user or '-'}): {msg}" for line, user, msg in self.errors[:max_errors])
+            more = f"; +{len(self.errors) - max_errors} more" if len(self.errors) > max_errors else ""
+            text += f": {shown}{more}"
+        return text
+
+def detect_format(filename: str) -> str:
+    return "ndjson" if filename.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+def read_rows(binary_stream, fmt):
+    """Yield (line number, dict) from a binary CSV/NDJSON stream, one row at a time."""
+    text = codecs.getreader("utf-8-sig")(binary_stream)
+    if fmt == "ndjson":
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+                continue
+            yield line_no, row if isinstance(row, dict) else ValueError("expected a JSON object")
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+
+def _clean(kind, row):
+    row = {k.strip().lower(): (str(v).strip() if v is not None else "") for k, v in row.items() if k}
+    missing = [f for f in IMPORTS[kind]["required"] if not row.get(f)]
+    if missing:
+        raise ValueError("missing " + ", ".join(missing))
+    if kind == "staff":
+        if row["role"] not in STAFF_ROLES:
+            raise ValueError("role must be admin, doctor, nurse, or radiologist")
+        available = row.get("is_available", "1").lower()
+        row["is_available"] = 0 if available in ("0", "false", "no", "off") else 1
+    return row
+
+def _insert_batch(conn, kind, batch, report):
+    columns = IMPORTS[kind]["columns"]
+    sql = f"INSERT INTO {kind} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for (line, row), pw_hash in zip(batch, hash_many(row["password"] for _, row in batch)):
+        row["password_hash"] = pw_hash
+    values = [tuple(row.get(c) for c in columns) for _, row in batch]
+    conn.execute("SAVEPOINT bulk_batch")
+    try:
+        conn.executemany(sql, values)
+        report.inserted += len(values)
+    except sqlite3.IntegrityError:
+        # Rare path: redo the batch row by row to find the offending rows.
+        conn.execute("ROLLBACK TO bulk_batch")
+        for (line, row), params in zip(batch, values):
+            try:
+                conn.execute(sql, params)
+                report.inserted += 1
+            except sqlite3.IntegrityError:
+                report.error(line, row["username"], "username already exists")
+    conn.execute("RELEASE bulk_batch")
+    conn.commit()
+
+def import_rows(conn, kind, rows, batch_size=BATCH_SIZE):
+    """Insert (line, row) pairs in batched transactions; returns an ImportReport."""
+    report = ImportReport(kind)
+    batch = []
+    seen = set()
+    for line, row in rows:
+        if isinstance(row, Exception):
+            report.error(line, None, f"unreadable row: {row}")
+            continue
+        try:
+            row = _clean(kind, row)
+        except ValueError as e:
+            report.error(line, row.get("username"), str(e))
+            continue
+        if row["username"] in seen:
+            report.error(line, row["username"], "duplicate username in file")
+            continue
+        seen.add(row["username"])
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            _insert_batch(conn, kind, batch, report)
+            batch = []
+    if batch:
+        _insert_batch(conn, kind, batch, report)
+    return report
+
+def iter_table(acquire, release, kind, chunk=EXPORT_CHUNK):
+    """Yield rows of an export table in id order, one keyset chunk at a time.
+
+    A connection is held only for the duration of each chunk, so a slow
+    download never pins a connection or a long read transaction.
+    """
+    table, columns = EXPORTS[kind]
+    sql = f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?"
+    last_id = 0
+    while True:
+        conn = acquire()
+        try:
+            rows = conn.execute(sql, (last_id, chunk)).fetchall()
+        finally:
+            release(conn)
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+def export_lines(rows, kind, fmt):
+    """Encode rows as CSV (with header) or NDJSON text, one chunk of lines at a time."""
+    columns = EXPORTS[kind][1]
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        if fmt == "csv":
+            writer.writerow(tuple(row))
+        else:
+            buf.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+        pending += 1
+        if pending >= EXPORT_CHUNK:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    if buf.tell():
+        yield buf.getvalue()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=str(APP_DIR / "hospital.db"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import")
+    imp.add_argument("kind", choices=sorted(IMPORTS))
+    imp.add_argument("file")
+    imp.add_argument("--format", choices=("csv", "ndjson"))
+    imp.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    exp = sub.add_parser("export")
+    exp.add_argument("kind", choices=sorted(EXPORTS))
+    exp.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    try:
+        if args.command == "import":
+            fmt = args.format or detect_format(args.file)
+            with open(args.file, "rb") as f:
+                report = import_rows(conn, args.kind, read_rows(f, fmt), args.batch_size)
+            for line, username, message in sorted(report.errors, key=lambda e: e[0]):
+                print(f"line {line}\t{username or '-'}\t{message}", file=sys.stderr)
+            print(f"✅ {report.inserted} {args.kind} imported, {len(report.errors)} rejected")
+            return 1 if report.errors else 0
+        rows = iter_table(lambda: conn, lambda c: None, args.kind)
+        for text in export_lines(rows, args.kind, args.format):
+            sys.stdout.write(text)
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+import peers
+
+DEFAULTS = {
+    "QUERY_CACHE_ENABLED": True,
+    "QUERY_CACHE_TTL": 30.0,          # seconds; bounds staleness across processes
+    "QUERY_CACHE_MAX_ENTRIES": 5000,
+}
+
+class QueryCache:
+    """Read-through cache of query results with TTL, LRU eviction and tags.
+
+    Each entry carries tags naming the data it was built from (e.g. "staff",
+    "patient:42"); write paths call invalidate() with the tags they touched.
+    Per-tag generation counters stop a load that raced with an invalidation
+    from storing its (possibly stale) result.
+    """
+
+    def __init__(self, max_entries=5000, ttl=30.0, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()    # key -> (expires_at, value, tags)
+        self._by_tag = {}                # tag -> set of keys
+        self._generation = {}            # tag -> int
+        self._epoch = 0                  # bumped by clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.on_invalidate = None        # called with the tags, e.g. to tell other processes
+        self.on_clear = None             # likewise after clear()
+
+    def get_or_load(self, key, tags, loader, ttl=None):
+        if not self.enabled:
+            return loader()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generations = self._generations(tags)
+        value = loader()
+        with self._lock:
+            if generations == self._generations(tags):
+                self._store(key, value, tuple(tags), now + (self.ttl if ttl is None else ttl))
+        return value
+
+    def _generations(self, tags):
+        return (self._epoch, [self._generation.get(tag, 0) for tag in tags])
+
+    def _store(self, key, value, tags, expires_at):
+        self._drop(key)
+        self._entries[key] = (expires_at, value, tags)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, *tags):
+        self._invalidate(tags)
+        if self.on_invalidate is not None:
+            self.on_invalidate(tags)
+
+    def _invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generation[tag] = self._generation.get(tag, 0) + 1
+                for key in list(self._by_tag.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def version(self, *tags):
+        """Hashable snapshot of the tags' generations; changes on invalidation."""
+        with self._lock:
+            return (self._epoch, *((tag, self._generation.get(tag, 0)) for tag in tags))
+
+    def clear(self):
+        self._clear()
+        if self.on_clear is not None:
+            self.on_clear()
+
+    def _clear(self):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+_cache_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+def get_cache(app):
+    # Built on first use, like the connection pool, so tests can disable it.
+    cache = app.extensions.get("query_cache")
+    if cache is None:
+        with _cache_lock:
+            cache = app.extensions.get("query_cache")
+            if cache is None:
+                cache = QueryCache(
+                    max_entries=app.config["QUERY_CACHE_MAX_ENTRIES"],
+                    ttl=app.config["QUERY_CACHE_TTL"],
+                    enabled=app.config["QUERY_CACHE_ENABLED"],
+                )
+                if app.config.get("PEERS_DIR"):
+                    # Other workers drop their copies of what this one wrote.
+                    cache.on_invalidate = lambda tags: peers.send(app, "invalidate", list(tags))
+                    peers.on(app, "invalidate", cache._invalidate)
+                    cache.on_clear = lambda: peers.send(app, "clear", None)
+                    peers.on(app, "clear", lambda payload: cache._clear())
+                app.extensions["query_cache"] = cache
+    return cache
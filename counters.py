@@ -0,0 +1,130 @@
+"""Trigger-maintained counters (migration 0008): rebuild, verify, summary.
+
+    python counters.py verify                 # exit 1 if any counter drifted
+    python counters.py rebuild --db seed.db   # recompute from the base tables
+
+Triggers keep staff_counters and patient_counters in step with every write,
+including ones made outside the app. rebuild() exists for data loaded with
+the triggers dropped (seed.py) or after manual repairs; it runs in one write
+transaction, so concurrent writers wait rather than race it.
+"""
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+from workload import OPEN_STATUSES
+
+APP_DIR = Path(__file__).parent
+SUMMARY_TTL = 10.0    # seconds the admin summary may lag behind
+TOP = 10
+
+# (table, key column, counter column, query yielding (key, expected count))
+COUNTERS = (
+    ("staff_counters", "staff_id", "open_assignments",
+     f"SELECT assignee_staff_id, COUNT(*) FROM assignments WHERE status IN {OPEN_STATUSES!r} GROUP BY assignee_staff_id"),
+    ("staff_counters", "staff_id", "unread_notifications",
+     "SELECT staff_id, COUNT(*) FROM notifications WHERE is_read = 0 GROUP BY staff_id"),
+    ("patient_counters", "patient_id", "reports",
+     "SELECT patient_id, COUNT(*) FROM reports GROUP BY patient_id"),
+    ("patient_counters", "patient_id", "unread_notifications",
+     "SELECT patient_id, COUNT(*) FROM patient_notifications WHERE is_read = 0 GROUP BY patient_id"),
+)
+
+def rebuild(conn):
+    """Recompute every counter; returns the number of counter rows written."""
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in sorted({c[0] for c in COUNTERS}):
+            conn.execute(f"DELETE FROM {table}")
+        for table, key, column, sql in COUNTERS:
+            conn.execute(f"""
+                INSERT INTO {table} ({key}, {column}) SELECT * FROM ({sql}) WHERE true
+                ON CONFLICT({key}) DO UPDATE SET {column} = excluded.{column}
+            """)
+        rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                   for table in sorted({c[0] for c in COUNTERS}))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+def verify(conn):
+    """[(table, key, column, stored, expected)] for every counter that drifted."""
+    drift = []
+    conn.commit()
+    conn.execute("BEGIN")    # one snapshot for counters and base tables
+    try:
+        for table, key, column, sql in COUNTERS:
+            expected = dict(conn.execute(sql).fetchall())
+            stored = dict(conn.execute(f"SELECT {key}, {column} FROM {table} WHERE {column} != 0").fetchall())
+            for k in expected.keys() | stored.keys():
+                if expected.get(k, 0) != stored.get(k, 0):
+                    drift.append((table, k, column, stored.get(k, 0), expected.get(k, 0)))
+    finally:
+        conn.execute("ROLLBACK")
+    return sorted(drift)
+
+def summary(conn):
+    """Totals and top lists for the admin dashboard, all read from the counters."""
+    open_total, unread_staff = conn.execute(
+        "SELECT COALESCE(SUM(open_assignments), 0), COALESCE(SUM(unread_notifications), 0) FROM staff_counters"
+    ).fetchone()
+    reports_total, unread_patients = conn.execute(
+        "SELECT COALESCE(SUM(reports), 0), COALESCE(SUM(unread_notifications), 0) FROM patient_counters"
+    ).fetchone()
+    by_role = conn.execute("""
+        SELECT s.role, COUNT(*) AS staff, SUM(s.is_available) AS available,
+               COALESCE(SUM(c.open_assignments), 0) AS open_assignments,
+               COALESCE(MAX(c.open_assignments), 0) AS max_open
+        FROM staff s LEFT JOIN staff_counters c ON c.staff_id = s.id
+        WHERE s.role IN ('nurse', 'radiologist')
+        GROUP BY s.role
+    """).fetchall()
+    busiest = conn.execute(f"""
+        SELECT s.id, s.name, s.role, s.category, s.is_available, c.open_assignments, c.unread_notifications
+        FROM staff_counters c JOIN staff s ON s.id = c.staff_id
+        WHERE c.open_assignments > 0
+        ORDER BY c.open_assignments DESC
+        LIMIT {TOP}
+    """).fetchall()
+    most_reports = conn.execute(f"""
+        SELECT p.id, p.name, c.reports, c.unread_notifications
+        FROM patient_counters c JOIN patients p ON p.id = c.patient_id
+        WHERE c.reports > 0
+        ORDER BY c.reports DESC
+        LIMIT {TOP}
+    """).fetchall()
+    return {
+        "open_assignments": open_total,
+        "unread_staff_notifications": unread_staff,
+        "unread_patient_notifications": unread_patients,
+        "reports": reports_total,
+        "by_role": by_role,
+        "busiest": busiest,
+        "most_reports": most_reports,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("verify", "rebuild"))
+    parser.add_argument("--db", default=str(APP_DIR / "hospital.db"))
+    args = parser.parse_args(argv)
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        if args.command == "rebuild":
+            print(f"rebuilt {rebuild(conn)} counter rows")
+            return 0
+        drift = verify(conn)
+        for table, key, column, stored, expected in drift[:20]:
+            print(f"{table}[{key}].{column}: stored {stored}, expected {expected}")
+        if len(drift) > 20:
+            print(f"... {len(drift) - 20} more")
+        print(f"{len(drift)} counters drifted" if drift else "all counters match")
+        return 1 if drift else 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
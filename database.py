@@ -0,0 +1,192 @@
+import sqlite3
+import threading
+import queue
+import time
+import migrate
+from flask import g, current_app
+
+# Pool size and per-connection PRAGMA tuning; override through app.config.
+DEFAULTS = {
+    "DB_POOL_SIZE": 8,
+    "DB_POOL_TIMEOUT": 5.0,          # seconds to wait for a free connection
+    "DB_BUSY_TIMEOUT_MS": 5000,
+    "DB_MMAP_SIZE": 256 * 1024 * 1024,
+    "DB_CACHE_SIZE_KB": 64 * 1024,
+    "DB_AUTO_MIGRATE": True,
+    "DB_CONNECTION_FACTORY": sqlite3.Connection,
+}
+
+class PoolExhausted(RuntimeError):
+    pass
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to `size` and handed out LIFO so the
+    warmest connection (hot page cache, prepared statements) is reused first.
+    """
+
+    def __init__(self, path, size=8, timeout=5.0, busy_timeout_ms=5000,
+                 mmap_size=0, cache_size_kb=0, factory=sqlite3.Connection):
+        self.path = str(path)
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.factory = factory
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._closed = False
+        # Callables run on every freshly opened connection (tracing, functions).
+        self.connect_hooks = []
+
+    def _connect(self):
+        # Connections migrate between request threads, so same-thread checks
+        # are disabled; the pool guarantees a single user at a time.
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               timeout=self.busy_timeout_ms / 1000, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)};")
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        if self.mmap_size:
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)};")
+        if self.cache_size_kb:
+            # Negative cache_size is in KiB rather than pages.
+            conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)};")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        for hook in self.connect_hooks:
+            hook(conn)
+        return conn
+
+    def connect(self):
+        """A standalone connection with the pool's settings, not pooled."""
+        return self._connect()
+
+    def acquire(self):
+        if self._closed:
+            raise PoolExhausted("connection pool is closed")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    open_new = True
+                else:
+                    open_new = False
+            if open_new:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolExhausted(
+                        f"no database connection free after {self.timeout}s"
+                    ) from None
+                finally:
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += time.perf_counter() - started
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return conn
+
+    def release(self, conn):
+        # Never hand a connection with an open transaction to the next request.
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put_nowait(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_s": round(self._wait_time, 6),
+            }
+
+_pool_lock = threading.Lock()
+
+def init_app(app, path):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.config.setdefault("DATABASE", str(path))
+    app.teardown_appcontext(_release_db)
+
+def get_pool(app):
+    # Built on first use so config set after import (tests, launchers) applies.
+    pool = app.extensions.get("db_pool")
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get("db_pool")
+            if pool is None:
+                if app.config["DB_AUTO_MIGRATE"]:
+                    migrate.upgrade_path(app.config["DATABASE"])
+                pool = ConnectionPool(
+                    app.config["DATABASE"],
+                    size=app.config["DB_POOL_SIZE"],
+                    timeout=app.config["DB_POOL_TIMEOUT"],
+                    busy_timeout_ms=app.config["DB_BUSY_TIMEOUT_MS"],
+                    mmap_size=app.config["DB_MMAP_SIZE"],
+                    cache_size_kb=app.config["DB_CACHE_SIZE_KB"],
+                    factory=app.config["DB_CONNECTION_FACTORY"],
+                )
+                app.extensions["db_pool"] = pool
+    return pool
+
+def get_db():
+    # One connection per app context; returned to the pool on teardown.
+    if "db_conn" not in g:
+        g.db_conn = get_pool(current_app).acquire()
+    return g.db_conn
+
+def release_db():
+    # Return the request's connection early, e.g. before slow CPU work;
+    # the next get_db() checks out a fresh one.
+    _release_db()
+
+def _release_db(exc=None):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        get_pool(current_app).release(conn)
@@ -0,0 +1,392 @@
+import json
+import selectors
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+import peers
+
+# Channels are "staff:<id>" / "patient:<id>"; events are plain dicts with a
+# "type" key. Publishers call notify() after their transaction commits.
+
+HEARTBEAT_SECONDS = 15
+SUBSCRIPTION_BUFFER = 100
+RETRY_MS = 5000                   # EventSource reconnect delay
+UNREAD_TTL_SECONDS = 60           # seeded unread counts are read again after this
+MAX_PENDING_BYTES = 64 * 1024     # unsent bytes before a hub stream is disconnected
+
+class Subscription:
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        # Bounded: a stalled client drops its oldest events, never grows.
+        self._events = deque(maxlen=SUBSCRIPTION_BUFFER)
+        self._ready = threading.Condition(threading.Lock())
+        self.closed = False
+        self.on_ready = None    # called after put(), e.g. by the StreamHub serving it
+
+    def put(self, event):
+        with self._ready:
+            self._events.append(event)
+            self._ready.notify()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def get(self, timeout=HEARTBEAT_SECONDS):
+        """Block until events arrive (or timeout); returns a possibly empty list."""
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+            with self._ready:
+                self._ready.notify()
+
+class Broker(ABC):
+    """Pub/sub interface. Swap in another backend via init_app(app, broker)."""
+
+    @abstractmethod
+    def publish(self, channel, event):
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel) -> Subscription:
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        ...
+
+    def stats(self):
+        return {}
+
+class MemoryBroker(Broker):
+    """In-process broker; an idle subscriber costs an empty buffer."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._published = 0
+
+    def publish(self, channel, event):
+        with self._lock:
+            subs = list(self._channels.get(channel, ()))
+            self._published += 1
+        for sub in subs:
+            sub.put(event)
+
+    def subscribe(self, channel):
+        sub = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subs = self._channels.get(subscription.channel)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._channels[subscription.channel]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "channels": len(self._channels),
+                "subscribers": sum(len(s) for s in self._channels.values()),
+                "published": self._published,
+            }
+
+class UnreadCounts:
+    """Per-channel unread notification counts kept in memory.
+
+    Seeded from the database per channel, together with the highest
+    notification id at that moment; a notification at or below that id was
+    already counted, so its publisher's later added() call is a no-op.
+    A seed older than `ttl` is read again by the next get(), so a count
+    that missed a peer message is right again within a page load or two.
+    """
+
+    def __init__(self, ttl=UNREAD_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._counts = {}     # channel -> [count, max_id, seeded_at]
+        self._loading = {}    # channel -> [loads running, ids added meanwhile]
+
+    def get(self, channel, load):
+        # load() -> (unread_count, max_notification_id). It runs outside the
+        # lock: a slow seed holds up its own stream, not every channel.
+        started = time.monotonic()
+        with self._lock:
+            entry = self._counts.get(channel)
+            if entry is not None and started - entry[2] < self.ttl:
+                return entry[0]
+            loading = self._loading.setdefault(channel, [0, []])
+            loading[0] += 1
+        try:
+            count, max_id = load()
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[channel]
+        max_id = max_id or 0
+        with self._lock:
+            # Notifications added while the query ran that it did not see.
+            late = [i for i in loading[1] if i > max_id]
+            entry = self._counts.get(channel)
+            if entry is None or entry[2] < started:    # else a newer seed got here first
+                entry = self._counts[channel] = [count + len(late), max([max_id, *late]), started]
+            return entry[0]
+
+    def added(self, channel, notif_id):
+        with self._lock:
+            loading = self._loading.get(channel)
+            if loading is not None:
+                loading[1].append(notif_id)
+            entry = self._counts.get(channel)
+            if entry is None:
+                return None
+            if notif_id > entry[1]:
+                entry[0] += 1
+            return entry[0]
+
+    def read(self, channel, n=1):
+        with self._lock:
+            entry = self._counts.get(channel)
+            if entry is None:
+                return None
+            entry[0] = max(0, entry[0] - n)
+            return entry[0]
+
+class _Stream:
+    def __init__(self, sock, subscription):
+        self.sock = sock
+        self.subscription = subscription
+        self.pending = bytearray()    # written but not yet sent
+        self.mask = 0                 # selector events registered for
+
+class StreamHub:
+    """Event streams handed over by the server, all served by one thread.
+
+    Under serve.py an /events request writes its headers and first event
+    like any other response; the server then passes the connection to
+    attach() and its request thread and slot are free again. An idle
+    stream costs a socket and a subscription. Sends never block: a client
+    that stops reading is disconnected once MAX_PENDING_BYTES wait for it,
+    and its EventSource reconnects.
+    """
+
+    def __init__(self, max_streams, heartbeat=HEARTBEAT_SECONDS):
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._wake_in, self._wake_out = socket.socketpair()
+        self._wake_in.setblocking(False)
+        self._wake_out.setblocking(False)
+        self._selector.register(self._wake_in, selectors.EVENT_READ)
+        self._streams = set()     # used by the hub thread only
+        self._count = 0           # reserved or open
+        self._attached = []       # waiting for the hub thread to take them
+        self._ready = set()       # streams whose subscription has events
+        self._stopping = False
+        self.opened = 0
+        self.slow = 0             # disconnected for not reading
+        self._thread = threading.Thread(target=self._run, name="event-streams", daemon=True)
+        self._thread.start()
+
+    def reserve(self):
+        """Claim room for one more stream; False when full or stopping."""
+        with self._lock:
+            if self._stopping or self._count >= self.max_streams:
+                return False
+            self._count += 1
+            return True
+
+    def attach(self, sock, subscription):
+        """Take over a reserve()d connection whose response headers are sent."""
+        stream = _Stream(sock, subscription)
+        subscription.on_ready = lambda: self._wake(stream)
+        with self._lock:
+            if self._stopping:
+                self._count -= 1
+                sock.close()
+                subscription.close()
+                return
+            self.opened += 1
+            self._attached.append(stream)
+            self._ready.add(stream)    # anything published before on_ready was set
+        self._signal()
+
+    def close(self, timeout=5.0):
+        """Disconnect every stream; their clients reconnect, to another worker if there is one."""
+        with self._lock:
+            self._stopping = True
+        self._signal()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"streams": self._count, "max_streams": self.max_streams, "opened": self.opened,
+                    "slow_disconnects": self.slow}
+
+    def _wake(self, stream):
+        with self._lock:
+            self._ready.add(stream)
+        self._signal()
+
+    def _signal(self):
+        try:
+            self._wake_out.send(b"\0")
+        except OSError:
+            pass    # full: a wakeup is already pending; closed: the hub has stopped
+
+    def _run(self):
+        beat = time.monotonic() + self.heartbeat
+        while True:
+            for key, mask in self._selector.select(max(0.0, beat - time.monotonic())):
+                if key.data is None:
+                    self._drain_wakeups()
+                elif mask & selectors.EVENT_READ:
+                    self._read(key.data)
+                else:
+                    self._send(key.data)
+            with self._lock:
+                attached, self._attached = self._attached, []
+                ready, self._ready = self._ready, set()
+                stopping = self._stopping
+            for stream in attached:
+                stream.sock.setblocking(False)
+                self._streams.add(stream)
+            for stream in ready:
+                if stream in self._streams:
+                    events = stream.subscription.get(0)
+                    stream.pending += "".join(format_sse(event) for event in events).encode()
+                    self._send(stream)
+            if time.monotonic() >= beat:
+                for stream in list(self._streams):
+                    stream.pending += b": keepalive\n\n"
+                    self._send(stream)
+                beat = time.monotonic() + self.heartbeat
+            if stopping:
+                for stream in list(self._streams):
+                    self._close(stream)
+                self._selector.close()
+                self._wake_in.close()
+                self._wake_out.close()
+                return
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_in.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _read(self, stream):
+        # Clients send nothing after the request; readable means gone.
+        try:
+            data = stream.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._close(stream)
+
+    def _send(self, stream):
+        try:
+            if stream.pending:
+                del stream.pending[:stream.sock.send(stream.pending)]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._close(stream)
+            return
+        if len(stream.pending) > MAX_PENDING_BYTES:
+            self.slow += 1
+            self._close(stream)
+            return
+        mask = selectors.EVENT_READ | (selectors.EVENT_WRITE if stream.pending else 0)
+        if mask != stream.mask:
+            if stream.mask:
+                self._selector.modify(stream.sock, mask, stream)
+            else:
+                self._selector.register(stream.sock, mask, stream)
+            stream.mask = mask
+
+    def _close(self, stream):
+        if stream not in self._streams:
+            return
+        self._streams.remove(stream)
+        if stream.mask:
+            self._selector.unregister(stream.sock)
+        stream.sock.close()
+        stream.subscription.close()
+        with self._lock:
+            self._count -= 1
+
+def init_app(app, broker=None):
+    app.extensions["broker"] = broker or MemoryBroker()
+    app.extensions["unread_counts"] = UnreadCounts()
+    # Under serve.py, notifications published by other workers: count them
+    # here too and push them to this worker's subscribers.
+    peers.on(app, "notification", lambda message: _notified(app, *message))
+    peers.on(app, "read", lambda message: _read(app, *message))
+
+def staff_channel(staff_id):
+    return f"staff:{staff_id}"
+
+def patient_channel(patient_id):
+    return f"patient:{patient_id}"
+
+def notify(app, channel, notif_id, message):
+    _notified(app, channel, notif_id, message)
+    peers.send(app, "notification", [channel, notif_id, message])
+
+def mark_read(app, channel, n=1):
+    _read(app, channel, n)
+    peers.send(app, "read", [channel, n])
+
+def _notified(app, channel, notif_id, message):
+    unread = app.extensions["unread_counts"].added(channel, notif_id)
+    app.extensions["broker"].publish(channel, {
+        "type": "notification", "id": notif_id, "message": message, "unread": unread,
+    })
+
+def _read(app, channel, n):
+    unread = app.extensions["unread_counts"].read(channel, n)
+    if unread is not None:
+        app.extensions["broker"].publish(channel, {"type": "unread", "unread": unread})
+
+def stats(app):
+    hub = app.extensions.get("stream_hub")
+    return {**app.extensions["broker"].stats(), "hub": hub.stats() if hub is not None else None}
+
+def format_sse(event) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+def opening(first_event) -> str:
+    return f"retry: {RETRY_MS}\n\n" + format_sse(first_event)
+
+def stream(subscription, first_event, heartbeat=HEARTBEAT_SECONDS):
+    # Generator for the SSE response body when no StreamHub takes the
+    # connection (the development server); holds no DB connection.
+    try:
+        yield opening(first_event)
+        while True:
+            events = subscription.get(heartbeat)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            yield "".join(format_sse(event) for event in events)
+    finally:
+        subscription.close()
@@ -0,0 +1,72 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+from jinja2 import FileSystemBytecodeCache
+import os
+import threading
+import cache
+
+DEFAULTS = {
+    "FRAGMENT_CACHE_ENABLED": True,
+    "FRAGMENT_CACHE_MAX_ENTRIES": 500,
+    # Directory for compiled template bytecode shared by workers; None = off.
+    "TEMPLATE_BYTECODE_DIR": os.environ.get("HOSPITAL_TEMPLATE_CACHE"),
+}
+
+class FragmentCacheExtension(Extension):
+    """{% cache "name", key, ... %}...{% endcache %} caches rendered HTML.
+
+    Keys should include data_version(<tags>) so a write that invalidates
+    those tags also retires the fragments rendered from them.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_cached", [nodes.List(args)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key_parts, caller):
+        fragment_cache = get_fragment_cache(self.environment.hospital_app)
+        return fragment_cache.get_or_load(("fragment", *key_parts), (), caller)
+
+_lock = threading.Lock()
+
+def get_fragment_cache(app):
+    frag = app.extensions.get("fragment_cache")
+    if frag is None:
+        with _lock:
+            frag = app.extensions.get("fragment_cache")
+            if frag is None:
+                frag = cache.QueryCache(
+                    max_entries=app.config["FRAGMENT_CACHE_MAX_ENTRIES"],
+                    ttl=app.config["QUERY_CACHE_TTL"],
+                    enabled=app.config["FRAGMENT_CACHE_ENABLED"],
+                )
+                app.extensions["fragment_cache"] = frag
+    return frag
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.extend(hospital_app=app)
+    if app.config["TEMPLATE_BYTECODE_DIR"]:
+        os.makedirs(app.config["TEMPLATE_BYTECODE_DIR"], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config["TEMPLATE_BYTECODE_DIR"])
+
+    @app.template_global()
+    def data_version(*tags):
+        return cache.get_cache(app).version(*tags)
+
+def precompile(app):
+    """Load and compile every template now instead of on first request."""
+    names = app.jinja_env.list_templates(extensions=("html",))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
@@ -1,33 +1,32 @@
 import sqlite3
+import sys
 from pathlib import Path
-import hashlib
 import os
+import migrate
+from passwords import hash_pw
 
 APP_DIR = Path(__file__).parent
-DB_PATH = APP_DIR / "hospital.db"
-SCHEMA_PATH = APP_DIR / "schema.sql"
-
-def hash_pw(pw: str) -> str:
-    return hashlib.sha256(pw.encode("utf-8")).hexdigest()
+DB_PATH = Path(os.environ.get("HOSPITAL_DB", APP_DIR / "hospital.db"))
 
 def main():
-    if DB_PATH.exists():
+    # Upgrades an existing database in place; pass --reset to start from scratch.
+    if "--reset" in sys.argv and DB_PATH.exists():
         os.remove(DB_PATH)
 
     conn = sqlite3.connect(DB_PATH)
-    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
-        conn.executescript(f.read())
+    conn.execute("PRAGMA foreign_keys = ON;")
+    migrate.upgrade(conn, verbose=True)
 
     # Insert default admin into staff table
     conn.execute(
-        "INSERT INTO staff (name, role, category, username, password_hash, is_available) VALUES (?, ?, ?, ?, ?, ?)",
+        "INSERT OR IGNORE INTO staff (name, role, category, username, password_hash, is_available) VALUES (?, ?, ?, ?, ?, ?)",
         ("Administrator", "admin", "Management", "admin", hash_pw("admin123"), 1),
     )
 
     conn.commit()
-    conn.close()
-    print("✅ Database ready: hospital.db")
+    print(f"✅ Database ready: {DB_PATH.name} (schema version {migrate.current_version(conn)})")
     print("✅ Default admin: admin / admin123")
+    conn.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,287 @@
+"""Per-route request metrics, SQL instrumentation and on-demand profiling.
+
+Every request records wall time, time in SQL, statements run and rows
+fetched into per-route histograms, rendered in Prometheus text format at
+/metrics. Statements are seen through the connection's trace callback;
+time and rows through a Cursor subclass installed as the pool's connection
+factory. Requests slower than METRICS_SLOW_REQUEST_MS are logged with the
+query plan of each statement, and admins can profile one request with
+cProfile by sending `X-Profile: 1`.
+"""
+import cProfile
+import hmac
+import io
+import logging
+import pstats
+import sqlite3
+import threading
+import time
+from collections import deque
+from flask import g, request, session
+import backup
+import cache
+import database
+
+DEFAULTS = {
+    "METRICS_ENABLED": True,
+    "METRICS_SLOW_REQUEST_MS": None,          # e.g. 500 to log slow requests with plans
+    "METRICS_TOKEN": None,                    # scrapers send `Authorization: Bearer <token>`
+    "METRICS_ALLOW": (),                      # addresses that may scrape without a token, e.g. ("10.0.0.5",)
+    "METRICS_MAX_STATEMENTS": 100,            # statements kept per request for the slow log
+}
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+PROFILES_KEPT = 20
+
+log = logging.getLogger("hospital.slow")
+
+def scraper_allowed(app, req):
+    """True if the request carries METRICS_TOKEN or comes from a METRICS_ALLOW address.
+
+    Nothing is trusted by default: behind a local reverse proxy every
+    request would come from loopback.
+    """
+    token = app.config["METRICS_TOKEN"]
+    if token and hmac.compare_digest(req.headers.get("Authorization", "").encode(),
+                                     f"Bearer {token}".encode()):
+        return True
+    return req.remote_addr in app.config["METRICS_ALLOW"]
+
+class Histogram:
+    """Cumulative-bucket histogram per label value, Prometheus style."""
+
+    def __init__(self, name, help, buckets, label="route"):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self._lock = threading.Lock()
+        self._series = {}    # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for label_value, series in items:
+            label = f'{self.label}="{label_value}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[len(self.buckets)]}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {series[len(self.buckets)]}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}    # (route, status) -> int
+
+    def inc(self, labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for (route, status), value in items:
+            lines.append(f'{self.name}{{route="{route}",status="{status}"}} {value}')
+        return lines
+
+REQUEST_SECONDS = Histogram("hospital_request_seconds", "Wall time per request.", TIME_BUCKETS)
+SQL_SECONDS = Histogram("hospital_request_sql_seconds", "Time spent in SQLite per request.", TIME_BUCKETS)
+QUERIES = Histogram("hospital_request_queries", "SQL statements per request.", COUNT_BUCKETS)
+ROWS = Histogram("hospital_request_rows", "Rows fetched per request.", COUNT_BUCKETS)
+REQUESTS = Counter("hospital_requests_total", "Requests by route and status.")
+
+class RequestStats:
+    __slots__ = ("sql_seconds", "queries", "rows", "statements", "max_statements")
+
+    def __init__(self, max_statements):
+        self.sql_seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.statements = []
+        self.max_statements = max_statements
+
+# Set for the thread serving a request; background threads record nothing.
+_current = threading.local()
+
+def _stats():
+    return getattr(_current, "stats", None)
+
+def _trace(statement):
+    stats = _stats()
+    if stats is not None:
+        stats.queries += 1
+        if len(stats.statements) < stats.max_statements:
+            stats.statements.append(statement)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _add_time(started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _add_time(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        _add_time(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        rows = super().fetchmany(*args)
+        _add_time(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        _add_time(started, len(rows))
+        return rows
+
+def _add_time(started, rows=0):
+    stats = _stats()
+    if stats is not None:
+        stats.sql_seconds += time.perf_counter() - started
+        stats.rows += rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Pool connection factory: cursors are timed, statements traced."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts bypass cursor(); route them through it.
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+_profiles = deque(maxlen=PROFILES_KEPT)    # (number, time, path, report)
+_profile_count = 0
+_profile_lock = threading.Lock()
+
+def _explain(conn, statements):
+    plans = []
+    for statement in statements:
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            continue
+        try:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+            plans.append((statement, [r[3] for r in rows]))
+        except sqlite3.Error as e:
+            plans.append((statement, [f"(no plan: {e})"]))
+    return plans
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    if app.config["METRICS_ENABLED"]:
+        app.config["DB_CONNECTION_FACTORY"] = InstrumentedConnection
+
+    @app.before_request
+    def _start():
+        if not app.config["METRICS_ENABLED"]:
+            return
+        g.metrics_started = time.perf_counter()
+        _current.stats = RequestStats(app.config["METRICS_MAX_STATEMENTS"])
+        if request.headers.get("X-Profile") == "1" and session.get("role") == "admin":
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+            global _profile_count
+            with _profile_lock:
+                _profile_count += 1
+                _profiles.append((_profile_count, time.strftime("%Y-%m-%d %H:%M:%S"), request.full_path, out.getvalue()))
+            response.headers["X-Profile-Id"] = str(_profile_count)
+        stats = _stats()
+        if stats is None or "metrics_started" not in g:
+            return response
+        _current.stats = None
+        elapsed = time.perf_counter() - g.metrics_started
+        route = request.endpoint or "unmatched"
+        REQUEST_SECONDS.observe(route, elapsed)
+        SQL_SECONDS.observe(route, stats.sql_seconds)
+        QUERIES.observe(route, stats.queries)
+        ROWS.observe(route, stats.rows)
+        REQUESTS.inc((route, response.status_code))
+        slow_ms = app.config["METRICS_SLOW_REQUEST_MS"]
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            _log_slow(database.get_pool(app), route, elapsed, stats)
+        return response
+
+    @app.teardown_request
+    def _clear(exc=None):
+        _current.stats = None
+
+def profiles_text():
+    with _profile_lock:
+        profiles = list(_profiles)
+    return "\n\n".join(f"#{n} {when} {path}\n{report}" for n, when, path, report in reversed(profiles))
+
+def _log_slow(pool, route, elapsed, stats):
+    conn = pool.acquire()
+    try:
+        plans = _explain(conn, stats.statements)
+    finally:
+        pool.release(conn)
+    lines = [f"slow request {route}: {elapsed * 1000:.1f} ms, sql {stats.sql_seconds * 1000:.1f} ms, "
+             f"{stats.queries} statements, {stats.rows} rows"]
+    for statement, plan in plans:
+        lines.append(f"  {' '.join(statement.split())[:300]}")
+        lines.extend(f"    {step}" for step in plan)
+    log.warning("\n".join(lines))
+
+def _gauges(name, values):
+    return [f"# TYPE {name} gauge"] + [f'{name}{{key="{k}"}} {v}' for k, v in sorted(values.items())
+                                       if isinstance(v, (int, float)) and not isinstance(v, bool)]
+
+def render(app):
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in (REQUEST_SECONDS, SQL_SECONDS, QUERIES, ROWS, REQUESTS):
+        lines.extend(metric.render())
+    lines.extend(_gauges("hospital_db_pool", database.get_pool(app).stats()))
+    lines.extend(_gauges("hospital_query_cache", cache.get_cache(app).stats()))
+    copies = backup.stats(app)
+    if copies:
+        lines.extend(_gauges("hospital_backup", copies["backup"]))
+        lines.extend(_gauges("hospital_snapshot", copies["snapshot"]))
+    return "\n".join(lines) + "\n"
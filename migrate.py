@@ -0,0 +1,73 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+APP_DIR = Path(__file__).parent
+SCHEMA_PATH = APP_DIR / "schema.sql"
+MIGRATIONS_DIR = APP_DIR / "migrations"
+
+# schema.sql is the baseline (all CREATE ... IF NOT EXISTS, safe to re-run);
+# migrations/NNNN_name.sql are applied on top of it exactly once, in order.
+
+def available_migrations():
+    found = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version, _, name = path.stem.partition("_")
+        if not version.isdigit():
+            continue
+        found.append((int(version), name, path))
+    return found
+
+def current_version(conn) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def upgrade(conn, verbose=False):
+    with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+          version INTEGER PRIMARY KEY,
+          name TEXT NOT NULL,
+          applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.commit()
+    applied = []
+    for version, name, path in available_migrations():
+        if version <= current_version(conn):
+            continue
+        script = path.read_text(encoding="utf-8")
+        try:
+            # One transaction per migration: either the whole file and its
+            # version row land, or nothing does.
+            conn.executescript(
+                "BEGIN;\n" + script +
+                f"\nINSERT INTO schema_version (version, name) VALUES ({version}, '{name}');\nCOMMIT;"
+            )
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"applied {version:04d}_{name}")
+    return applied
+
+def upgrade_path(path, verbose=False):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON;")
+        return upgrade(conn, verbose=verbose)
+    finally:
+        conn.close()
+
+def main(argv):
+    path = argv[1] if len(argv) > 1 else str(APP_DIR / "hospital.db")
+    applied = upgrade_path(path, verbose=True)
+    conn = sqlite3.connect(path)
+    print(f"✅ {path} at schema version {current_version(conn)} ({len(applied)} applied)")
+    conn.close()
+
+if __name__ == "__main__":
+    main(sys.argv)
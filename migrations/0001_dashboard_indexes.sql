@@ -0,0 +1,25 @@
+-- Composite (filter, id) indexes for the per-user dashboard and history queries.
+-- Each one serves both the WHERE and the ORDER BY id DESC, so SQLite walks the
+-- index backwards instead of scanning the table and sorting.
+
+-- doctor_dashboard: recent orders / assignments by doctor
+CREATE INDEX IF NOT EXISTS idx_orders_doctor ON orders(doctor_id, id);
+CREATE INDEX IF NOT EXISTS idx_assignments_doctor ON assignments(doctor_id, id);
+
+-- _staff_dashboard: tickets assigned to a nurse / radiologist
+CREATE INDEX IF NOT EXISTS idx_assignments_assignee ON assignments(assignee_staff_id, id);
+
+-- doctor_view_patient / patient_dashboard: per-patient history
+CREATE INDEX IF NOT EXISTS idx_orders_patient ON orders(patient_id, id);
+CREATE INDEX IF NOT EXISTS idx_assignments_patient ON assignments(patient_id, id);
+CREATE INDEX IF NOT EXISTS idx_reports_patient ON reports(patient_id, id);
+
+-- notification feeds
+CREATE INDEX IF NOT EXISTS idx_notifications_staff ON notifications(staff_id, id);
+CREATE INDEX IF NOT EXISTS idx_patient_notifications_patient ON patient_notifications(patient_id, id);
+
+-- available nurses / radiologists, already in name order
+CREATE INDEX IF NOT EXISTS idx_staff_role_available ON staff(role, is_available, name);
+
+-- ON DELETE CASCADE from staff would otherwise scan reports
+CREATE INDEX IF NOT EXISTS idx_reports_created_by ON reports(created_by_staff_id);
@@ -0,0 +1,28 @@
+-- Trigram full-text index over patient name / username / phone for the
+-- typeahead endpoint. External-content table: the text lives in patients,
+-- the triggers below keep the index in step with it.
+CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+  name, username, phone,
+  content='patients', content_rowid='id',
+  tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN
+  INSERT INTO patients_fts (rowid, name, username, phone)
+  VALUES (new.id, new.name, new.username, new.phone);
+END;
+
+CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN
+  INSERT INTO patients_fts (patients_fts, rowid, name, username, phone)
+  VALUES ('delete', old.id, old.name, old.username, old.phone);
+END;
+
+CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF name, username, phone ON patients BEGIN
+  INSERT INTO patients_fts (patients_fts, rowid, name, username, phone)
+  VALUES ('delete', old.id, old.name, old.username, old.phone);
+  INSERT INTO patients_fts (rowid, name, username, phone)
+  VALUES (new.id, new.name, new.username, new.phone);
+END;
+
+-- Index patients that existed before this migration.
+INSERT INTO patients_fts (patients_fts) VALUES ('rebuild');
@@ -0,0 +1,13 @@
+-- Content-addressed upload store: one row per distinct file (by SHA-256).
+-- path is relative to UPLOAD_DIR, sharded as ab/cd/<sha256><ext>.
+CREATE TABLE IF NOT EXISTS blobs (
+  sha256 TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mime_type TEXT NOT NULL,
+  path TEXT NOT NULL,
+  created_at TEXT NOT NULL DEFAULT (datetime('now'))
+) WITHOUT ROWID;
+
+-- Reports point at the blob; image_filename keeps the servable path so
+-- rows created before this migration still resolve under /uploads/.
+ALTER TABLE reports ADD COLUMN blob_sha256 TEXT REFERENCES blobs(sha256);
@@ -0,0 +1,2 @@
+-- Set to 1 by thumbnails.py once thumbs/<shard>/<sha256>_<size>.webp exist.
+ALTER TABLE blobs ADD COLUMN has_thumbnail INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,25 @@
+-- Transactional outbox: request handlers insert one row in their own
+-- transaction; outbox.py dispatches it to the notification tables and sinks.
+CREATE TABLE IF NOT EXISTS outbox (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  idempotency_key TEXT NOT NULL UNIQUE,
+  topic TEXT NOT NULL,
+  payload TEXT NOT NULL,                        -- JSON
+  status TEXT NOT NULL DEFAULT 'pending',       -- pending | done | dead
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt_at REAL NOT NULL DEFAULT 0,      -- unix time; also the claim lease
+  last_error TEXT,
+  created_at TEXT NOT NULL DEFAULT (datetime('now')),
+  dispatched_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, dispatched_at);
+
+-- Notifications written by the dispatcher carry the outbox key, so a retried
+-- event never notifies twice.
+ALTER TABLE notifications ADD COLUMN idempotency_key TEXT;
+ALTER TABLE patient_notifications ADD COLUMN idempotency_key TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_idem ON notifications(idempotency_key)
+  WHERE idempotency_key IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_patient_notifications_idem ON patient_notifications(idempotency_key)
+  WHERE idempotency_key IS NOT NULL;
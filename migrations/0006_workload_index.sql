@@ -0,0 +1,2 @@
+-- Open-ticket counts per assignee for the auto-assign index (workload.py).
+CREATE INDEX IF NOT EXISTS idx_assignments_assignee_status ON assignments(assignee_staff_id, status);
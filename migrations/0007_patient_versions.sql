@@ -0,0 +1,82 @@
+-- Change counter per patient for the JSON API's conditional requests.
+-- Any write to a patient's orders, assignments or reports (or to the patient's
+-- profile) bumps `version` and `updated_at`; the API turns them into ETag and
+-- Last-Modified. Patients with no row yet are at version 0.
+CREATE TABLE IF NOT EXISTS patient_versions (
+  patient_id INTEGER PRIMARY KEY,
+  version INTEGER NOT NULL,
+  updated_at TEXT NOT NULL
+);
+
+-- The EXISTS guard skips rows removed by a patient delete cascade.
+CREATE TRIGGER IF NOT EXISTS patient_version_orders_ai AFTER INSERT ON orders BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT new.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = new.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_orders_au AFTER UPDATE ON orders BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT new.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = new.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_orders_ad AFTER DELETE ON orders BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT old.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = old.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_assignments_ai AFTER INSERT ON assignments BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT new.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = new.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_assignments_au AFTER UPDATE ON assignments BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT new.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = new.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_assignments_ad AFTER DELETE ON assignments BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT old.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = old.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_reports_ai AFTER INSERT ON reports BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT new.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = new.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_reports_au AFTER UPDATE ON reports BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT new.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = new.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_reports_ad AFTER DELETE ON reports BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT old.patient_id, 1, datetime('now') WHERE EXISTS (SELECT 1 FROM patients WHERE id = old.patient_id)
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_patients_au AFTER UPDATE OF name, username, phone, dob, gender ON patients BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at) VALUES (new.id, 1, datetime('now'))
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_patients_ad AFTER DELETE ON patients BEGIN
+  DELETE FROM patient_versions WHERE patient_id = old.id;
+END;
+
+-- A finished thumbnail changes the reports of every patient sharing the file.
+CREATE INDEX IF NOT EXISTS idx_reports_blob ON reports(blob_sha256) WHERE blob_sha256 IS NOT NULL;
+
+CREATE TRIGGER IF NOT EXISTS patient_version_blobs_au AFTER UPDATE OF has_thumbnail ON blobs BEGIN
+  INSERT INTO patient_versions (patient_id, version, updated_at)
+  SELECT DISTINCT patient_id, 1, datetime('now') FROM reports WHERE blob_sha256 = new.sha256
+  ON CONFLICT(patient_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+END;
@@ -0,0 +1,126 @@
+-- Running totals kept by triggers, so dashboards read a counter row instead
+-- of COUNT(*) over assignments / notifications / reports. A missing row
+-- means all zero. `python counters.py verify` checks them against the base
+-- tables and `python counters.py rebuild` recomputes them.
+CREATE TABLE IF NOT EXISTS staff_counters (
+  staff_id INTEGER PRIMARY KEY,
+  open_assignments INTEGER NOT NULL DEFAULT 0,      -- as assignee, status Assigned / In Progress
+  unread_notifications INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS patient_counters (
+  patient_id INTEGER PRIMARY KEY,
+  reports INTEGER NOT NULL DEFAULT 0,
+  unread_notifications INTEGER NOT NULL DEFAULT 0
+);
+
+-- "Busiest staff" / "most reports" on the admin dashboard.
+CREATE INDEX IF NOT EXISTS idx_staff_counters_open ON staff_counters(open_assignments);
+CREATE INDEX IF NOT EXISTS idx_patient_counters_reports ON patient_counters(reports);
+
+-- assignments -> staff_counters.open_assignments
+CREATE TRIGGER IF NOT EXISTS counters_assignments_ai AFTER INSERT ON assignments
+WHEN new.status IN ('Assigned', 'In Progress') BEGIN
+  INSERT INTO staff_counters (staff_id, open_assignments) VALUES (new.assignee_staff_id, 1)
+  ON CONFLICT(staff_id) DO UPDATE SET open_assignments = open_assignments + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_assignments_ad AFTER DELETE ON assignments
+WHEN old.status IN ('Assigned', 'In Progress') BEGIN
+  UPDATE staff_counters SET open_assignments = open_assignments - 1 WHERE staff_id = old.assignee_staff_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_assignments_au AFTER UPDATE OF status, assignee_staff_id ON assignments
+WHEN old.status IS NOT new.status OR old.assignee_staff_id IS NOT new.assignee_staff_id BEGIN
+  UPDATE staff_counters SET open_assignments = open_assignments - 1
+  WHERE staff_id = old.assignee_staff_id AND old.status IN ('Assigned', 'In Progress');
+  INSERT INTO staff_counters (staff_id, open_assignments)
+  SELECT new.assignee_staff_id, 1 WHERE new.status IN ('Assigned', 'In Progress')
+  ON CONFLICT(staff_id) DO UPDATE SET open_assignments = open_assignments + 1;
+END;
+
+-- notifications -> staff_counters.unread_notifications
+CREATE TRIGGER IF NOT EXISTS counters_notifications_ai AFTER INSERT ON notifications
+WHEN new.is_read = 0 BEGIN
+  INSERT INTO staff_counters (staff_id, unread_notifications) VALUES (new.staff_id, 1)
+  ON CONFLICT(staff_id) DO UPDATE SET unread_notifications = unread_notifications + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_notifications_ad AFTER DELETE ON notifications
+WHEN old.is_read = 0 BEGIN
+  UPDATE staff_counters SET unread_notifications = unread_notifications - 1 WHERE staff_id = old.staff_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_notifications_au AFTER UPDATE OF is_read, staff_id ON notifications
+WHEN old.is_read IS NOT new.is_read OR old.staff_id IS NOT new.staff_id BEGIN
+  UPDATE staff_counters SET unread_notifications = unread_notifications - 1
+  WHERE staff_id = old.staff_id AND old.is_read = 0;
+  INSERT INTO staff_counters (staff_id, unread_notifications)
+  SELECT new.staff_id, 1 WHERE new.is_read = 0
+  ON CONFLICT(staff_id) DO UPDATE SET unread_notifications = unread_notifications + 1;
+END;
+
+-- patient_notifications -> patient_counters.unread_notifications
+CREATE TRIGGER IF NOT EXISTS counters_patient_notifications_ai AFTER INSERT ON patient_notifications
+WHEN new.is_read = 0 BEGIN
+  INSERT INTO patient_counters (patient_id, unread_notifications) VALUES (new.patient_id, 1)
+  ON CONFLICT(patient_id) DO UPDATE SET unread_notifications = unread_notifications + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_patient_notifications_ad AFTER DELETE ON patient_notifications
+WHEN old.is_read = 0 BEGIN
+  UPDATE patient_counters SET unread_notifications = unread_notifications - 1 WHERE patient_id = old.patient_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_patient_notifications_au AFTER UPDATE OF is_read, patient_id ON patient_notifications
+WHEN old.is_read IS NOT new.is_read OR old.patient_id IS NOT new.patient_id BEGIN
+  UPDATE patient_counters SET unread_notifications = unread_notifications - 1
+  WHERE patient_id = old.patient_id AND old.is_read = 0;
+  INSERT INTO patient_counters (patient_id, unread_notifications)
+  SELECT new.patient_id, 1 WHERE new.is_read = 0
+  ON CONFLICT(patient_id) DO UPDATE SET unread_notifications = unread_notifications + 1;
+END;
+
+-- reports -> patient_counters.reports
+CREATE TRIGGER IF NOT EXISTS counters_reports_ai AFTER INSERT ON reports BEGIN
+  INSERT INTO patient_counters (patient_id, reports) VALUES (new.patient_id, 1)
+  ON CONFLICT(patient_id) DO UPDATE SET reports = reports + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_reports_ad AFTER DELETE ON reports BEGIN
+  UPDATE patient_counters SET reports = reports - 1 WHERE patient_id = old.patient_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_reports_au AFTER UPDATE OF patient_id ON reports
+WHEN old.patient_id IS NOT new.patient_id BEGIN
+  UPDATE patient_counters SET reports = reports - 1 WHERE patient_id = old.patient_id;
+  INSERT INTO patient_counters (patient_id, reports) VALUES (new.patient_id, 1)
+  ON CONFLICT(patient_id) DO UPDATE SET reports = reports + 1;
+END;
+
+-- Rows of deleted staff / patients go with them.
+CREATE TRIGGER IF NOT EXISTS counters_staff_ad AFTER DELETE ON staff BEGIN
+  DELETE FROM staff_counters WHERE staff_id = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS counters_patients_ad AFTER DELETE ON patients BEGIN
+  DELETE FROM patient_counters WHERE patient_id = old.id;
+END;
+
+-- Backfill from existing rows (the same queries as counters.rebuild()).
+INSERT INTO staff_counters (staff_id, open_assignments)
+SELECT assignee_staff_id, COUNT(*) FROM assignments
+WHERE status IN ('Assigned', 'In Progress') GROUP BY assignee_staff_id
+ON CONFLICT(staff_id) DO UPDATE SET open_assignments = excluded.open_assignments;
+
+INSERT INTO staff_counters (staff_id, unread_notifications)
+SELECT staff_id, COUNT(*) FROM notifications WHERE is_read = 0 GROUP BY staff_id
+ON CONFLICT(staff_id) DO UPDATE SET unread_notifications = excluded.unread_notifications;
+
+INSERT INTO patient_counters (patient_id, reports)
+SELECT patient_id, COUNT(*) FROM reports GROUP BY patient_id
+ON CONFLICT(patient_id) DO UPDATE SET reports = excluded.reports;
+
+INSERT INTO patient_counters (patient_id, unread_notifications)
+SELECT patient_id, COUNT(*) FROM patient_notifications WHERE is_read = 0 GROUP BY patient_id
+ON CONFLICT(patient_id) DO UPDATE SET unread_notifications = excluded.unread_notifications;
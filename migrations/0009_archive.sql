@@ -0,0 +1,22 @@
+-- Catalog of rows moved to the monthly archive databases (archive.py).
+-- archive/<YYYY-MM>.db holds the archived rows of every table for that
+-- month; these tables record which months, and which owners (patient /
+-- staff), have archived rows in which id range, so history pages only
+-- attach the archives that can hold rows for the page being read.
+CREATE TABLE IF NOT EXISTS archive_months (
+  tbl TEXT NOT NULL,
+  month TEXT NOT NULL,                -- YYYY-MM of created_at
+  min_id INTEGER NOT NULL,
+  max_id INTEGER NOT NULL,
+  rows INTEGER NOT NULL,
+  PRIMARY KEY (tbl, month)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS archive_index (
+  tbl TEXT NOT NULL,
+  owner_id INTEGER NOT NULL,          -- patient_id or staff_id, see archive.TABLES
+  min_id INTEGER NOT NULL,
+  max_id INTEGER NOT NULL,
+  rows INTEGER NOT NULL,
+  PRIMARY KEY (tbl, owner_id)
+) WITHOUT ROWID;
@@ -0,0 +1,6 @@
+-- Patient timeline (timeline.py): orders, assignments and reports merged
+-- newest first by (created_at, id). With these each arm of the UNION ALL
+-- reads its index in order and SQLite merges them without sorting.
+CREATE INDEX IF NOT EXISTS idx_orders_patient_created ON orders(patient_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_assignments_patient_created ON assignments(patient_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_reports_patient_created ON reports(patient_id, created_at);
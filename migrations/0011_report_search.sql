@@ -0,0 +1,44 @@
+-- Full-text search over report text and type for /doctor/reports/search.
+-- External-content table like patients_fts (0002), with the porter stemmer
+-- so "fractures" finds "fracture". Ranking is in search.search_reports.
+CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+  report_text, report_type,
+  content='reports', content_rowid='id',
+  tokenize='porter unicode61 remove_diacritics 2'
+);
+
+-- Reports that existed before this migration are indexed in the
+-- background in id order (search.backfill), not here: a one-shot
+-- 'rebuild' would hold the write lock for minutes on a large database.
+-- Ids <= done_id and ids > end_id are in the index; rows in between are
+-- left to the backfill, which reads their current text, so the triggers
+-- skip them.
+CREATE TABLE IF NOT EXISTS reports_fts_backfill (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  done_id INTEGER NOT NULL,
+  end_id INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO reports_fts_backfill (id, done_id, end_id)
+SELECT 1, 0, COALESCE(MAX(id), 0) FROM reports;
+
+-- reports.id is AUTOINCREMENT, so new rows are always past end_id.
+CREATE TRIGGER IF NOT EXISTS reports_fts_ai AFTER INSERT ON reports BEGIN
+  INSERT INTO reports_fts (rowid, report_text, report_type)
+  VALUES (new.id, new.report_text, new.report_type);
+END;
+
+CREATE TRIGGER IF NOT EXISTS reports_fts_ad AFTER DELETE ON reports
+WHEN old.id <= (SELECT done_id FROM reports_fts_backfill) OR old.id > (SELECT end_id FROM reports_fts_backfill)
+BEGIN
+  INSERT INTO reports_fts (reports_fts, rowid, report_text, report_type)
+  VALUES ('delete', old.id, old.report_text, old.report_type);
+END;
+
+CREATE TRIGGER IF NOT EXISTS reports_fts_au AFTER UPDATE OF report_text, report_type ON reports
+WHEN old.id <= (SELECT done_id FROM reports_fts_backfill) OR old.id > (SELECT end_id FROM reports_fts_backfill)
+BEGIN
+  INSERT INTO reports_fts (reports_fts, rowid, report_text, report_type)
+  VALUES ('delete', old.id, old.report_text, old.report_type);
+  INSERT INTO reports_fts (rowid, report_text, report_type)
+  VALUES (new.id, new.report_text, new.report_type);
+END;
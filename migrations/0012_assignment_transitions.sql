@@ -0,0 +1,53 @@
+-- Append-only history of assignment status changes, written by
+-- staff_update_assignment_status in the same transaction as the update.
+-- No foreign key: the history outlives assignments moved to the archive.
+CREATE TABLE IF NOT EXISTS assignment_transitions (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  assignment_id INTEGER NOT NULL,
+  changed_by_staff_id INTEGER,
+  from_status TEXT,
+  to_status TEXT NOT NULL,
+  created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- "Is this the first time it reached to_status?" (analytics.py)
+CREATE INDEX IF NOT EXISTS idx_assignment_transitions_first
+  ON assignment_transitions(assignment_id, to_status, id);
+
+-- Turnaround histograms (analytics.py): time from assignment creation to
+-- first In Progress ('start') and first Completed ('complete'), counted
+-- per log-spaced bucket of seconds, for every dimension / key. Buckets
+-- add up, so new transitions are folded in without rereading old ones.
+CREATE TABLE IF NOT EXISTS turnaround_rollups (
+  dimension TEXT NOT NULL,    -- all / role / category / task_type / staff
+  key TEXT NOT NULL,
+  metric TEXT NOT NULL,       -- start / complete
+  bucket INTEGER NOT NULL,
+  count INTEGER NOT NULL,
+  seconds INTEGER NOT NULL,   -- sum, for the mean
+  PRIMARY KEY (dimension, key, metric, bucket)
+) WITHOUT ROWID;
+
+-- Percentiles per group, recomputed from the buckets of the groups each
+-- batch touches; the admin dashboard reads only this table.
+CREATE TABLE IF NOT EXISTS turnaround_stats (
+  dimension TEXT NOT NULL,
+  key TEXT NOT NULL,
+  metric TEXT NOT NULL,
+  count INTEGER NOT NULL,
+  mean_seconds REAL NOT NULL,
+  p50_seconds REAL,
+  p90_seconds REAL,
+  p99_seconds REAL,
+  PRIMARY KEY (dimension, key, metric)
+) WITHOUT ROWID;
+
+-- "Slowest staff" on the admin dashboard.
+CREATE INDEX IF NOT EXISTS idx_turnaround_stats_p90 ON turnaround_stats(dimension, metric, p90_seconds);
+
+-- Transitions with id <= last_transition_id are in the rollups.
+CREATE TABLE IF NOT EXISTS turnaround_state (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_transition_id INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO turnaround_state (id, last_transition_id) VALUES (1, 0);
@@ -0,0 +1,17 @@
+-- Turnaround analytics reads only assignment_transitions: each transition
+-- carries what it needs from its assignment and from the staff member who
+-- made the change, so archiving the assignment or deleting the staff member
+-- later does not drop it from a rebuild. Written by analytics.record().
+ALTER TABLE assignment_transitions ADD COLUMN task_type TEXT;
+ALTER TABLE assignment_transitions ADD COLUMN assignment_created_at TEXT;
+ALTER TABLE assignment_transitions ADD COLUMN staff_role TEXT;
+ALTER TABLE assignment_transitions ADD COLUMN staff_category TEXT;
+
+-- Backfill from the live tables. Transitions of assignments archived before
+-- this migration have no assignment_created_at and are skipped by a rebuild;
+-- the background refresh folded them long before the move.
+UPDATE assignment_transitions SET
+  task_type = (SELECT a.task_type FROM assignments a WHERE a.id = assignment_transitions.assignment_id),
+  assignment_created_at = (SELECT a.created_at FROM assignments a WHERE a.id = assignment_transitions.assignment_id),
+  staff_role = (SELECT s.role FROM staff s WHERE s.id = assignment_transitions.changed_by_staff_id),
+  staff_category = (SELECT s.category FROM staff s WHERE s.id = assignment_transitions.changed_by_staff_id);
@@ -0,0 +1,20 @@
+-- Patients and staff deleted from the main database whose rows archive.py
+-- still has to remove from the monthly archive databases: foreign keys do
+-- not cascade across files. Filled by triggers, so every way of deleting
+-- someone is covered; an entry is removed once every month file is clean.
+CREATE TABLE IF NOT EXISTS archive_purge (
+  kind TEXT NOT NULL,                 -- patient / staff
+  owner_id INTEGER NOT NULL,
+  deleted_at TEXT NOT NULL DEFAULT (datetime('now')),
+  PRIMARY KEY (kind, owner_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS archive_purge_patient AFTER DELETE ON patients
+BEGIN
+  INSERT OR IGNORE INTO archive_purge (kind, owner_id) VALUES ('patient', OLD.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS archive_purge_staff AFTER DELETE ON staff
+BEGIN
+  INSERT OR IGNORE INTO archive_purge (kind, owner_id) VALUES ('staff', OLD.id);
+END;
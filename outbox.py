@@ -0,0 +1,244 @@
+"""Transactional outbox for assignment side effects.
+
+Request handlers call enqueue() inside their own transaction (one small
+INSERT), commit, then wake(). A background dispatcher claims due events in
+batches, writes the notification rows for the whole batch in one short
+transaction, publishes them over SSE and hands the batch to any registered
+sinks (SMS, email, ...). An event whose rows cannot be written is rolled
+back alone and kept from the sinks; it and any batch a sink fails are
+retried with exponential backoff and marked dead after
+OUTBOX_MAX_ATTEMPTS. Every event carries an idempotency key that the
+notification tables enforce and that sinks should use to drop duplicates.
+A recipient deleted since the event was queued is skipped.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+import cache
+import database
+import events
+
+DEFAULTS = {
+    "OUTBOX_BATCH": 100,
+    "OUTBOX_POLL_SECONDS": 1.0,
+    "OUTBOX_LEASE_SECONDS": 30.0,    # a claimed event is retried after this if never finished
+    "OUTBOX_MAX_ATTEMPTS": 8,
+    "OUTBOX_DISPATCHER": True,       # False: call dispatch_pending() yourself
+    "OUTBOX_RETAIN_HOURS": 24,       # done events are kept this long to dedupe repeated keys
+}
+
+log = logging.getLogger(__name__)
+
+class Event:
+    def __init__(self, id, key, topic, payload, attempts):
+        self.id = id
+        self.key = key
+        self.topic = topic
+        self.payload = payload
+        self.attempts = attempts
+
+class Sink(ABC):
+    """Receives dispatched events in batches.
+
+    Raise to have the whole batch retried; use event.key to ignore events
+    already delivered on an earlier attempt.
+    """
+
+    name = "sink"
+
+    @abstractmethod
+    def deliver(self, batch):
+        ...
+
+def _assignment_created(p):
+    return [("staff", p["assignee_staff_id"],
+             f"New assignment: {p['task_type']} (Patient ID {p['patient_id']})")]
+
+def _assignment_completed(p):
+    return [
+        ("staff", p["doctor_id"], f"Task '{p['task_type']}' for patient #{p['patient_id']} was completed."),
+        ("patient", p["patient_id"], f"Your task '{p['task_type']}' has been completed."),
+    ]
+
+# topic -> payload -> [(recipient kind, recipient id, message)]
+NOTIFIERS = {
+    "assignment.created": _assignment_created,
+    "assignment.completed": _assignment_completed,
+}
+
+def enqueue(conn, key, topic, payload):
+    """Add an event inside the caller's transaction; a repeated key is ignored."""
+    conn.execute(
+        "INSERT OR IGNORE INTO outbox (idempotency_key, topic, payload) VALUES (?,?,?)",
+        (key, topic, json.dumps(payload)),
+    )
+
+def _claim(conn, batch, lease):
+    # Pushing next_attempt_at forward is the lease: other dispatchers (other
+    # processes) skip these rows until it runs out.
+    now = time.time()
+    with conn:
+        rows = conn.execute("""
+            UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?
+            WHERE id IN (SELECT id FROM outbox WHERE status = 'pending' AND next_attempt_at <= ?
+                         ORDER BY next_attempt_at, id LIMIT ?)
+            RETURNING id, idempotency_key, topic, payload, attempts
+        """, (now + lease, now, batch)).fetchall()
+    return sorted((Event(r[0], r[1], r[2], json.loads(r[3]), r[4]) for r in rows), key=lambda e: e.id)
+
+def _write_event(conn, event, tags):
+    published = []
+    for kind, recipient, message in NOTIFIERS.get(event.topic, lambda p: [])(event.payload):
+        key = f"{event.key}:{kind}:{recipient}"
+        if kind == "staff":
+            cur = conn.execute("""
+                INSERT OR IGNORE INTO notifications (staff_id, message, idempotency_key)
+                SELECT ?1, ?2, ?3 WHERE EXISTS (SELECT 1 FROM staff WHERE id = ?1)
+            """, (recipient, message, key))
+            channel = events.staff_channel(recipient)
+            tags.add(f"notifications:staff:{recipient}")
+        else:
+            cur = conn.execute("""
+                INSERT OR IGNORE INTO patient_notifications (patient_id, message, idempotency_key)
+                SELECT ?1, ?2, ?3 WHERE EXISTS (SELECT 1 FROM patients WHERE id = ?1)
+            """, (recipient, message, key))
+            channel = events.patient_channel(recipient)
+            tags.add(f"notifications:patient:{recipient}")
+        if cur.rowcount:
+            published.append((channel, cur.lastrowid, message))
+    return published
+
+def _write_notifications(conn, batch):
+    """Returns (published, cache tags, {event id: error}) for the events that failed."""
+    published, tags, failed = [], set(), {}
+    for event in batch:
+        # One event's bad payload or constraint error rolls back that event only.
+        conn.execute("SAVEPOINT outbox_event")
+        try:
+            published += _write_event(conn, event, tags)
+        except (sqlite3.Error, KeyError, TypeError, ValueError) as e:
+            conn.execute("ROLLBACK TO outbox_event")
+            log.exception("outbox event %s: writing notifications failed", event.key)
+            failed[event.id] = f"notifications: {e}"
+        conn.execute("RELEASE outbox_event")
+    return published, tags, failed
+
+def dispatch_pending(app, conn=None):
+    """Dispatch one batch of due events; returns how many were claimed."""
+    pool = database.get_pool(app)
+    own = conn is None
+    if own:
+        conn = pool.acquire()
+    try:
+        batch = _claim(conn, app.config["OUTBOX_BATCH"], app.config["OUTBOX_LEASE_SECONDS"])
+        if not batch:
+            return 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            published, tags, errors = _write_notifications(conn, batch)
+        cache.get_cache(app).invalidate(*tags)
+        for channel, notif_id, message in published:
+            events.notify(app, channel, notif_id, message)
+
+        written = [e for e in batch if e.id not in errors]
+        for sink in app.extensions.get("outbox_sinks", ()):
+            if not written:
+                break
+            try:
+                sink.deliver(written)
+            except Exception as e:
+                log.exception("outbox sink %s failed", sink.name)
+                errors.update((event.id, f"{sink.name}: {e}") for event in written)
+        now = time.time()
+        max_attempts = app.config["OUTBOX_MAX_ATTEMPTS"]
+        with conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'done', dispatched_at = datetime('now'), last_error = NULL WHERE id = ?",
+                [(e.id,) for e in batch if e.id not in errors])
+            conn.executemany(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                [("dead" if e.attempts >= max_attempts else "pending",
+                  now + min(2 ** e.attempts, 300), errors[e.id], e.id) for e in batch if e.id in errors])
+        return len(batch)
+    finally:
+        if own:
+            pool.release(conn)
+
+def prune(app, conn):
+    with conn:
+        return conn.execute(
+            "DELETE FROM outbox WHERE status = 'done' AND dispatched_at < datetime('now', ?)",
+            (f"-{int(app.config['OUTBOX_RETAIN_HOURS'])} hours",),
+        ).rowcount
+
+class Dispatcher:
+    PRUNE_EVERY = 3600.0
+
+    def __init__(self, app):
+        self.app = app
+        self._pruned_at = 0.0
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.app.config["OUTBOX_POLL_SECONDS"])
+            self._wake.clear()
+            try:
+                # Drain everything that is due before sleeping again.
+                while dispatch_pending(self.app) == self.app.config["OUTBOX_BATCH"]:
+                    pass
+                if time.monotonic() - self._pruned_at > self.PRUNE_EVERY:
+                    self._pruned_at = time.monotonic()
+                    pool = database.get_pool(self.app)
+                    conn = pool.acquire()
+                    try:
+                        prune(self.app, conn)
+                    finally:
+                        pool.release(conn)
+            except Exception:
+                log.exception("outbox dispatch failed")
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.extensions.setdefault("outbox_sinks", [])
+
+    @app.before_request
+    def _start_dispatcher():
+        # Started with the first request so events left over from a previous
+        # run are picked up without waiting for a new write.
+        get_dispatcher(app)
+
+def add_sink(app, sink):
+    app.extensions["outbox_sinks"].append(sink)
+
+def get_dispatcher(app):
+    if not app.config["OUTBOX_DISPATCHER"]:
+        return None
+    dispatcher = app.extensions.get("outbox_dispatcher")
+    if dispatcher is None:
+        with _lock:
+            dispatcher = app.extensions.get("outbox_dispatcher")
+            if dispatcher is None:
+                dispatcher = app.extensions["outbox_dispatcher"] = Dispatcher(app)
+    return dispatcher
+
+def wake(app):
+    """Call after committing enqueued events."""
+    dispatcher = get_dispatcher(app)
+    if dispatcher is not None:
+        dispatcher.wake()
+
+def stats(conn):
+    return {status: conn.execute("SELECT COUNT(*) FROM outbox WHERE status = ?", (status,)).fetchone()[0]
+            for status in ("pending", "dead")}
@@ -0,0 +1,73 @@
+from flask import request, url_for
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Used as the cursor for the first page so every page runs the same statement.
+FIRST_CURSOR = 2**63 - 1
+
+class Page:
+    """One keyset page of rows, newest first.
+
+    Iterates and tests truthy like the plain list it replaces, so templates
+    keep their `{% for %}` / `{% if %}` blocks; `next_url` is the
+    "load more" link, or None on the last page.
+    """
+
+    def __init__(self, name, rows, next_cursor, limit, before=FIRST_CURSOR):
+        self.name = name
+        self.before = before
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.limit = limit
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    @property
+    def key(self):
+        # Identifies this page for fragment caching.
+        return (self.name, self.before, self.limit)
+
+    @property
+    def next_url(self):
+        if self.next_cursor is None:
+            return None
+        args = request.args.to_dict()
+        args.update(request.view_args or {})
+        args[f"{self.name}_before"] = self.next_cursor
+        args[f"{self.name}_limit"] = self.limit
+        return url_for(request.endpoint, **args)
+
+def page_args(name, default=DEFAULT_PAGE_SIZE):
+    # ?<name>_before=<id>&<name>_limit=<n>; bad values fall back to defaults.
+    before = request.args.get(f"{name}_before", type=int) or FIRST_CURSOR
+    limit = request.args.get(f"{name}_limit", default, type=int) or default
+    return before, max(1, min(limit, MAX_PAGE_SIZE))
+
+def fetch_page(conn, name, sql, params=(), default=DEFAULT_PAGE_SIZE, key="id", cache=None, tags=(),
+               before=None, limit=None):
+    """Run `sql`, whose last two placeholders are `id < ?` and `LIMIT ?`.
+
+    One extra row is fetched to tell whether another page exists. With a
+    QueryCache, the rows are cached per (sql, params, cursor, limit) under
+    `tags`. The cursor and limit come from the query string unless `before`
+    and `limit` are given.
+    """
+    if before is None or limit is None:
+        before, limit = page_args(name, default)
+    args = (*params, before, limit + 1)
+    if cache is not None:
+        rows = cache.get_or_load((sql, args), tags, lambda: conn.execute(sql, args).fetchall())
+    else:
+        rows = conn.execute(sql, args).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][key]
+    return Page(name, rows, next_cursor, limit, before)
@@ -0,0 +1,158 @@
+import hashlib
+import hmac
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULTS = {
+    # scrypt is memory-hard and ships with hashlib (OpenSSL), so no extra
+    # dependency. N=2**14, r=8 costs 16 MiB and roughly 50 ms per hash.
+    "SCRYPT_N": 2**14,
+    "HASH_WORKERS": os.cpu_count() or 1,
+    # Hashes queued or running at once (None: 4 per worker); beyond this,
+    # callers wait up to HASH_WAIT_SECONDS and then get HashingBusy.
+    "HASH_QUEUE": None,
+    "HASH_WAIT_SECONDS": 2.0,
+}
+
+SCRYPT_N = DEFAULTS["SCRYPT_N"]
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+
+HASH_WORKERS = DEFAULTS["HASH_WORKERS"]
+HASH_QUEUE_LIMIT = HASH_WORKERS * 4
+HASH_WAIT_SECONDS = DEFAULTS["HASH_WAIT_SECONDS"]
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+class HashingBusy(RuntimeError):
+    pass
+
+def _scrypt(pw, salt, n, r, p):
+    return hashlib.scrypt(pw.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r, dklen=32)
+
+def hash_pw(pw: str) -> str:
+    """scrypt$N$r$p$<salt hex>$<hash hex>; runs in the calling thread."""
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(pw, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+def _legacy_sha256(pw):
+    return hashlib.sha256(pw.encode("utf-8")).hexdigest()
+
+def check_pw(stored: str, pw: str) -> bool:
+    if not stored:
+        return False
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            expected = _scrypt(pw, bytes.fromhex(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(expected.hex(), digest)
+    # Rows written before scrypt hold a bare SHA-256 hex digest.
+    return hmac.compare_digest(_legacy_sha256(pw), stored)
+
+def needs_rehash(stored: str) -> bool:
+    return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+def _verify_and_upgrade(stored, pw):
+    # Runs in a worker: one round trip for the check and any rehash.
+    if not check_pw(stored, pw):
+        return False, None
+    return True, hash_pw(pw) if needs_rehash(stored) else None
+
+def configure(scrypt_n=None, workers=None, queue=None, wait_seconds=None):
+    """Set the hashing parameters; call before the first hash goes to the pool."""
+    global SCRYPT_N, HASH_WORKERS, HASH_QUEUE_LIMIT, HASH_WAIT_SECONDS, _slots
+    SCRYPT_N = int(scrypt_n or SCRYPT_N)
+    HASH_WORKERS = int(workers or HASH_WORKERS)
+    HASH_QUEUE_LIMIT = int(queue or HASH_WORKERS * 4)
+    HASH_WAIT_SECONDS = float(wait_seconds or HASH_WAIT_SECONDS)
+    _slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    configure(app.config["SCRYPT_N"], app.config["HASH_WORKERS"],
+              app.config["HASH_QUEUE"], app.config["HASH_WAIT_SECONDS"])
+
+def _dummy_hash():
+    # Verified against when the username does not exist, so unknown and known
+    # users take the same time to reject.
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${'00' * SALT_BYTES}${'00' * 32}"
+
+def _worker_init(scrypt_n):
+    global SCRYPT_N
+    SCRYPT_N = scrypt_n
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                        initializer=_worker_init, initargs=(SCRYPT_N,))
+        return _pool
+
+def _run(fn, *args):
+    slots = _slots
+    if not slots.acquire(timeout=HASH_WAIT_SECONDS):
+        raise HashingBusy("password hashing queue is full")
+    try:
+        return _executor().submit(fn, *args).result()
+    finally:
+        slots.release()
+
+def verify(stored, pw):
+    """Check `pw` on the worker pool; returns (ok, replacement hash or None).
+
+    A replacement is returned when `stored` is a legacy SHA-256 digest or uses
+    old scrypt parameters, for the caller to write back.
+    """
+    return _run(_verify_and_upgrade, stored or _dummy_hash(), pw)
+
+def make_hash(pw):
+    """hash_pw() on the worker pool, for request handlers."""
+    return _run(hash_pw, pw)
+
+def _hash_chunk(passwords):
+    return [hash_pw(pw) for pw in passwords]
+
+def hash_many(passwords, chunksize=8):
+    """Hash a batch of passwords across the worker pool, preserving order.
+
+    Each chunk takes a queue slot like a login does, and at most HASH_WORKERS
+    chunks are in flight, so a bulk import waits its turn instead of filling
+    the pool ahead of logins.
+    """
+    passwords = list(passwords)
+    if HASH_WORKERS <= 1 or len(passwords) < chunksize:
+        return _hash_chunk(passwords)
+    hashes, in_flight = [], deque()
+    for i in range(0, len(passwords), chunksize):
+        if len(in_flight) >= HASH_WORKERS:
+            hashes += in_flight.popleft().result()
+        slots = _slots
+        slots.acquire()
+        try:
+            future = _executor().submit(_hash_chunk, passwords[i:i + chunksize])
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda f: slots.release())
+        in_flight.append(future)
+    for future in in_flight:
+        hashes += future.result()
+    return hashes
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -0,0 +1,130 @@
+"""Best-effort messages between the worker processes of one host.
+
+serve.py gives every worker the same PEERS_DIR. Each process binds a Unix
+datagram socket there named after its pid; send() writes a small JSON
+message to every other socket in the directory, and a daemon thread hands
+what arrives to the handler registered for its topic with on(). Query
+cache invalidations and SSE notifications travel this way, so a write
+handled by one worker reaches the caches and event streams of the others.
+
+Nothing is queued or retried: a message to a worker whose socket buffer is
+full is dropped and counted. A lost invalidation leaves a cache entry stale
+until its TTL; a lost notification is seen on the next page load.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from pathlib import Path
+
+DEFAULTS = {
+    "PEERS_DIR": None,    # None: a single process, nothing is sent
+}
+
+MAX_MESSAGE = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+class Peers:
+    def __init__(self, directory, handlers):
+        self.directory = Path(directory)
+        self.handlers = handlers
+        self.pid = os.getpid()
+        self.path = self.directory / f"{self.pid}.sock"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self._in = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._in.bind(str(self.path))
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._out.setblocking(False)
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="peers", daemon=True)
+        self._thread.start()
+
+    def send(self, topic, payload):
+        data = json.dumps([topic, payload]).encode()
+        if len(data) > MAX_MESSAGE:
+            raise ValueError(f"peer message of {len(data)} bytes exceeds {MAX_MESSAGE}")
+        sent = dropped = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".sock") or entry.path == str(self.path):
+                continue
+            try:
+                self._out.sendto(data, entry.path)
+                sent += 1
+            except BlockingIOError:
+                dropped += 1    # that worker is not keeping up
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that died without cleaning up.
+                Path(entry.path).unlink(missing_ok=True)
+        with self._lock:
+            self.sent += sent
+            self.dropped += dropped
+
+    def _run(self):
+        while True:
+            try:
+                data = self._in.recv(MAX_MESSAGE)
+            except OSError:
+                return    # closed
+            try:
+                topic, payload = json.loads(data)
+                handler = self.handlers.get(topic)
+                if handler is not None:
+                    handler(payload)
+                with self._lock:
+                    self.received += 1
+            except Exception:
+                log.exception("peer message failed")
+
+    def close(self):
+        self.path.unlink(missing_ok=True)
+        self._in.close()
+        self._out.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "dir": str(self.directory),
+                "peers": sum(1 for p in self.directory.glob("*.sock") if p != self.path),
+                "sent": self.sent,
+                "received": self.received,
+                "dropped": self.dropped,
+            }
+
+_peers_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.extensions.setdefault("peer_handlers", {})
+
+def on(app, topic, handler):
+    """Call handler(payload) for every `topic` message another worker sends."""
+    app.extensions.setdefault("peer_handlers", {})[topic] = handler
+
+def get_peers(app):
+    # Built per process: a Peers object inherited across fork belongs to the parent.
+    if not app.config.get("PEERS_DIR"):
+        return None
+    peers = app.extensions.get("peers")
+    if peers is None or peers.pid != os.getpid():
+        with _peers_lock:
+            peers = app.extensions.get("peers")
+            if peers is None or peers.pid != os.getpid():
+                peers = Peers(app.config["PEERS_DIR"], app.extensions.setdefault("peer_handlers", {}))
+                app.extensions["peers"] = peers
+    return peers
+
+def send(app, topic, payload):
+    peers = get_peers(app)
+    if peers is not None:
+        peers.send(topic, payload)
+
+def stats(app):
+    peers = app.extensions.get("peers")
+    return peers.stats() if peers is not None and peers.pid == os.getpid() else None
@@ -0,0 +1,109 @@
+"""Dashboard and history queries shared by the HTML views and the JSON API.
+
+Each function returns one keyset Page. The cursor and limit come from the
+query string (`orders_before=...`) unless passed in, and the rows go through
+the QueryCache under the same tags the write routes invalidate, so a page
+the HTML view loaded is a cache hit for the API and vice versa.
+
+Assignments and notifications may have been moved to the monthly archive
+(archive.py); their statements are templates over `{table}` so the same
+query runs against main and against each attached archive.
+"""
+import archive
+from pagination import fetch_page
+
+PATIENT_ORDERS = """
+    SELECT o.*, d.name AS doctor_name, d.category AS doctor_specialty
+    FROM orders o
+    JOIN staff d ON d.id = o.doctor_id
+    WHERE o.patient_id = ? AND o.id < ?
+    ORDER BY o.id DESC
+    LIMIT ?
+"""
+
+PATIENT_ASSIGNMENTS_FROM = """
+    SELECT a.*, d.name AS doctor_name, s.name AS assignee_name, s.role AS assignee_role
+    FROM {table} a
+    JOIN staff d ON d.id=a.doctor_id
+    JOIN staff s ON s.id=a.assignee_staff_id
+    WHERE a.patient_id=? AND a.id < ?
+    ORDER BY a.id DESC
+    LIMIT ?
+"""
+PATIENT_ASSIGNMENTS = PATIENT_ASSIGNMENTS_FROM.format(table="assignments")
+
+PATIENT_REPORTS = """
+    SELECT r.*, s.name AS staff_name, s.role AS staff_role, b.has_thumbnail, b.mime_type, b.size AS file_size
+    FROM reports r
+    JOIN staff s ON s.id=r.created_by_staff_id
+    LEFT JOIN blobs b ON b.sha256=r.blob_sha256
+    WHERE r.patient_id=? AND r.id < ?
+    ORDER BY r.id DESC
+    LIMIT ?
+"""
+
+ASSIGNEE_TICKETS = """
+    SELECT a.*, p.name AS patient_name, d.name AS doctor_name
+    FROM assignments a
+    JOIN patients p ON p.id=a.patient_id
+    JOIN staff d ON d.id=a.doctor_id
+    WHERE a.assignee_staff_id=? AND a.id < ?
+    ORDER BY a.id DESC
+    LIMIT ?
+"""
+
+STAFF_NOTIFICATIONS_FROM = """
+    SELECT * FROM {table}
+    WHERE staff_id=? AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+STAFF_NOTIFICATIONS = STAFF_NOTIFICATIONS_FROM.format(table="notifications")
+
+PATIENT_NOTIFICATIONS_FROM = """
+    SELECT * FROM {table}
+    WHERE patient_id=? AND id < ?
+    ORDER BY id DESC
+    LIMIT ?
+"""
+PATIENT_NOTIFICATIONS = PATIENT_NOTIFICATIONS_FROM.format(table="patient_notifications")
+
+def patient_orders(conn, cache, patient_id, before=None, limit=None):
+    return fetch_page(conn, "orders", PATIENT_ORDERS, (patient_id,), cache=cache,
+                      tags=(f"patient:{patient_id}",), before=before, limit=limit)
+
+def patient_assignments(conn, cache, patient_id, before=None, limit=None):
+    tags = (f"patient:{patient_id}",)
+    page = fetch_page(conn, "assignments", PATIENT_ASSIGNMENTS, (patient_id,), cache=cache,
+                      tags=tags, before=before, limit=limit)
+    return archive.read_through(conn, cache, page, "assignments", patient_id,
+                                PATIENT_ASSIGNMENTS_FROM, (patient_id,), tags)
+
+def patient_reports(conn, cache, patient_id, before=None, limit=None):
+    return fetch_page(conn, "reports", PATIENT_REPORTS, (patient_id,), cache=cache,
+                      tags=(f"patient:{patient_id}",), before=before, limit=limit)
+
+def assignee_tickets(conn, cache, staff_id, before=None, limit=None):
+    return fetch_page(conn, "assignments", ASSIGNEE_TICKETS, (staff_id,), cache=cache,
+                      tags=(f"assignments:assignee:{staff_id}",), before=before, limit=limit)
+
+def staff_notifications(conn, cache, staff_id, before=None, limit=None):
+    tags = (f"notifications:staff:{staff_id}",)
+    page = fetch_page(conn, "notifications", STAFF_NOTIFICATIONS, (staff_id,), cache=cache,
+                      tags=tags, before=before, limit=limit)
+    return archive.read_through(conn, cache, page, "notifications", staff_id,
+                                STAFF_NOTIFICATIONS_FROM, (staff_id,), tags)
+
+def patient_notifications(conn, cache, patient_id, before=None, limit=None):
+    tags = (f"notifications:patient:{patient_id}",)
+    page = fetch_page(conn, "notifications", PATIENT_NOTIFICATIONS, (patient_id,), cache=cache,
+                      tags=tags, before=before, limit=limit)
+    return archive.read_through(conn, cache, page, "patient_notifications", patient_id,
+                                PATIENT_NOTIFICATIONS_FROM, (patient_id,), tags)
+
+# History sections by name, as used by the API.
+PATIENT_HISTORY = {
+    "orders": patient_orders,
+    "assignments": patient_assignments,
+    "reports": patient_reports,
+}
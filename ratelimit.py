@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULTS = {
+    "LOGIN_RATE_LIMIT_ENABLED": True,
+    "LOGIN_IP_BURST": 30,
+    "LOGIN_IP_PER_MINUTE": 30,
+    "LOGIN_USER_BURST": 10,
+    "LOGIN_USER_PER_MINUTE": 5,
+}
+
+class RateLimiter:
+    """Token bucket per key.
+
+    Each key holds up to `burst` tokens refilled at `per_second`; hit() takes
+    one. Keys are kept LRU up to `max_keys`, so a flood of distinct usernames
+    or addresses cannot grow memory without bound.
+    """
+
+    def __init__(self, burst, per_second, max_keys=100_000):
+        self.burst = burst
+        self.per_second = per_second
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()    # key -> [tokens, last refill]
+        self.rejected = 0
+
+    def hit(self, key) -> float:
+        """Take a token; returns 0.0 if allowed, else seconds until one is free."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.per_second)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            self.rejected += 1
+            return (1 - bucket[0]) / self.per_second
+
+    def stats(self):
+        with self._lock:
+            return {"keys": len(self._buckets), "rejected": self.rejected}
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+def get_login_limiters(app):
+    limiters = app.extensions.get("login_limiters")
+    if limiters is None:
+        with _lock:
+            limiters = app.extensions.get("login_limiters")
+            if limiters is None:
+                limiters = {
+                    "ip": RateLimiter(app.config["LOGIN_IP_BURST"], app.config["LOGIN_IP_PER_MINUTE"] / 60),
+                    "user": RateLimiter(app.config["LOGIN_USER_BURST"], app.config["LOGIN_USER_PER_MINUTE"] / 60),
+                }
+                app.extensions["login_limiters"] = limiters
+    return limiters
+
+def check_login(app, ip, user_key) -> float:
+    """Count a login attempt; returns seconds to wait, or 0.0 if allowed."""
+    if not app.config["LOGIN_RATE_LIMIT_ENABLED"]:
+        return 0.0
+    limiters = get_login_limiters(app)
+    return max(limiters["ip"].hit(ip), limiters["user"].hit(user_key))
@@ -1,5 +1,8 @@
 PRAGMA foreign_keys = ON;
 
+-- Baseline schema. Later changes (indexes, new tables) live in migrations/
+-- and are applied in order by migrate.py, tracked in schema_version.
+
 -- Patients can login and view their own history
 CREATE TABLE IF NOT EXISTS patients (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
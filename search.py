@@ -0,0 +1,274 @@
+"""Full-text lookups backed by the FTS5 tables created in migrations/.
+
+    python search.py status                   # how much of reports_fts is built
+    python search.py backfill                 # index older reports now
+    python search.py reindex                  # empty reports_fts and index it again
+
+reports_fts (migration 0011) is kept in step by triggers. Reports older
+than the index are added in id order by backfill(), in short batches with
+a pause between them, which the app also runs in the background. reindex
+starts that over from an empty index, so a rebuild never holds the write
+lock for longer than one batch; until it catches up, searches only see
+part of the older reports.
+"""
+import argparse
+import heapq
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from markupsafe import Markup, escape
+import database
+import migrate
+
+APP_DIR = Path(__file__).parent
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+
+REPORT_SEARCH_LIMIT = 25
+MAX_REPORT_SEARCH_LIMIT = 100
+RANK_WINDOW = 5_000          # matches scored per search, newest first
+BM25_WEIGHTS = "1.0, 0.5"    # report_text, report_type
+SNIPPET_TOKENS = 16
+# snippet() marks matches with these; escaped text cannot contain them.
+MARK_START, MARK_END = "\x02", "\x03"
+
+DEFAULTS = {
+    "REPORT_SEARCH_BATCH": 1000,            # reports indexed per write transaction
+    "REPORT_SEARCH_PAUSE_SECONDS": 0.05,    # between batches, so request writes get the lock
+}
+
+log = logging.getLogger(__name__)
+
+def fts_phrase(text: str) -> str:
+    # Quote user input as a single FTS5 phrase so operators/quotes are literal.
+    return '"' + text.replace('"', '""') + '"'
+
+def search_patients(conn, q: str, limit: int = SEARCH_LIMIT):
+    """Typeahead over patient name, username and phone.
+
+    The trigram tokenizer needs at least three characters; shorter numeric
+    input is treated as a patient ID. Newest patients come first: FTS5 walks
+    its doclist in rowid order, so LIMIT stops early instead of ranking
+    every match.
+    """
+    q = q.strip()
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    if len(q) < 3:
+        if not q.isdigit():
+            return []
+        return conn.execute(
+            "SELECT id, name, username, phone, dob FROM patients WHERE id=?", (int(q),)
+        ).fetchall()
+    return conn.execute("""
+        SELECT p.id, p.name, p.username, p.phone, p.dob
+        FROM patients_fts f
+        JOIN patients p ON p.id = f.rowid
+        WHERE patients_fts MATCH ?
+        ORDER BY f.rowid DESC
+        LIMIT ?
+    """, (fts_phrase(q), limit)).fetchall()
+
+def report_match(q: str) -> str:
+    # Every word (or "quoted phrase") must appear; nothing else is syntax.
+    terms = [a or b for a, b in re.findall(r'"([^"]*)"|(\S+)', q)]
+    return " ".join(fts_phrase(t) for t in terms if t.strip())
+
+def search_reports(conn, q: str, since=None, until=None, staff_id=None, limit: int = REPORT_SEARCH_LIMIT):
+    """Reports matching q, best bm25 rank first, each with a highlighted snippet.
+
+    since/until are inclusive "YYYY-MM-DD" dates. Matches are walked newest
+    first and scored only once they pass the filters, so at most
+    RANK_WINDOW matches are ranked: with a common word that is the newest
+    RANK_WINDOW of them, not the whole table. Snippets are made for the
+    results only.
+    """
+    match = report_match(q)
+    if not match:
+        return []
+    limit = max(1, min(limit, MAX_REPORT_SEARCH_LIMIT))
+    where, params = ["reports_fts MATCH ?"], [match]
+    if since:
+        where.append("r.created_at >= ?")
+        params.append(since)
+    if until:
+        where.append("r.created_at < date(?, '+1 day')")
+        params.append(until)
+    if staff_id:
+        where.append("r.created_by_staff_id = ?")
+        params.append(staff_id)
+    scored = conn.execute(f"""
+        SELECT f.rowid, bm25(reports_fts, {BM25_WEIGHTS}) FROM reports_fts f
+        JOIN reports r ON r.id = f.rowid
+        WHERE {" AND ".join(where)}
+        ORDER BY f.rowid DESC
+        LIMIT ?
+    """, (*params, RANK_WINDOW)).fetchall()
+    best = {row_id: score for row_id, score in heapq.nsmallest(limit, scored, key=lambda r: r[1])}
+    if not best:
+        return []
+    rows = conn.execute(f"""
+        SELECT r.id, r.patient_id, p.name AS patient_name, r.report_type, r.created_at,
+               s.name AS author_name, s.role AS author_role,
+               snippet(reports_fts, 0, char(2), char(3), '…', {SNIPPET_TOKENS}) AS snippet
+        FROM reports_fts f
+        JOIN reports r ON r.id = f.rowid
+        JOIN patients p ON p.id = r.patient_id
+        JOIN staff s ON s.id = r.created_by_staff_id
+        WHERE reports_fts MATCH ? AND f.rowid IN ({", ".join("?" * len(best))})
+    """, (match, *best)).fetchall()
+    rows.sort(key=lambda row: (best[row["id"]], -row["id"]))
+    return [{**row, "snippet": highlight(row["snippet"])} for row in rows]
+
+def highlight(snippet):
+    """Escape a snippet and turn the match markers into <mark> tags."""
+    if snippet is None:
+        return None
+    return Markup(str(escape(snippet)).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>"))
+
+def backfill_status(conn):
+    done, end = conn.execute("SELECT done_id, end_id FROM reports_fts_backfill").fetchone()
+    return {"done_id": done, "end_id": end, "complete": done >= end,
+            "progress": round(done / end, 4) if end else 1.0}
+
+def backfill(conn, batch=1000, pause=0.05, stop=None, on_batch=None):
+    """Index reports between done_id and end_id; returns the number indexed.
+
+    conn must be in autocommit mode (isolation_level=None).
+    """
+    indexed = 0
+    while (stop is None or not stop.is_set()) and not backfill_status(conn)["complete"]:
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done, end = conn.execute("SELECT done_id, end_id FROM reports_fts_backfill").fetchone()
+            upper = max(done, min(done + batch, end))
+            count = conn.execute("""
+                INSERT INTO reports_fts (rowid, report_text, report_type)
+                SELECT id, report_text, report_type FROM reports WHERE id > ? AND id <= ?
+            """, (done, upper)).rowcount
+            conn.execute("UPDATE reports_fts_backfill SET done_id = ?", (upper,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        indexed += max(count, 0)
+        if on_batch:
+            on_batch(count, upper, end, time.perf_counter() - started)
+        if upper < end:
+            time.sleep(pause)
+    return indexed
+
+def reindex(conn):
+    """Empty reports_fts and queue every report for backfill()."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("INSERT INTO reports_fts (reports_fts) VALUES ('delete-all')")
+        conn.execute("UPDATE reports_fts_backfill SET done_id = 0, end_id = (SELECT COALESCE(MAX(id), 0) FROM reports)")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+class Indexer:
+    """Background thread that runs backfill() once, until the index has caught up."""
+
+    def __init__(self, app):
+        self.app = app
+        self._stop = threading.Event()
+        self.batches = 0
+        self.rows = 0
+        self.max_lock_ms = 0.0
+        self.finished = False
+        self._thread = threading.Thread(target=self._run, name="report-indexer", daemon=True)
+        self._thread.start()
+
+    def _on_batch(self, count, done, end, held):
+        self.batches += 1
+        self.rows += max(count, 0)
+        self.max_lock_ms = max(self.max_lock_ms, round(held * 1000, 3))
+
+    def _run(self):
+        config = self.app.config
+        try:
+            conn = database.get_pool(self.app).connect()
+            conn.isolation_level = None
+            try:
+                backfill(conn, config["REPORT_SEARCH_BATCH"], config["REPORT_SEARCH_PAUSE_SECONDS"],
+                         stop=self._stop, on_batch=self._on_batch)
+            finally:
+                conn.close()
+            self.finished = True
+        except Exception:
+            log.exception("report index backfill failed")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"batches": self.batches, "rows": self.rows, "max_lock_ms": self.max_lock_ms,
+                "finished": self.finished}
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+    @app.before_request
+    def _start_indexer():
+        # Once per process: it exits straight away when there is nothing
+        # to backfill. After `python search.py reindex`, restart the app
+        # or let the CLI do the backfill.
+        get_indexer(app)
+
+def get_indexer(app):
+    indexer = app.extensions.get("report_indexer")
+    if indexer is None:
+        with _lock:
+            indexer = app.extensions.get("report_indexer")
+            if indexer is None:
+                indexer = app.extensions["report_indexer"] = Indexer(app)
+    return indexer
+
+def stats(app, conn):
+    indexer = app.extensions.get("report_indexer")
+    return {**backfill_status(conn), "indexer": indexer.stats() if indexer else None}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("status", "backfill", "reindex"))
+    parser.add_argument("--db", default=str(APP_DIR / "hospital.db"))
+    parser.add_argument("--batch", type=int, default=DEFAULTS["REPORT_SEARCH_BATCH"])
+    parser.add_argument("--pause", type=float, default=DEFAULTS["REPORT_SEARCH_PAUSE_SECONDS"])
+    args = parser.parse_args(argv)
+
+    migrate.upgrade_path(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=5)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    try:
+        if args.command == "reindex":
+            reindex(conn)
+        if args.command in ("backfill", "reindex"):
+            locks = []
+            started = time.perf_counter()
+            rows = backfill(conn, args.batch, args.pause, on_batch=lambda count, done, end, held: locks.append(held))
+            print(f"{rows:,} reports indexed in {time.perf_counter() - started:.1f}s")
+            if locks:
+                print(f"{len(locks)} batches, write lock held max {max(locks) * 1000:.1f} ms, "
+                      f"mean {sum(locks) / len(locks) * 1000:.1f} ms")
+        status = backfill_status(conn)
+        left = status["end_id"] - status["done_id"]
+        print(f"reports_fts: {status['progress']:.1%} built"
+              + (f", ids {status['done_id'] + 1}..{status['end_id']} still to index" if left > 0 else ""))
+        return 0
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+"""Synthetic hospital data for benchmarks and load tests.
+
+Builds a fresh database at production-like scale: patients, staff of every
+role, orders, assignments (with the notifications they would have produced)
+and reports, spread over the last --days days with ids in time order.
+
+    python seed.py seed.db --size medium
+    python seed.py big.db --patients 1000000 --staff 5000 --assignments 20000000 --reports 20000000
+
+Everyone logs in with --password (default "password"): patients as
+patient<N>, staff as doctor<N>, nurse<N>, radiologist<N>, plus admin / admin123.
+Rows go in through executemany with journaling off and the secondary
+indexes and triggers dropped; they are rebuilt once at the end.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from pathlib import Path
+import counters
+import migrate
+from passwords import hash_pw
+
+PRESETS = {
+    #          patients   staff  orders     assignments  reports
+    "tiny":   (1_000,     50,    2_000,     10_000,      5_000),
+    "small":  (10_000,    200,   20_000,    200_000,     100_000),
+    "medium": (100_000,   1_000, 200_000,   2_000_000,   1_000_000),
+    "large":  (1_000_000, 5_000, 2_000_000, 20_000_000,  20_000_000),
+}
+CHUNK = 50_000
+
+FIRST_NAMES = (
+    "Amal", "Anil", "Asha", "Chamari", "Daniel", "Dilan", "Fatima", "Grace", "Hiru", "Ishan", "Janaki",
+    "Kamal", "Kasun", "Lakmini", "Maria", "Mohamed", "Nadeesha", "Nimal", "Oliver", "Priya", "Ravi",
+    "Ruwan", "Sanjay", "Sara", "Sunil", "Tharindu", "Uditha", "Vihanga", "Yasmin", "Zainab",
+)
+LAST_NAMES = (
+    "Perera", "Fernando", "Silva", "Jayasinghe", "Bandara", "Wickramasinghe", "Kumara", "Rathnayake",
+    "Dissanayake", "Herath", "Gunawardena", "Senanayake", "Rajapaksha", "Hussain", "Smith", "Khan",
+    "Nair", "Menon", "Ahmed", "Brown",
+)
+# role -> (share of staff, categories)
+STAFF_ROLES = {
+    "doctor": (0.30, ("Cardiologist", "General Physician", "Neurologist", "Orthopedic", "Pediatrician", "Surgeon")),
+    "nurse": (0.50, ("ICU Nurse", "Ward Nurse", "ER Nurse", "Pediatric Nurse")),
+    "radiologist": (0.20, ("CT Radiology", "MRI", "X-Ray", "Ultrasound")),
+}
+TASKS = {
+    "nurse": ("Nursing", "Lab", "Wound Care", "Medication"),
+    "radiologist": ("Scan", "CT Scan", "X-Ray", "MRI"),
+}
+ORDER_TYPES = ("ECG", "Cardio", "Physio", "Blood Test", "Echo", "Urine Test")
+REPORT_TEXT = (
+    "Vitals stable, patient comfortable.",
+    "No acute findings. Follow up in two weeks.",
+    "Mild inflammation noted; continue current medication.",
+    "Scan reviewed with consultant; findings within normal limits.",
+    "Patient reports reduced pain since last visit.",
+)
+# Findings added to a share of reports, rarer further down, so report
+# search (search.py) has selective terms as well as common ones.
+FINDINGS = (
+    ("Wound healing well, sutures removed.", 40),
+    ("Blood glucose poorly controlled; insulin adjusted.", 25),
+    ("Consolidation in the right lower lobe, consistent with pneumonia.", 15),
+    ("Moderate left pleural effusion.", 8),
+    ("Hairline fracture of the distal radius, cast applied.", 6),
+    ("Elevated troponin; cardiology consulted.", 4),
+    ("Small apical pneumothorax; repeat chest X-ray in 24 hours.", 2),
+)
+FINDING_SHARE = 0.2
+# Only the newest tickets are still open; older ones were completed long ago.
+OPEN_SHARE = 0.02
+UNREAD_SHARE = 0.01
+
+class Clock:
+    """created_at strings for row i of n, evenly spread from `days` ago to now."""
+
+    def __init__(self, n, days, now=None):
+        self.start = (now or time.time()) - days * 86400
+        self.step = days * 86400 / max(n, 1)
+        self._minute = None
+        self._prefix = ""
+
+    def __call__(self, i):
+        t = int(self.start + i * self.step)
+        minute = t // 60
+        if minute != self._minute:
+            self._minute = minute
+            self._prefix = time.strftime("%Y-%m-%d %H:%M", time.gmtime(t))
+        return f"{self._prefix}:{t % 60:02d}"
+
+def _skewed(rng, n):
+    # Older (lower id) patients have longer histories.
+    return int(n * rng.random() ** 2) + 1
+
+def _insert(conn, sql, rows, label, total):
+    started = time.perf_counter()
+    done = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK:
+            conn.executemany(sql, chunk)
+            done += len(chunk)
+            chunk.clear()
+            if done % (CHUNK * 20) == 0:
+                print(f"  {label}: {done:,}/{total:,}", file=sys.stderr)
+    if chunk:
+        conn.executemany(sql, chunk)
+        done += len(chunk)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} {done:>12,} rows {elapsed:8.1f} s {done / max(elapsed, 1e-9):>12,.0f} rows/s")
+    return done
+
+def _patients(rng, n, pw, clock):
+    for i in range(1, n + 1):
+        yield (
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"patient{i}", pw,
+            f"07{rng.randrange(10**8):08d}",
+            f"{rng.randint(1935, 2023)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            rng.choice(("Male", "Female")), clock(i),
+        )
+
+def _staff_plan(n):
+    """[(role, count)] for n staff, in the STAFF_ROLES proportions."""
+    counts = {role: max(1, round(n * share)) for role, (share, _) in STAFF_ROLES.items()}
+    counts["nurse"] = n - counts["doctor"] - counts["radiologist"]
+    return list(counts.items())
+
+def _staff(rng, plan, pw):
+    for role, count in plan:
+        categories = STAFF_ROLES[role][1]
+        for i in range(1, count + 1):
+            yield (
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", role, rng.choice(categories),
+                f"{role}{i}", pw, f"07{rng.randrange(10**8):08d}", int(rng.random() < 0.9),
+            )
+
+def _orders(rng, n, n_patients, doctors, clock):
+    for i in range(1, n + 1):
+        yield (
+            _skewed(rng, n_patients), rng.choice(doctors), rng.choice(ORDER_TYPES),
+            "Routine" if rng.random() < 0.7 else "Urgent",
+            "Pending" if i > n * (1 - OPEN_SHARE) else "Completed", clock(i),
+        )
+
+def _assignments(rng, n, n_patients, doctors, assignees, clock, out):
+    """Assignment rows; the notifications each one produced are appended to `out`."""
+    first_open = n * (1 - OPEN_SHARE)
+    first_unread = n * (1 - UNREAD_SHARE)
+    for i in range(1, n + 1):
+        role = "nurse" if rng.random() < 0.7 else "radiologist"
+        patient_id = _skewed(rng, n_patients)
+        doctor_id = rng.choice(doctors)
+        assignee_id = rng.choice(assignees[role])
+        task = rng.choice(TASKS[role])
+        status = rng.choice(("Assigned", "In Progress")) if i > first_open else "Completed"
+        created = clock(i)
+        is_read = int(i <= first_unread)
+        out["staff"].append((assignee_id, f"New assignment: {task} (Patient ID {patient_id})", is_read,
+                             created, f"assignment:{i}:created:staff:{assignee_id}"))
+        if status == "Completed":
+            out["staff"].append((doctor_id, f"Task '{task}' for patient #{patient_id} was completed.", is_read,
+                                 created, f"assignment:{i}:completed:staff:{doctor_id}"))
+            out["patient"].append((patient_id, f"Your task '{task}' has been completed.", is_read,
+                                   created, f"assignment:{i}:completed:patient:{patient_id}"))
+        yield (patient_id, doctor_id, assignee_id, task, "", status, created)
+
+def _report_text(rng):
+    text = rng.choice(REPORT_TEXT)
+    if rng.random() < FINDING_SHARE:
+        finding, = rng.choices([f for f, _ in FINDINGS], [w for _, w in FINDINGS])
+        text = f"{finding} {text}"
+    return text
+
+def _reports(rng, n, n_patients, authors, clock):
+    for i in range(1, n + 1):
+        role, author = rng.choice(authors)
+        yield (
+            _skewed(rng, n_patients), author, "Scan Result" if role == "radiologist" else "Report",
+            _report_text(rng), clock(i),
+        )
+
+def _drop_secondary(conn):
+    """Drop indexes and triggers (they are much cheaper to build once at the end)."""
+    rows = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ).fetchall()
+    for kind, name, _ in rows:
+        conn.execute(f"DROP {kind.upper()} {name}")
+    return rows
+
+def seed(path, patients, staff, orders, assignments, reports, days=365, password="password", rng_seed=1):
+    rng = random.Random(rng_seed)
+    conn = sqlite3.connect(path)
+    migrate.upgrade(conn)
+    conn.execute("PRAGMA journal_mode = OFF;")
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE;")
+    conn.execute("PRAGMA cache_size = -262144;")
+    secondary = _drop_secondary(conn)
+    started = time.perf_counter()
+    pw = hash_pw(password)
+
+    conn.execute(
+        "INSERT INTO staff (name, role, category, username, password_hash, is_available) VALUES (?,?,?,?,?,?)",
+        ("Administrator", "admin", "Management", "admin", hash_pw("admin123"), 1),
+    )
+    plan = _staff_plan(staff)
+    _insert(conn, "INSERT INTO staff (name, role, category, username, password_hash, phone, is_available) "
+                  "VALUES (?,?,?,?,?,?,?)", _staff(rng, plan, pw), "staff", staff)
+    ids = {}
+    for role, _ in plan:
+        ids[role] = [r[0] for r in conn.execute("SELECT id FROM staff WHERE role=? ORDER BY id", (role,))]
+
+    _insert(conn, "INSERT INTO patients (name, username, password_hash, phone, dob, gender, created_at) "
+                  "VALUES (?,?,?,?,?,?,?)", _patients(rng, patients, pw, Clock(patients, days)), "patients", patients)
+    _insert(conn, "INSERT INTO orders (patient_id, doctor_id, order_type, notes, status, created_at) "
+                  "VALUES (?,?,?,?,?,?)", _orders(rng, orders, patients, ids["doctor"], Clock(orders, days)),
+            "orders", orders)
+
+    # Notifications are produced alongside their assignment and flushed per chunk.
+    notes = {"staff": [], "patient": []}
+    rows = _assignments(rng, assignments, patients, ids["doctor"], ids, Clock(assignments, days), notes)
+    totals = {"staff": 0, "patient": 0}
+    notif_sql = {
+        "staff": "INSERT INTO notifications (staff_id, message, is_read, created_at, idempotency_key) VALUES (?,?,?,?,?)",
+        "patient": "INSERT INTO patient_notifications (patient_id, message, is_read, created_at, idempotency_key) "
+                   "VALUES (?,?,?,?,?)",
+    }
+
+    def flushing(rows):
+        for i, row in enumerate(rows, 1):
+            yield row
+            if i % CHUNK == 0:
+                for kind, pending in notes.items():
+                    conn.executemany(notif_sql[kind], pending)
+                    totals[kind] += len(pending)
+                    pending.clear()
+
+    _insert(conn, "INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type, notes, status, created_at) "
+                  "VALUES (?,?,?,?,?,?,?)", flushing(rows), "assignments", assignments)
+    for kind, pending in notes.items():
+        conn.executemany(notif_sql[kind], pending)
+        totals[kind] += len(pending)
+    conn.commit()
+    print(f"{'notifications':<22} {totals['staff']:>12,} rows")
+    print(f"{'patient notifications':<22} {totals['patient']:>12,} rows")
+
+    authors = [(role, i) for role in ("nurse", "radiologist") for i in ids[role]]
+    _insert(conn, "INSERT INTO reports (patient_id, created_by_staff_id, report_type, report_text, created_at) "
+                  "VALUES (?,?,?,?,?)", _reports(rng, reports, patients, authors, Clock(reports, days)),
+            "reports", reports)
+
+    built = time.perf_counter()
+    for kind, name, sql in secondary:
+        if kind == "index":
+            conn.execute(sql)
+    conn.execute("INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO reports_fts (reports_fts) VALUES ('rebuild')")
+    conn.execute("UPDATE reports_fts_backfill SET done_id = (SELECT COALESCE(MAX(id), 0) FROM reports), "
+                 "end_id = (SELECT COALESCE(MAX(id), 0) FROM reports)")
+    for kind, name, sql in secondary:
+        if kind == "trigger":
+            conn.execute(sql)
+    conn.commit()
+    counters.rebuild(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"{'indexes, FTS, counters':<22} {'':>12} {time.perf_counter() - built:8.1f} s")
+    conn.execute("PRAGMA locking_mode = NORMAL;")
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.close()
+    print(f"done in {time.perf_counter() - started:.1f} s: {path} ({os.path.getsize(path) / 2**20:,.0f} MiB)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", help="database file to create")
+    parser.add_argument("--size", choices=PRESETS, default="small")
+    parser.add_argument("--patients", type=int)
+    parser.add_argument("--staff", type=int)
+    parser.add_argument("--orders", type=int)
+    parser.add_argument("--assignments", type=int, help="each also adds its notifications")
+    parser.add_argument("--reports", type=int)
+    parser.add_argument("--days", type=int, default=365, help="history length")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--seed", type=int, default=1, help="random seed, for repeatable data")
+    parser.add_argument("--reset", action="store_true", help="overwrite an existing file")
+    args = parser.parse_args()
+
+    path = Path(args.db)
+    if path.exists():
+        if not args.reset:
+            parser.error(f"{path} exists (pass --reset to overwrite)")
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+    preset = dict(zip(("patients", "staff", "orders", "assignments", "reports"), PRESETS[args.size]))
+    counts = {k: getattr(args, k) if getattr(args, k) is not None else v for k, v in preset.items()}
+    if counts["staff"] < 3:
+        parser.error("--staff must be at least 3 (one per clinical role)")
+    seed(path, days=args.days, password=args.password, rng_seed=args.seed, **counts)
+
+if __name__ == "__main__":
+    main()
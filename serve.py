@@ -0,0 +1,384 @@
+"""Production server: preforked worker processes sharing one listening socket.
+
+    python serve.py --config /etc/hospital/hospital.cfg
+    HOSPITAL_SECRET_KEY=... python serve.py --workers 4 --bind 0.0.0.0:8000
+
+Settings are app.config keys. Each source overrides the one before it:
+- the defaults below,
+- the Flask config file named by --config or HOSPITAL_CONFIG,
+- HOSPITAL_<KEY> environment variables (values parse as JSON where they
+  can, e.g. HOSPITAL_SERVE_WORKERS=4),
+- the command line.
+
+The file may set any other app option too (DATABASE, UPLOAD_DIR,
+DB_POOL_SIZE, QUERY_CACHE_TTL, ...):
+
+    SECRET_KEY = "long random string"
+    DATABASE = "/srv/hospital/hospital.db"
+    UPLOAD_DIR = "/srv/hospital/uploads"
+    SERVE_BIND = "0.0.0.0:8000"
+    SERVE_WORKERS = 4
+
+Before forking, the master:
+- imports the app, which compiles every template,
+- builds the URL map,
+- runs the migrations,
+- binds the socket.
+It never keeps a database connection open, so nothing SQLite-owned crosses
+fork. Each worker then warms up before it accepts anything: it opens its
+pooled connections and renders each role's pages once, filling the
+statement, query and fragment caches. Workers that die are replaced.
+SIGTERM or Ctrl-C stops accepting, lets open requests finish for up to
+SERVE_GRACEFUL_SECONDS, and exits.
+
+SERVE_THREADS bounds the requests a worker runs at once. Live /events
+streams are not requests for long: once the first event is written, the
+connection goes to the worker's events.StreamHub, which serves up to
+SERVE_STREAMS of them from one thread. Open tabs never use up the slots
+that logins and page loads need. On shutdown the streams are closed and
+the browsers reconnect.
+
+Workers exchange cache invalidations and SSE notifications through
+peers.py. Scheduled jobs (archiving, backups, analytics) run in worker 0
+only. Login rate limits and /metrics are per worker.
+"""
+import argparse
+import gc
+import logging
+import os
+import shutil
+import resource
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+DEFAULTS = {
+    "SERVE_BIND": "127.0.0.1:8000",
+    "SERVE_WORKERS": os.cpu_count() or 1,
+    "SERVE_THREADS": 64,                 # requests one worker serves at once
+    "SERVE_STREAMS": 5000,               # open /events streams per worker, all served by one thread
+    "SERVE_BACKLOG": 1024,
+    "SERVE_KEEPALIVE_SECONDS": 5.0,      # idle keep-alive connections are closed after this
+    "SERVE_GRACEFUL_SECONDS": 10.0,      # on SIGTERM, wait this long for open requests
+    "SERVE_WARMUP": True,
+    "SERVE_ACCESS_LOG": True,
+}
+# Scheduled jobs belong to worker 0; the other workers run with these.
+PRIMARY_ONLY = {
+    "ARCHIVE_AFTER_DAYS": None,
+    "BACKUP_INTERVAL_SECONDS": None,
+    "ANALYTICS_INTERVAL_SECONDS": None,
+}
+DEV_SECRET_KEY = "CHANGE_ME_TO_A_RANDOM_SECRET_KEY"
+# Pages rendered once per role by the warmup; {patient} is a real patient id.
+WARMUP_PAGES = {
+    "admin": ["/admin"],
+    "doctor": ["/doctor", "/doctor/patient/{patient}", "/doctor/patient/{patient}/timeline"],
+    "nurse": ["/nurse"],
+    "radiologist": ["/radiologist"],
+    "patient": ["/patient", "/patient/timeline"],
+}
+RESPAWN_PAUSE_SECONDS = 1.0    # before replacing a worker that died young
+FD_RESERVE = 256               # open files per worker besides connections: database, uploads, logs
+
+log = logging.getLogger("serve")
+
+class RequestHandler(WSGIRequestHandler):
+    timeout = DEFAULTS["SERVE_KEEPALIVE_SECONDS"]
+
+    def make_environ(self):
+        environ = super().make_environ()
+        environ["hospital.detach_stream"] = self.detach_stream
+        return environ
+
+    def detach_stream(self, subscription):
+        """For /events: after this response the connection belongs to the StreamHub."""
+        if not self.server.hub.reserve():
+            return False
+        # Not chunked, so nothing marks the end of the body when the handler is done.
+        self.protocol_version = "HTTP/1.0"
+        self.server.detached[self.connection] = subscription
+        return True
+
+class WorkerServer(ThreadedWSGIServer):
+    """Werkzeug's threaded server, serving at most `threads` connections at once.
+
+    A worker at its limit stops accepting and leaves new connections in the
+    shared backlog for the other workers. Detached event streams go to
+    `hub` when their request is done and stop counting.
+    """
+
+    def __init__(self, host, port, app, threads, fd, hub):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.threads = threads
+        self.hub = hub
+        self.detached = {}    # connection -> subscription, until the request is done
+        self.active = 0
+        self.stopping = False
+        self._slots = threading.Condition()
+
+    def get_request(self):
+        with self._slots:
+            while self.active >= self.threads and not self.stopping:
+                self._slots.wait()
+            if self.stopping:
+                raise OSError("server is stopping")    # socketserver skips the accept
+            self.active += 1
+        try:
+            # Every worker wakes for a new connection; the losers get EAGAIN.
+            return super().get_request()
+        except BaseException:
+            self._done()
+            raise
+
+    def shutdown_request(self, request):
+        subscription = self.detached.pop(request, None)
+        try:
+            if subscription is not None:
+                self.hub.attach(request, subscription)
+            else:
+                super().shutdown_request(request)
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._slots:
+            self.active -= 1
+            self._slots.notify_all()
+
+    def stop(self, *_):
+        with self._slots:
+            self.stopping = True
+            self._slots.notify_all()
+        # shutdown() waits for serve_forever, which runs in the signalled thread.
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def drain(self, timeout):
+        with self._slots:
+            return self._slots.wait_for(lambda: self.active == 0, timeout)
+
+def configure(app, args):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    for key, value in (("SERVE_BIND", args.bind), ("SERVE_WORKERS", args.workers),
+                       ("SERVE_THREADS", args.threads)):
+        if value is not None:
+            app.config[key] = value
+    if args.no_warmup:
+        app.config["SERVE_WARMUP"] = False
+    if app.config["SERVE_WORKERS"] < 1 or app.config["SERVE_THREADS"] < 1:
+        raise ValueError("SERVE_WORKERS and SERVE_THREADS must be at least 1")
+    if app.config["SERVE_STREAMS"] < 0:
+        raise ValueError("SERVE_STREAMS must not be negative")
+    if app.secret_key in (None, "", DEV_SECRET_KEY):
+        raise ValueError("set SECRET_KEY in the config file or HOSPITAL_SECRET_KEY in the environment")
+
+def fit_open_files(config):
+    """Raise the open file limit to what a worker's requests and streams need,
+    or lower SERVE_STREAMS to fit under the hard limit."""
+    needed = config["SERVE_THREADS"] + config["SERVE_STREAMS"] + FD_RESERVE
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return
+    limit = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+    if limit < needed:
+        config["SERVE_STREAMS"] = max(0, limit - config["SERVE_THREADS"] - FD_RESERVE)
+        log.warning("open file limit is %d: SERVE_STREAMS lowered to %d", limit, config["SERVE_STREAMS"])
+
+def listen(bind, backlog):
+    host, _, port = bind.rpartition(":")
+    host = host.strip("[]") or "0.0.0.0"
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.listen(backlog)
+    # Shared by every worker: a worker that loses the race for a connection
+    # must get EAGAIN instead of blocking in accept().
+    sock.setblocking(False)
+    return sock, host
+
+def preload(app):
+    """Work done once in the master and shared with every worker by fork."""
+    import migrate
+    if app.config["DB_AUTO_MIGRATE"]:
+        migrate.upgrade_path(app.config["DATABASE"])
+    app.url_map.update()    # sorts and compiles the routing matcher
+    # Templates were compiled when app.py ran fragments.precompile. Keep all
+    # of it out of the collector's way so workers don't copy the pages it touches.
+    gc.collect()
+    gc.freeze()
+
+def warmup(app):
+    """Open the worker's pooled connections and render each role's pages once."""
+    import database
+    started = time.perf_counter()
+    pool = database.get_pool(app)
+    conns = [pool.acquire() for _ in range(pool.size)]
+    try:
+        for conn in conns:
+            conn.execute("SELECT COUNT(*) FROM sqlite_schema").fetchone()    # reads the schema
+        users = {}
+        for role in WARMUP_PAGES:
+            table, where = ("patients", "") if role == "patient" else ("staff", "WHERE role = ?")
+            row = conns[0].execute(f"SELECT id FROM {table} {where} ORDER BY id LIMIT 1",
+                                   () if role == "patient" else (role,)).fetchone()
+            if row is not None:
+                users[role] = row["id"]
+    finally:
+        for conn in conns:
+            pool.release(conn)
+    # The pool hands out its most recently used connection first, so live
+    # traffic starts on the one these pages ran on. Nobody is reading these
+    # records, so the audit log must not say so.
+    client = app.test_client()
+    pages = 0
+    audit_enabled, app.config["AUDIT_ENABLED"] = app.config["AUDIT_ENABLED"], False
+    for role, paths in WARMUP_PAGES.items():
+        if role not in users:
+            continue
+        with client.session_transaction() as sess:
+            sess.clear()
+            sess.update(role=role, user_id=users[role], username="warmup")
+        for path in paths:
+            if "{patient}" in path and "patient" not in users:
+                continue
+            resp = client.get(path.format(patient=users.get("patient")))
+            resp.close()
+            pages += 1
+            if resp.status_code != 200:
+                log.warning("warmup %s as %s: HTTP %d", path, role, resp.status_code)
+    app.config["AUDIT_ENABLED"] = audit_enabled
+    return len(conns), pages, (time.perf_counter() - started) * 1000
+
+def run_worker(app, sock, host, index, workers):
+    import audit
+    import database
+    import events
+    import passwords
+    import peers
+    config = app.config
+    if index > 0:
+        config.update(PRIMARY_ONLY)
+    peers.get_peers(app)    # receive other workers' invalidations before caching anything
+    if config["SERVE_WARMUP"]:
+        connections, pages, ms = warmup(app)
+        log.info("worker %d warm in %.0f ms (%d connections, %d pages)", index, ms, connections, pages)
+    if not config["SERVE_ACCESS_LOG"]:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    RequestHandler.timeout = config["SERVE_KEEPALIVE_SECONDS"]
+    hub = app.extensions["stream_hub"] = events.StreamHub(config["SERVE_STREAMS"])
+    server = WorkerServer(host, sock.getsockname()[1], app, config["SERVE_THREADS"], sock.fileno(), hub)
+    server.multiprocess = workers > 1
+    signal.signal(signal.SIGTERM, server.stop)
+    signal.signal(signal.SIGINT, server.stop)
+    server.serve_forever()
+    hub.close()    # browsers reconnect, to a worker that is still up
+    if not server.drain(config["SERVE_GRACEFUL_SECONDS"]):
+        log.warning("worker %d: %d requests still running after %ss", index, server.active,
+                    config["SERVE_GRACEFUL_SECONDS"])
+    audit.close(app)    # workers exit with os._exit, which skips atexit
+    database.get_pool(app).close()
+    passwords.shutdown()
+    peer = app.extensions.get("peers")
+    if peer is not None:
+        peer.close()
+
+class Master:
+    def __init__(self, app, sock, host):
+        self.app = app
+        self.sock = sock
+        self.host = host
+        self.workers = app.config["SERVE_WORKERS"]
+        self.children = {}    # pid -> (index, started)
+        self.running = True
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (index, time.monotonic())
+            return
+        code = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            run_worker(self.app, self.sock, self.host, index, self.workers)
+            code = 0
+        except BaseException:
+            log.exception("worker %d failed", index)
+        finally:
+            logging.shutdown()
+            os._exit(code)    # never unwind into the master's frames
+
+    def stop(self, signum, frame):
+        if self.running:
+            log.info("stopping %d workers", len(self.children))
+        self.running = False
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            if pid not in self.children:
+                continue
+            index, started = self.children.pop(pid)
+            if not self.running:
+                continue
+            log.warning("worker %d (pid %d) exited with status %d, replacing it",
+                        index, pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < RESPAWN_PAUSE_SECONDS:
+                time.sleep(RESPAWN_PAUSE_SECONDS)
+            self.spawn(index)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", help="Flask config file (default: $HOSPITAL_CONFIG)")
+    parser.add_argument("--bind", help="host:port (SERVE_BIND)")
+    parser.add_argument("--workers", type=int, help="worker processes (SERVE_WORKERS)")
+    parser.add_argument("--threads", type=int, help="connections per worker (SERVE_THREADS)")
+    parser.add_argument("--no-warmup", action="store_true", help="accept traffic without warming up")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(levelname)s %(message)s")
+
+    if args.config:
+        os.environ["HOSPITAL_CONFIG"] = os.path.abspath(args.config)
+    from app import app    # compiles every template
+    try:
+        configure(app, args)
+    except ValueError as e:
+        parser.error(str(e))
+    config = app.config
+    peers_dir = None
+    if config["SERVE_WORKERS"] > 1 and not config.get("PEERS_DIR"):
+        peers_dir = config["PEERS_DIR"] = tempfile.mkdtemp(prefix="hospital-peers-")
+    preload(app)
+    fit_open_files(config)
+    sock, host = listen(config["SERVE_BIND"], config["SERVE_BACKLOG"])
+    log.info("listening on %s with %d workers x %d threads, %d streams (database %s)", config["SERVE_BIND"],
+             config["SERVE_WORKERS"], config["SERVE_THREADS"], config["SERVE_STREAMS"], config["DATABASE"])
+    try:
+        Master(app, sock, host).run()
+    finally:
+        sock.close()
+        if peers_dir:
+            shutil.rmtree(peers_dir, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+// Patient typeahead: fills the <select> next to each [data-patient-search]
+// input from the JSON search endpoint instead of embedding every patient.
+(function () {
+  function bind(input) {
+    const select = input.nextElementSibling;
+    let timer = null;
+    let seq = 0;
+
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(async function () {
+        const q = input.value.trim();
+        const mine = ++seq;
+        if (!q) return;
+        const resp = await fetch(input.dataset.patientSearch + '?q=' + encodeURIComponent(q));
+        if (!resp.ok || mine !== seq) return;
+        const data = await resp.json();
+        select.innerHTML = '';
+        if (!data.results.length) {
+          select.add(new Option('-- No matching patients --', ''));
+          return;
+        }
+        for (const p of data.results) {
+          select.add(new Option(p.name + ' (ID: ' + p.id + (p.phone ? ', ' + p.phone : '') + ')', p.id));
+        }
+      }, 150);
+    });
+  }
+
+  document.querySelectorAll('[data-patient-search]').forEach(bind);
+})();
@@ -0,0 +1,31 @@
+"""One app on a throwaway database for the whole test run.
+
+app.py reads HOSPITAL_DB when it is imported, so it is set here, before any
+test imports the app.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["HOSPITAL_DB"] = os.path.join(_tmp.name, "hospital.db")
+os.environ["HOSPITAL_UPLOAD_DIR"] = os.path.join(_tmp.name, "uploads")
+
+@pytest.fixture(scope="session")
+def hospital():
+    """The app module, with background dispatch and login limits off."""
+    import app as hospital
+    hospital.app.config.update(TESTING=True, OUTBOX_DISPATCHER=False, LOGIN_RATE_LIMIT_ENABLED=False)
+    pool = hospital.database.get_pool(hospital.app)    # creates and migrates the database
+    pool.release(pool.acquire())    # and puts it in WAL mode, as the first request would
+    return hospital
+
+@pytest.fixture
+def app(hospital):
+    return hospital.app
@@ -0,0 +1,36 @@
+"""Turnaround rollups are rebuilt from the transition history alone."""
+import sqlite3
+
+import analytics
+
+def test_rebuild_after_assignment_and_staff_are_gone(app):
+    conn = sqlite3.connect(app.config["DATABASE"], isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN")
+        doctor = conn.execute("INSERT INTO staff (name, role, username, password_hash) "
+                              "VALUES ('Dr', 'doctor', 'analytics-dr', 'x')").lastrowid
+        nurse = conn.execute("INSERT INTO staff (name, role, category, username, password_hash) "
+                             "VALUES ('N', 'nurse', 'ICU Nurse', 'analytics-nurse', 'x')").lastrowid
+        patient = conn.execute("INSERT INTO patients (name, username, password_hash) "
+                               "VALUES ('P', 'analytics-patient', 'x')").lastrowid
+        assignment = conn.execute(
+            "INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type, created_at) "
+            "VALUES (?, ?, ?, 'Analytics Scan', datetime('now', '-1 hour'))",
+            (patient, doctor, nurse)).lastrowid
+        analytics.record(conn, assignment, nurse, "Assigned", "In Progress")
+        analytics.record(conn, assignment, nurse, "In Progress", "Completed")
+        # As if archive.py moved the assignment out and the nurse then left.
+        conn.execute("DELETE FROM assignments WHERE id = ?", (assignment,))
+        conn.execute("DELETE FROM staff WHERE id = ?", (nurse,))
+        conn.execute("COMMIT")
+
+        analytics.rebuild(conn)
+        by_task = {g["key"]: g for g in analytics.stats_by(conn, "task_type")}
+        by_category = {g["key"]: g for g in analytics.stats_by(conn, "category")}
+    finally:
+        conn.close()
+    scan = by_task["Analytics Scan"]
+    assert scan["start"]["count"] == 1 and scan["complete"]["count"] == 1
+    assert 3000 < scan["complete"]["p50_seconds"] < 4500
+    assert by_category["ICU Nurse"]["complete"]["count"] == 1
@@ -0,0 +1,61 @@
+"""Deleting a patient or staff member also deletes their archived rows."""
+import sqlite3
+
+import archive
+
+def archived(directory, table, where, params):
+    total = 0
+    for path in directory.glob("*.db"):
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+                total += conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params).fetchone()[0]
+        finally:
+            conn.close()
+    return total
+
+def test_admin_delete_purges_archive(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "ARCHIVE_DIR", str(tmp_path))
+    conn = sqlite3.connect(app.config["DATABASE"], isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN")
+        doctor = conn.execute("INSERT INTO staff (name, role, username, password_hash) "
+                              "VALUES ('Dr', 'doctor', 'archive-dr', 'x')").lastrowid
+        nurse = conn.execute("INSERT INTO staff (name, role, username, password_hash) "
+                             "VALUES ('N', 'nurse', 'archive-nurse', 'x')").lastrowid
+        patient = conn.execute("INSERT INTO patients (name, username, password_hash) "
+                               "VALUES ('P', 'archive-patient', 'x')").lastrowid
+        conn.execute("INSERT INTO assignments (patient_id, doctor_id, assignee_staff_id, task_type, status, "
+                     "created_at) VALUES (?, ?, ?, 'X-Ray', 'Completed', '2020-01-15 10:00:00')",
+                     (patient, doctor, nurse))
+        conn.execute("INSERT INTO patient_notifications (patient_id, message, is_read, created_at) "
+                     "VALUES (?, 'done', 1, '2020-01-15 11:00:00')", (patient,))
+        conn.execute("INSERT INTO notifications (staff_id, message, is_read, created_at) "
+                     "VALUES (?, 'new task', 1, '2020-02-03 09:00:00')", (nurse,))
+        conn.execute("COMMIT")
+        archive.run(conn, tmp_path, days=30, pause=0)
+    finally:
+        conn.close()
+    assert archived(tmp_path, "assignments", "patient_id = ?", (patient,)) == 1
+    assert archived(tmp_path, "patient_notifications", "patient_id = ?", (patient,)) == 1
+    assert archived(tmp_path, "notifications", "staff_id = ?", (nurse,)) == 1
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["role"] = "admin"
+    client.post(f"/admin/patient/delete/{patient}")
+    assert archived(tmp_path, "assignments", "patient_id = ?", (patient,)) == 0
+    assert archived(tmp_path, "patient_notifications", "patient_id = ?", (patient,)) == 0
+    assert archived(tmp_path, "notifications", "staff_id = ?", (nurse,)) == 1
+
+    client.post(f"/admin/staff/delete/{nurse}")
+    assert archived(tmp_path, "notifications", "staff_id = ?", (nurse,)) == 0
+
+    conn = sqlite3.connect(app.config["DATABASE"])
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM archive_purge").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM archive_index WHERE owner_id IN (?, ?)",
+                            (patient, nurse)).fetchone()[0] == 0
+    finally:
+        conn.close()
@@ -0,0 +1,15 @@
+"""/metrics is closed unless a token or an allowed address is configured."""
+
+def test_loopback_is_not_trusted_by_default(app):
+    assert app.test_client().get("/metrics").status_code == 403
+
+def test_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "s3cret")
+    client = app.test_client()
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    resp = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert resp.status_code == 200 and b"# TYPE" in resp.data
+
+def test_allowed_address(app, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_ALLOW", ("127.0.0.1",))
+    assert app.test_client().get("/metrics").status_code == 200
@@ -0,0 +1,58 @@
+"""Outbox dispatch: one bad event must not hold up the rest of its batch."""
+import pytest
+
+import database
+import outbox
+
+@pytest.fixture
+def conn(app):
+    pool = database.get_pool(app)
+    conn = pool.acquire()
+    yield conn
+    pool.release(conn)
+
+def add_nurse(conn, username):
+    with conn:
+        return conn.execute(
+            "INSERT INTO staff (name, role, username, password_hash) VALUES (?, 'nurse', ?, 'x')",
+            (username, username),
+        ).lastrowid
+
+def created(key, nurse):
+    return (key, "assignment.created",
+            {"assignee_staff_id": nurse, "task_type": "ECG", "patient_id": 1})
+
+def status(conn, key):
+    return tuple(conn.execute(
+        "SELECT status, last_error FROM outbox WHERE idempotency_key = ?", (key,)).fetchone())
+
+def test_deleted_recipient_does_not_block_batch(app, conn):
+    kept, gone = add_nurse(conn, "outbox-kept"), add_nurse(conn, "outbox-gone")
+    with conn:
+        outbox.enqueue(conn, *created("t-kept", kept))
+        outbox.enqueue(conn, *created("t-gone", gone))
+        conn.execute("DELETE FROM staff WHERE id = ?", (gone,))
+
+    assert outbox.dispatch_pending(app, conn) == 2
+    assert status(conn, "t-kept") == ("done", None)
+    assert status(conn, "t-gone") == ("done", None)
+    assert conn.execute(
+        "SELECT COUNT(*) FROM notifications WHERE staff_id = ? AND idempotency_key LIKE 't-kept:%'",
+        (kept,)).fetchone()[0] == 1
+
+def test_failed_write_goes_dead(app, conn, monkeypatch):
+    nurse = add_nurse(conn, "outbox-dead")
+    monkeypatch.setitem(app.config, "OUTBOX_MAX_ATTEMPTS", 2)
+    with conn:
+        outbox.enqueue(conn, "t-bad", "assignment.created", {"task_type": "ECG"})
+        outbox.enqueue(conn, *created("t-good", nurse))
+
+    assert outbox.dispatch_pending(app, conn) == 2
+    assert status(conn, "t-good") == ("done", None)
+    assert status(conn, "t-bad")[0] == "pending"
+
+    with conn:
+        conn.execute("UPDATE outbox SET next_attempt_at = 0 WHERE idempotency_key = 't-bad'")
+    assert outbox.dispatch_pending(app, conn) == 1
+    state, error = status(conn, "t-bad")
+    assert state == "dead" and error.startswith("notifications:")
@@ -0,0 +1,19 @@
+"""Every query the dashboards, history pages and API run must use an index."""
+import sqlite3
+import sys
+
+from conftest import ROOT
+
+def test_no_full_scans(app):
+    sys.path.insert(0, str(ROOT / "benchmarks"))
+    import query_plans    # after the app: it would point HOSPITAL_DB elsewhere
+    conn = sqlite3.connect(app.config["DATABASE"])
+    try:
+        bad = {}
+        for page, sql in query_plans.capture_queries():
+            plan, problems = query_plans.problems(conn, sql)
+            if problems:
+                bad[" ".join(sql.split())] = (page, problems)
+    finally:
+        conn.close()
+    assert bad == {}, "\n".join(f"{page}: {sql}\n    {problems}" for sql, (page, problems) in bad.items())
@@ -0,0 +1,97 @@
+"""Background thumbnail / preview generation for image blobs.
+
+Pillow is optional: without it nothing is generated and pages keep linking
+to the original files. Backfill existing uploads with:
+
+    python thumbnails.py [hospital.db] [uploads_dir]
+"""
+import logging
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # optional dependency
+    Image = None
+
+APP_DIR = Path(__file__).parent
+THUMB_SIZES = {"thumb": 256, "preview": 1024}
+IMAGE_MIME_TYPES = ("image/png", "image/jpeg", "image/webp")
+
+log = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def enabled() -> bool:
+    return Image is not None
+
+def thumb_path(sha256: str, size: int) -> str:
+    # Relative to UPLOAD_DIR, next to the sharded originals.
+    return f"thumbs/{sha256[:2]}/{sha256[2:4]}/{sha256}_{size}.webp"
+
+def generate(upload_dir, sha256, rel_path) -> bool:
+    upload_dir = Path(upload_dir)
+    with Image.open(upload_dir / rel_path) as img:
+        img.draft("RGB", (max(THUMB_SIZES.values()),) * 2)  # cheap JPEG downscale on decode
+        img = img.convert("RGB")
+        for size in sorted(THUMB_SIZES.values(), reverse=True):
+            target = upload_dir / thumb_path(sha256, size)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            img.thumbnail((size, size))
+            tmp = target.with_suffix(".tmp")
+            img.save(tmp, "WEBP", quality=80, method=4)
+            tmp.replace(target)
+    return True
+
+def _run(upload_dir, sha256, rel_path, on_done):
+    try:
+        generate(upload_dir, sha256, rel_path)
+    except Exception:  # a corrupt upload must not kill the worker
+        log.exception("thumbnail failed for %s", sha256)
+        return
+    on_done(sha256)
+
+def submit(upload_dir, sha256, rel_path, mime_type, on_done):
+    """Queue thumbnail generation; on_done(sha256) runs on the worker thread."""
+    if not enabled() or mime_type not in IMAGE_MIME_TYPES:
+        return None
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbs")
+    return _executor.submit(_run, upload_dir, sha256, rel_path, on_done)
+
+def backfill(conn, upload_dir):
+    done = 0
+    rows = conn.execute(
+        f"SELECT sha256, path FROM blobs WHERE has_thumbnail=0 AND mime_type IN ({','.join('?' * len(IMAGE_MIME_TYPES))})",
+        IMAGE_MIME_TYPES,
+    ).fetchall()
+    for sha256, rel_path in rows:
+        try:
+            generate(upload_dir, sha256, rel_path)
+        except Exception:
+            log.exception("thumbnail failed for %s", sha256)
+            continue
+        conn.execute("UPDATE blobs SET has_thumbnail=1 WHERE sha256=?", (sha256,))
+        conn.commit()
+        done += 1
+    return done
+
+def main(argv):
+    if not enabled():
+        print("Pillow is not installed: pip install Pillow")
+        return 1
+    db_path = argv[1] if len(argv) > 1 else str(APP_DIR / "hospital.db")
+    upload_dir = argv[2] if len(argv) > 2 else str(APP_DIR / "uploads")
+    conn = sqlite3.connect(db_path)
+    print(f"✅ generated thumbnails for {backfill(conn, upload_dir)} blobs")
+    conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,116 @@
+"""A patient's orders, assignments and reports as one chronological stream.
+
+One UNION ALL over the three tables, newest first by (created_at, id,
+kind), read in keyset chunks of CHUNK rows. Each arm reads its
+(patient_id, created_at) index in order (migration 0010) and SQLite merges
+them without sorting. A pool connection is held only while a chunk is
+fetched, so neither a long history nor a slow client costs memory or a
+connection. Assignments moved to the archive (archive.py) are merged in
+month by month.
+"""
+import heapq
+import archive
+from pagination import FIRST_CURSOR
+
+CHUNK = 200
+FIRST_KEY = ("9999-12-31 23:59:59", FIRST_CURSOR, "~")    # sorts after every real row
+
+# Every arm yields the same columns; `{op}` is the keyset comparison.
+ORDERS = """
+    SELECT 'order' AS kind, o.id AS id, o.created_at AS created_at, o.order_type AS title, o.notes AS detail, o.status,
+           d.name AS actor_name, d.role AS actor_role,
+           NULL AS image_filename, NULL AS blob_sha256, 0 AS has_thumbnail
+    FROM orders o
+    JOIN staff d ON d.id = o.doctor_id
+    WHERE o.patient_id = ? AND o.created_at <= ? AND (o.created_at, o.id) {op} (?, ?)
+"""
+
+ASSIGNMENTS_FROM = """
+    SELECT 'assignment' AS kind, a.id AS id, a.created_at AS created_at, a.task_type AS title, a.notes AS detail, a.status,
+           s.name AS actor_name, s.role AS actor_role,
+           NULL AS image_filename, NULL AS blob_sha256, 0 AS has_thumbnail
+    FROM {table} a
+    JOIN staff s ON s.id = a.assignee_staff_id
+    WHERE a.patient_id = ? AND a.created_at <= ? AND (a.created_at, a.id) {op} (?, ?)
+"""
+
+REPORTS = """
+    SELECT 'report' AS kind, r.id AS id, r.created_at AS created_at, r.report_type AS title, r.report_text AS detail, NULL AS status,
+           s.name AS actor_name, s.role AS actor_role,
+           r.image_filename, r.blob_sha256, COALESCE(b.has_thumbnail, 0) AS has_thumbnail
+    FROM reports r
+    JOIN staff s ON s.id = r.created_by_staff_id
+    LEFT JOIN blobs b ON b.sha256 = r.blob_sha256
+    WHERE r.patient_id = ? AND r.created_at <= ? AND (r.created_at, r.id) {op} (?, ?)
+"""
+
+ARMS = (("order", ORDERS), ("assignment", ASSIGNMENTS_FROM.replace("{table}", "assignments")), ("report", REPORTS))
+
+def _statement(last_kind):
+    # Rows after (ts, id, last_kind) in (created_at, id, kind) DESC order:
+    # an arm whose kind sorts below last_kind may repeat the same (ts, id).
+    arms = [sql.format(op="<=" if kind < last_kind else "<") for kind, sql in ARMS]
+    return "\n    UNION ALL\n".join(arms) + "    ORDER BY created_at DESC, id DESC, kind DESC\n    LIMIT ?"
+
+STATEMENTS = {kind: _statement(kind) for kind in ("assignment", "order", "report", FIRST_KEY[2])}
+
+ARCHIVED = ASSIGNMENTS_FROM.replace("{op}", "<") + """    ORDER BY a.created_at DESC, a.id DESC
+    LIMIT ?
+"""
+
+def sort_key(row):
+    return (row["created_at"], row["id"], row["kind"])
+
+def _chunks(acquire, release, run):
+    # Yield rows of run(conn, key) chunk by chunk, a connection per chunk.
+    key = FIRST_KEY
+    while True:
+        conn = acquire()
+        try:
+            rows = run(conn, key)
+        finally:
+            release(conn)
+        yield from rows
+        if len(rows) < CHUNK:
+            return
+        key = sort_key(rows[-1])
+
+def iter_main(acquire, release, patient_id):
+    def run(conn, key):
+        created_at, row_id, kind = key
+        return conn.execute(STATEMENTS[kind], (*(patient_id, created_at, created_at, row_id) * len(ARMS),
+                                               CHUNK)).fetchall()
+    return _chunks(acquire, release, run)
+
+def iter_archived(acquire, release, directory, patient_id):
+    """The patient's archived assignments, newest month first."""
+    conn = acquire()
+    try:
+        months = sorted((m for (m,) in conn.execute("""
+            SELECT m.month FROM archive_index i
+            JOIN archive_months m ON m.tbl = i.tbl
+            WHERE i.tbl = 'assignments' AND i.owner_id = ? AND m.min_id <= i.max_id AND m.max_id >= i.min_id
+        """, (patient_id,))), reverse=True)
+    finally:
+        release(conn)
+    for month in months:
+        def run(conn, key, month=month):
+            schema = archive.attach(conn, directory, month)
+            if schema is None:
+                return []
+            created_at, row_id, _ = key
+            return conn.execute(ARCHIVED.format(table=f"{schema}.assignments"),
+                                (patient_id, created_at, created_at, row_id, CHUNK)).fetchall()
+        yield from _chunks(acquire, release, run)
+
+def iter_timeline(acquire, release, patient_id, archive_directory=None):
+    """Yield the patient's timeline rows newest first, at most CHUNK rows per stream in memory."""
+    streams = [iter_main(acquire, release, patient_id)]
+    if archive_directory is not None:
+        streams.append(iter_archived(acquire, release, archive_directory, patient_id))
+    previous = None
+    for row in heapq.merge(*streams, key=sort_key, reverse=True):
+        key = sort_key(row)
+        if key != previous:    # a row caught mid-archive is in both streams
+            yield row
+        previous = key
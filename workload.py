@@ -0,0 +1,207 @@
+import heapq
+import threading
+import time
+import peers
+
+OPEN_STATUSES = ("Assigned", "In Progress")
+ASSIGNABLE_ROLES = ("nurse", "radiologist")
+# Other workers' changes arrive through peers, but a dropped message or a
+# write from outside the app leaves the counts off; reload this often.
+REFRESH_SECONDS = 60.0
+
+class NoAssignee(LookupError):
+    pass
+
+class WorkloadIndex:
+    """Open ticket counts per nurse/radiologist, for least-loaded assignment.
+
+    Staff are grouped by (role, category) and by (role, None) for "any
+    category". Each group is a min-heap of (open, staff_id, version); changes
+    push a fresh entry and bump the staff member's version, and stale
+    entries are skipped when they reach the top, so pick() and every update
+    are O(log n).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._staff = {}     # staff_id -> [role, category, available, open, version]
+        self._heaps = {}     # (role, category or None) -> heap
+        self._entries = 0    # heap entries, live and stale
+        self.loaded_at = 0.0
+        self.on_change = None    # called with each change, e.g. to tell other processes
+
+    def load(self, conn):
+        # staff_counters.open_assignments is kept by triggers (migration 0008).
+        rows = conn.execute(f"""
+            SELECT s.id, s.role, s.category, s.is_available, COALESCE(c.open_assignments, 0) AS open
+            FROM staff s LEFT JOIN staff_counters c ON c.staff_id = s.id
+            WHERE s.role IN {ASSIGNABLE_ROLES!r}
+        """).fetchall()
+        with self._lock:
+            self._staff = {}
+            self._heaps = {}
+            self._entries = 0
+            for staff_id, role, category, available, open_count in rows:
+                self._staff[staff_id] = [role, category or "General", bool(available), open_count, 0]
+                self._push(staff_id)
+            self.loaded_at = time.monotonic()
+
+    def _push(self, staff_id):
+        role, category, available, open_count, version = self._staff[staff_id]
+        if not available:
+            return
+        for group in ((role, category), (role, None)):
+            heap = self._heaps.setdefault(group, [])
+            heapq.heappush(heap, (open_count, staff_id, version))
+            self._entries += 1
+
+    def _update(self, staff_id, **changes):
+        entry = self._staff.get(staff_id)
+        if entry is None:
+            return
+        if "available" in changes:
+            entry[2] = changes["available"]
+        if "delta" in changes:
+            entry[3] = max(0, entry[3] + changes["delta"])
+        entry[4] += 1
+        self._push(staff_id)
+
+    def _top(self, group):
+        heap = self._heaps.get(group)
+        while heap:
+            open_count, staff_id, version = heap[0]
+            entry = self._staff.get(staff_id)
+            if entry is not None and entry[2] and entry[4] == version:
+                return staff_id
+            heapq.heappop(heap)
+            self._entries -= 1
+        return None
+
+    def pick(self, role, category=None):
+        """Reserve the least-loaded available staff member; returns their id.
+
+        The reservation counts as one open ticket; call release() if the
+        ticket is not created after all.
+        """
+        with self._lock:
+            staff_id = self._top((role, category or None))
+            if staff_id is None:
+                raise NoAssignee(f"no available {role}" + (f" ({category})" if category else ""))
+            self._update(staff_id, delta=1)
+        # Before the ticket is written, so other workers stop picking them too.
+        self._changed("opened", staff_id, 1)
+        return staff_id
+
+    def release(self, staff_id):
+        self.opened(staff_id, -1)
+
+    def opened(self, staff_id, n=1):
+        with self._lock:
+            self._update(staff_id, delta=n)
+        self._changed("opened", staff_id, n)
+
+    def status_changed(self, staff_id, old_status, new_status):
+        was_open, is_open = old_status in OPEN_STATUSES, new_status in OPEN_STATUSES
+        if was_open != is_open:
+            self.opened(staff_id, 1 if is_open else -1)
+
+    def set_available(self, staff_id, available):
+        with self._lock:
+            self._update(staff_id, available=bool(available))
+        self._changed("available", staff_id, bool(available))
+
+    def add_staff(self, staff_id, role, category, available):
+        if role not in ASSIGNABLE_ROLES:
+            return
+        with self._lock:
+            self._add(staff_id, role, category, available)
+        self._changed("add", staff_id, role, category, bool(available))
+
+    def _add(self, staff_id, role, category, available):
+        self._staff[staff_id] = [role, category or "General", bool(available), 0, 0]
+        self._push(staff_id)
+
+    def _changed(self, *change):
+        if self.on_change is not None:
+            self.on_change(list(change))
+
+    def apply(self, change):
+        """Make a change that another process's index passed to on_change."""
+        op, staff_id, *args = change
+        with self._lock:
+            if op == "opened":
+                self._update(staff_id, delta=args[0])
+            elif op == "available":
+                self._update(staff_id, available=args[0])
+            elif op == "add" and args[0] in ASSIGNABLE_ROLES:
+                self._add(staff_id, *args)
+
+    def groups(self):
+        """[(role, category)] that currently have available staff."""
+        with self._lock:
+            return sorted({(e[0], e[1]) for e in self._staff.values() if e[2]})
+
+    def stats(self):
+        """Queue depth per role and category."""
+        out = {}
+        with self._lock:
+            for role, category, available, open_count, _ in self._staff.values():
+                group = out.setdefault(f"{role}:{category}", {
+                    "staff": 0, "available": 0, "open_tickets": 0, "max_open": 0, "min_open_available": None,
+                })
+                group["staff"] += 1
+                group["open_tickets"] += open_count
+                group["max_open"] = max(group["max_open"], open_count)
+                if available:
+                    group["available"] += 1
+                    low = group["min_open_available"]
+                    group["min_open_available"] = open_count if low is None else min(low, open_count)
+            heap_entries = self._entries
+        return {"groups": out, "heap_entries": heap_entries}
+
+    def compact(self):
+        # Stale entries are only dropped lazily; rebuild once they dominate.
+        with self._lock:
+            if self._entries > 4 * len(self._staff) + 64:
+                self._heaps = {}
+                self._entries = 0
+                for staff_id in self._staff:
+                    self._push(staff_id)
+
+_lock = threading.Lock()
+
+def get_index(app, conn):
+    """The app's index, (re)loaded from `conn` when missing or stale."""
+    index = app.extensions.get("workload")
+    if index is None or time.monotonic() - index.loaded_at > REFRESH_SECONDS:
+        with _lock:
+            index = app.extensions.get("workload")
+            if index is None or time.monotonic() - index.loaded_at > REFRESH_SECONDS:
+                index = WorkloadIndex()
+                index.load(conn)
+                if app.config.get("PEERS_DIR"):
+                    # Every worker's index counts every worker's picks; otherwise
+                    # a burst spread over the workers lands on one person.
+                    index.on_change = lambda change: peers.send(app, "workload", change)
+                    peers.on(app, "workload", lambda change: _peer_change(app, change))
+                app.extensions["workload"] = index
+    index.compact()
+    return index
+
+def loaded(app):
+    """The index if already built. Post-commit updates go through this: an
+    index loaded after the commit already includes the change."""
+    return app.extensions.get("workload")
+
+def reset(app):
+    # For bulk changes (deletes, imports): rebuilt on next use, in every worker.
+    app.extensions.pop("workload", None)
+    peers.send(app, "workload", ["reset"])
+
+def _peer_change(app, change):
+    if change[0] == "reset":
+        app.extensions.pop("workload", None)
+        return
+    index = loaded(app)
+    if index is not None:
+        index.apply(change)
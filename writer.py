@@ -0,0 +1,148 @@
+"""Group commit for small, frequent writes.
+
+Request threads hand a write to the single writer thread and wait. While one
+commit is in flight the next writes queue up, and the writer takes all of
+them (up to WRITER_MAX_BATCH) as the next batch. It runs each write in its
+own savepoint inside one transaction and commits once, so N concurrent
+mark-read clicks cost one commit (and one fsync) instead of N. A caller
+returns only after the commit that includes its write.
+"""
+import queue
+import threading
+import time
+import database
+
+DEFAULTS = {
+    "WRITER_ENABLED": True,
+    "WRITER_MAX_BATCH": 256,
+    # Extra wait for company when busy; worth raising only where fsync is slow.
+    "WRITER_MAX_DELAY_MS": 0.0,
+    # The writer commits rarely enough to afford an fsync per commit.
+    "WRITER_SYNCHRONOUS": "FULL",
+    "WRITER_TIMEOUT": 10.0,
+}
+
+class _Pending:
+    __slots__ = ("op", "done", "result", "error")
+
+    def __init__(self, op):
+        self.op = op
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class GroupCommitWriter:
+    def __init__(self, connect, max_batch=256, max_delay_ms=0.0, synchronous="FULL"):
+        self._connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.synchronous = synchronous
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.largest_batch = 0
+        self._last_batch = 0
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, op, timeout=10.0):
+        """Run op(conn) in the next group commit; returns its result once committed."""
+        pending = _Pending(op)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("write not committed in time")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Linger for company only under load; a lone write commits at once.
+        delay = self.max_delay if self._last_batch > 1 else 0.0
+        deadline = time.monotonic() + delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        conn.isolation_level = None    # explicit BEGIN/COMMIT below
+        conn.execute(f"PRAGMA synchronous = {self.synchronous};")
+        while True:
+            batch = self._collect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for pending in batch:
+                    # A failing write rolls back alone; the rest still commit.
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        pending.result = pending.op(conn)
+                    except Exception as e:
+                        pending.error = e
+                        conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                for pending in batch:
+                    pending.error = pending.error or e
+            self._last_batch = len(batch)
+            with self._lock:
+                self.batches += 1
+                self.writes += len(batch)
+                self.failed += sum(1 for p in batch if p.error is not None)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            for pending in batch:
+                pending.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "writes": self.writes,
+                "failed": self.failed,
+                "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "queued": self._queue.qsize(),
+            }
+
+_lock = threading.Lock()
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+
+def get_writer(app):
+    writer = app.extensions.get("writer")
+    if writer is None:
+        with _lock:
+            writer = app.extensions.get("writer")
+            if writer is None:
+                writer = GroupCommitWriter(
+                    database.get_pool(app).connect,
+                    max_batch=app.config["WRITER_MAX_BATCH"],
+                    max_delay_ms=app.config["WRITER_MAX_DELAY_MS"],
+                    synchronous=app.config["WRITER_SYNCHRONOUS"],
+                )
+                app.extensions["writer"] = writer
+    return writer
+
+def write(app, op):
+    """Run op(conn) through the group-commit writer (or directly if disabled)."""
+    if not app.config["WRITER_ENABLED"]:
+        conn = database.get_db()
+        result = op(conn)
+        conn.commit()
+        return result
+    return get_writer(app).submit(op, app.config["WRITER_TIMEOUT"])
+
+def execute(app, sql, params=()):
+    """Single-statement write; returns the affected row count."""
+    return write(app, lambda conn: conn.execute(sql, params).rowcount)